@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+书源之「缓存」
+
+Author: ddmoyu
+Email: daydaymoyu@gmail.com
+Date: 2026-10-18
+"""
+import asyncio
+import dataclasses
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Set, Tuple, Union
+
+from .legado_entities import (BookSourceEntity, RuleBookInfoEntity, RuleContentEntity, RuleExploreEntity,
+                              RuleSearchEntity, RuleTocEntity)
+from .legado_http import HttpError, Request, Response, Transport, get_transport, parse_headers
+
+# 各类请求的缓存时间（秒），None 表示永不过期，不在表中的请求不缓存
+DEFAULT_TTLS: Dict[str, Optional[float]] = {
+    "search": 5 * 60.0,
+    "explore": 30 * 60.0,
+    "book_info": 60 * 60.0,
+    "toc": 10 * 60.0,
+    # 章节正文发布后基本不再变化
+    "content": None,
+}
+# 内存缓存的容量（字节）
+DEFAULT_MEMORY_BYTES = 64 * 1024 * 1024
+# 磁盘缓存的容量（字节）
+DEFAULT_DISK_BYTES = 1024 * 1024 * 1024
+# 解析结果缓存最多保留的结果数
+DEFAULT_RESULT_ENTRIES = 4096
+
+# 每个条目除内容与响应头之外的估计开销（字节）
+_ENTRY_OVERHEAD = 128
+# 结果可能依赖变量或外部状态的规则
+_IMPURE = re.compile(r"@put|@get|\{\{|<js>|@js:|java\.", re.IGNORECASE)
+
+RuleEntity = Union[RuleBookInfoEntity, RuleContentEntity, RuleExploreEntity, RuleSearchEntity, RuleTocEntity]
+ResultKey = Tuple[str, str, str, bytes]
+
+
+@dataclass(slots=True)
+class CacheEntry:
+    url: str
+    status: int
+    headers: Dict[str, str]
+    content: bytes
+    charset: Optional[str]
+    stored_at: float
+    expires_at: Optional[float]
+
+    @property
+    def size(self) -> int:
+        return len(self.content) + sum(len(name) + len(value) for name, value in self.headers.items()) \
+            + _ENTRY_OVERHEAD
+
+    def fresh(self, now: float) -> bool:
+        return self.expires_at is None or now < self.expires_at
+
+    def response(self) -> Response:
+        return Response(self.url, self.status, self.headers, self.content, self.charset)
+
+
+class CacheBackend:
+    """
+    缓存存储的基类
+
+    blocking 为 True 的存储在线程池中访问，避免磁盘读写阻塞事件循环。
+    """
+    blocking = False
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryCache(CacheBackend):
+    """
+    进程内缓存，按最近使用淘汰，总大小不超过 max_bytes
+
+    参数:
+        max_bytes: 容量（字节），单个条目超过容量时不缓存
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        size = entry.size
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous.size
+            if size > self.max_bytes:
+                return
+            self._entries[key] = entry
+            self.size += size
+            while self.size > self.max_bytes:
+                __, evicted = self._entries.popitem(last=False)
+                self.size -= evicted.size
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry.size
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+class SqliteCache(CacheBackend):
+    """
+    SQLite 磁盘缓存，跨进程重启保留，按最近访问淘汰，总大小不超过 max_bytes
+
+    参数:
+        path: 数据库路径
+        max_bytes: 容量（字节）
+    """
+    blocking = True
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_DISK_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses ("
+                         "key TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL, "
+                         "content BLOB NOT NULL, charset TEXT, stored_at REAL NOT NULL, expires_at REAL, "
+                         "size INTEGER NOT NULL, accessed REAL NOT NULL)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._db.commit()
+        self.size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._db.execute("SELECT url, status, headers, content, charset, stored_at, expires_at "
+                                   "FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+        url, status, headers, content, charset, stored_at, expires_at = row
+        return CacheEntry(url, status, json.loads(headers), content, charset, stored_at, expires_at)
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        size = entry.size
+        with self._lock:
+            self._remove(key)
+            if size > self.max_bytes:
+                self._db.commit()
+                return
+            self._db.execute("INSERT INTO responses (key, url, status, headers, content, charset, stored_at, "
+                             "expires_at, size, accessed) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (key, entry.url, entry.status, json.dumps(entry.headers, ensure_ascii=False),
+                              entry.content, entry.charset, entry.stored_at, entry.expires_at, size, time.time()))
+            self.size += size
+            while self.size > self.max_bytes:
+                rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT 64").fetchall()
+                if not rows:
+                    break
+                self._db.executemany("DELETE FROM responses WHERE key = ?", [(row[0],) for row in rows])
+                self.size -= sum(row[1] for row in rows)
+            self._db.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self.size = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def _remove(self, key: str) -> None:
+        row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.size -= row[0]
+
+
+class CachingTransport(Transport):
+    """
+    带缓存的传输层，包装另一个传输层
+
+    按 Request.kind 选择缓存时间，kind 不在 ttls 中的请求直接转发；带有 Cookie、Authorization
+    或书源启用了 CookieJar 的请求与登录状态相关，同样直接转发。过期的条目带有 ETag 或
+    Last-Modified 时发送条件请求，服务端返回 304 时继续使用缓存内容。同一地址同时只发送一个请求，
+    其余请求等待它的结果。服务端的 Cache-Control 只遵守 no-store，多数书源网站对动态页面
+    返回 no-cache，照此处理会使缓存失去意义。
+
+    参数:
+        transport: 被包装的传输层，默认使用进程级默认传输层
+        backend: 缓存存储，默认为 MemoryCache
+        ttls: 各类请求的缓存时间（秒），默认为 DEFAULT_TTLS
+    """
+
+    def __init__(self,
+                 transport: Optional[Transport] = None,
+                 backend: Optional[CacheBackend] = None,
+                 ttls: Optional[Dict[str, Optional[float]]] = None) -> None:
+        self.transport = transport
+        self.backend = backend if backend is not None else MemoryCache()
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._pending: Dict[str, asyncio.Future] = {}
+
+    async def send(self, request: Request, source=None) -> Response:
+        if request.kind not in self.ttls or is_private(request, source):
+            return await self._forward(request, source)
+        key = cache_key(request, source)
+        pending = self._pending.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        # 没有其他请求等待时，失败结果无人读取也不应产生警告
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._pending[key] = future
+        try:
+            response = await self._send(key, request, source)
+        except asyncio.CancelledError:
+            future.set_exception(HttpError(f"请求已取消: {request.url}"))
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            del self._pending[key]
+
+    async def close(self) -> None:
+        await self._call(self.backend.close)
+        if self.transport is not None:
+            await self.transport.close()
+
+    async def invalidate(self, request: Request, source=None) -> None:
+        """删除请求对应的缓存条目"""
+        await self._call(self.backend.delete, cache_key(request, source))
+
+    async def _send(self, key: str, request: Request, source) -> Response:
+        entry = await self._call(self.backend.get, key)
+        now = time.time()
+        if entry is not None and entry.fresh(now):
+            self.hits += 1
+            return entry.response()
+
+        outgoing = request
+        if entry is not None:
+            validators = {}
+            if "etag" in entry.headers:
+                validators["If-None-Match"] = entry.headers["etag"]
+            if "last-modified" in entry.headers:
+                validators["If-Modified-Since"] = entry.headers["last-modified"]
+            if validators:
+                outgoing = dataclasses.replace(request, headers={**request.headers, **validators})
+
+        self.misses += 1
+        response = await self._forward(outgoing, source)
+        ttl = self.ttls[request.kind]
+        expires_at = None if ttl is None else now + ttl
+        if response.status == 304 and entry is not None:
+            self.revalidated += 1
+            entry.stored_at, entry.expires_at = now, expires_at
+            await self._call(self.backend.put, key, entry)
+            return entry.response()
+        if response.status == 200 and "no-store" not in response.headers.get("cache-control", "").lower():
+            await self._call(self.backend.put, key, CacheEntry(response.url, response.status, dict(response.headers),
+                                                               response.content, response.charset, now, expires_at))
+        return response
+
+    async def _forward(self, request: Request, source) -> Response:
+        return await (self.transport or get_transport()).send(request, source)
+
+    async def _call(self, function, *args):
+        if self.backend.blocking:
+            return await asyncio.to_thread(function, *args)
+        return function(*args)
+
+
+class ResultCache:
+    """
+    解析结果缓存，相同书源、相同规则解析相同内容时直接返回上次的结果
+
+    键为 (书源地址, 规则摘要, 页面地址, 内容摘要)。书源的 last_update_time 变化时，
+    该书源的全部结果失效。规则中含有 @put、@get、{{ }} 或脚本时结果可能依赖变量与外部状态，
+    这类规则不缓存。缓存的结果由调用方在返回前复制，不应被修改。
+
+    参数:
+        max_entries: 最多保留的结果数，按最近使用淘汰，为 0 时不缓存
+    """
+
+    def __init__(self, max_entries: int = DEFAULT_RESULT_ENTRIES) -> None:
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[ResultKey, Any]" = OrderedDict()
+        self._sources: Dict[str, Tuple[int, Set[ResultKey]]] = {}
+        self._cacheable: "OrderedDict[str, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(self, source: BookSourceEntity, rule: RuleEntity, content: str,
+            base_url: str) -> Optional[ResultKey]:
+        """
+        计算缓存键
+
+        返回:
+            缓存键，规则不可缓存或缓存已关闭时为 None
+        """
+        if self.max_entries <= 0:
+            return None
+        fingerprint = rule.fingerprint()
+        if not self._is_cacheable(fingerprint, rule):
+            return None
+        digest = hashlib.blake2b(content.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+        key = (source.url, fingerprint, base_url, digest)
+        with self._lock:
+            version = self._sources.get(source.url)
+            if version is not None and version[0] != source.last_update_time:
+                # 书源已更新，丢弃旧版本的全部结果
+                for stale in version[1]:
+                    self._entries.pop(stale, None)
+                version = None
+            if version is None:
+                self._sources[source.url] = (source.last_update_time, set())
+        return key
+
+    def get(self, key: Optional[ResultKey]) -> Any:
+        """返回缓存的结果，没有时为 None"""
+        if key is None:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Optional[ResultKey], value: Any) -> None:
+        """保存结果，key 为 None 时忽略"""
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            version = self._sources.get(key[0])
+            if version is not None:
+                version[1].add(key)
+            while len(self._entries) > self.max_entries:
+                evicted, __ = self._entries.popitem(last=False)
+                version = self._sources.get(evicted[0])
+                if version is not None:
+                    version[1].discard(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._sources.clear()
+            self._cacheable.clear()
+
+    def _is_cacheable(self, fingerprint: str, rule: RuleEntity) -> bool:
+        """规则是否可缓存，判断结果按最近使用保留，数量不超过 max_entries"""
+        with self._lock:
+            cacheable = self._cacheable.get(fingerprint)
+            if cacheable is not None:
+                self._cacheable.move_to_end(fingerprint)
+                return cacheable
+        cacheable = not any(isinstance(value, str) and _IMPURE.search(value) for value in rule.to_dict().values())
+        with self._lock:
+            self._cacheable[fingerprint] = cacheable
+            while len(self._cacheable) > self.max_entries:
+                self._cacheable.popitem(last=False)
+        return cacheable
+
+
+_default_result_cache: Optional[ResultCache] = None
+
+
+def get_result_cache() -> ResultCache:
+    """返回进程级默认解析结果缓存，首次调用时创建"""
+    global _default_result_cache
+    if _default_result_cache is None:
+        _default_result_cache = ResultCache()
+    return _default_result_cache
+
+
+def set_result_cache(cache: Optional[ResultCache]) -> None:
+    """替换进程级默认解析结果缓存，传入 None 时下次使用会重新创建，ResultCache(0) 可关闭缓存"""
+    global _default_result_cache
+    _default_result_cache = cache
+
+
+def cache_key(request: Request, source=None) -> str:
+    """
+    缓存键由书源地址、方法、地址、字符集、请求体与实际发送的请求头组成
+
+    书源的 header 与请求自身的请求头合并后取摘要，请求头不同的副本（例如不同用户的
+    with_overrides(header=...)）分别缓存，互相看不到对方的响应。
+    """
+    body = request.body
+    if isinstance(body, bytes):
+        body = body.decode("latin-1")
+    headers = effective_headers(request, source)
+    digest = hashlib.blake2b(json.dumps(sorted(headers.items()), ensure_ascii=False).encode("utf-8"),
+                             digest_size=16).hexdigest()
+    origin = source.url if source is not None else ""
+    return f"{origin}\n{request.method.upper()} {request.url}\n{request.charset or ''}\n{digest}\n{body or ''}"
+
+
+def effective_headers(request: Request, source=None) -> Dict[str, str]:
+    """书源的 header 与请求自身的请求头合并后的结果，名称统一为小写"""
+    headers = {}
+    if source is not None:
+        headers.update((name.lower(), value) for name, value in parse_headers(source.header).items())
+    headers.update((name.lower(), value) for name, value in request.headers.items())
+    return headers
+
+
+def is_private(request: Request, source=None) -> bool:
+    """带有 Cookie、Authorization 或启用了 CookieJar 的请求属于某个用户或登录状态，不缓存"""
+    if source is not None and source.enabled_cookie_jar:
+        return True
+    headers = effective_headers(request, source)
+    return "cookie" in headers or "authorization" in headers
@@ -7,12 +7,194 @@ Author: ddmoyu
 Email: daydaymoyu@gmail.com
 Date: 2024-11-27
 """
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Collection, Deque, Iterable, List, MutableMapping, Optional, Sequence, Tuple
 
-def get_chapter_content():
-    pass
+from .legado_cache import get_result_cache
+from .legado_chapter_list import BookChapter
+from .legado_entities import BookSourceEntity
+from .legado_http import DEFAULT_BACKOFF, DEFAULT_RETRIES, DEFAULT_TIMEOUT, Request, Transport, fetch_with_retry
+from .legado_variables import VariableScope
+from .rule_analyzer import AnalyzeRule
+from .rule_js import call_rules, may_run_js
+from .rule_regex import ReplaceChain
 
-def parse_content():
-    pass
+logger = logging.getLogger(__name__)
 
-def fetch_contents():
-    pass
\ No newline at end of file
+# 同时下载的章节数
+DEFAULT_CONCURRENCY = 8
+# 单个章节最多跟随的正文分页数
+DEFAULT_MAX_PAGES = 64
+
+
+@dataclass(slots=True)
+class ChapterContent:
+    index: int
+    title: str
+    url: str
+    content: str
+    error: Optional[str] = None
+
+
+async def fetch_contents(source: BookSourceEntity,
+                         chapters: Sequence[BookChapter],
+                         completed: Iterable[int] = (),
+                         concurrency: int = DEFAULT_CONCURRENCY,
+                         retries: int = DEFAULT_RETRIES,
+                         backoff: float = DEFAULT_BACKOFF,
+                         timeout: float = DEFAULT_TIMEOUT,
+                         transport: Optional[Transport] = None,
+                         purify: Optional[ReplaceChain] = None,
+                         variables: Optional[VariableScope] = None) -> AsyncIterator[ChapterContent]:
+    """
+    并发下载整本书的正文，结果按章节顺序逐条返回
+
+    同时最多有 concurrency 个章节在下载，已下载但前面章节尚未完成的结果会暂存，
+    暂存的数量不超过 concurrency 的两倍，因此内存占用与书的长度无关。
+
+    参数:
+        source: 书源
+        chapters: 目录中的章节，卷名会被跳过
+        completed: 断点续传时已完成的章节序号，这些章节不会再下载
+        concurrency: 同时下载的章节数
+        retries: 单个请求失败后的重试次数
+        backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+        timeout: 单个请求的超时时间（秒）
+        transport: 传输层，默认使用进程级默认传输层
+        purify: 正文净化规则，由 rule_regex.compile_chain 编译，对每章合并后的正文执行
+        variables: 书籍变量，每个章节在其上分出一层，章节内 @put 的变量不会互相影响
+
+    返回:
+        章节正文的异步迭代器，重试后仍然失败的章节 content 为空并带有 error
+    """
+    done = set(completed)
+    pending = [(position, chapter) for position, chapter in enumerate(chapters)
+               if not chapter.is_volume and chapter.index not in done]
+    chapter_urls = frozenset(chapter.url for chapter in chapters)
+    limit = asyncio.Semaphore(concurrency)
+
+    async def download(position: int, chapter: BookChapter) -> ChapterContent:
+        next_chapter = chapters[position + 1].url if position + 1 < len(chapters) else None
+        async with limit:
+            try:
+                content = await get_chapter_content(source, chapter, next_chapter, retries, backoff, timeout,
+                                                    transport, purify=purify,
+                                                    variables=variables.fork() if variables is not None else None,
+                                                    chapter_urls=chapter_urls)
+            except Exception as e:
+                logger.debug("章节 %s 下载失败: %s", chapter.title, e)
+                return ChapterContent(chapter.index, chapter.title, chapter.url, "", str(e) or type(e).__name__)
+        return ChapterContent(chapter.index, chapter.title, chapter.url, content)
+
+    # 窗口是信号量的两倍，队首章节较慢时后面的章节仍然可以继续下载
+    window = max(1, concurrency) * 2
+    tasks: Deque[asyncio.Task] = deque()
+    items = iter(pending)
+    try:
+        for position, chapter in items:
+            tasks.append(asyncio.create_task(download(position, chapter)))
+            if len(tasks) >= window:
+                break
+        while tasks:
+            result = await tasks.popleft()
+            for position, chapter in items:
+                tasks.append(asyncio.create_task(download(position, chapter)))
+                break
+            yield result
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def get_chapter_content(source: BookSourceEntity,
+                              chapter: BookChapter,
+                              next_chapter_url: Optional[str] = None,
+                              retries: int = DEFAULT_RETRIES,
+                              backoff: float = DEFAULT_BACKOFF,
+                              timeout: float = DEFAULT_TIMEOUT,
+                              transport: Optional[Transport] = None,
+                              max_pages: int = DEFAULT_MAX_PAGES,
+                              purify: Optional[ReplaceChain] = None,
+                              variables: Optional[MutableMapping[str, str]] = None,
+                              chapter_urls: Collection[str] = ()) -> str:
+    """
+    下载单个章节的正文，跟随 nextContentUrl 合并分页
+
+    下一页指向下一章、目录页（chapter.base_url）或 chapter_urls 中的其他章节时停止翻页；
+    第一页之后的分页下载或解析失败时，保留已经得到的分页，不会因此丢掉整章。
+
+    参数:
+        source: 书源
+        chapter: 章节
+        next_chapter_url: 下一章的地址，下一页指向它时停止翻页
+        retries: 单个请求失败后的重试次数
+        backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+        timeout: 单个请求的超时时间（秒）
+        transport: 传输层，默认使用进程级默认传输层
+        max_pages: 最多跟随的分页数
+        purify: 正文净化规则，对合并后的正文执行
+        variables: @put 写入、@get 读取的变量表，同一章节的各分页共用
+        chapter_urls: 书中所有章节的地址，最后一章没有 next_chapter_url 时用于判断下一页是否已离开本章
+
+    返回:
+        正文，多页之间以换行连接
+    """
+    pages: List[str] = []
+    visited = {chapter.url}
+    # 这些地址不属于本章，下一页指向它们说明本章已经结束
+    outside = {item for item in (next_chapter_url, chapter.base_url) if item and item != chapter.url}
+    js = may_run_js(*source.rule_content.to_dict().values())
+    url = chapter.url
+    while url and len(pages) < max_pages:
+        request = Request(url, timeout=timeout, kind="content")
+        try:
+            response = await fetch_with_retry(request, source, retries, backoff, transport)
+            content, next_urls = await call_rules(js, parse_content, source, response.text, response.url or url,
+                                                  variables, transport=transport, source=source)
+        except Exception as e:
+            if not pages:
+                raise
+            logger.debug("章节 %s 的分页 %s 下载失败，保留已下载的 %d 页: %s", chapter.title, url, len(pages), e)
+            break
+        pages.append(content)
+        url = next((item for item in next_urls
+                    if item not in visited and item not in outside and item not in chapter_urls), None)
+        if url is not None:
+            visited.add(url)
+    content = "\n".join(page for page in pages if page)
+    return purify.apply(content) if purify is not None and content else content
+
+
+def parse_content(source: BookSourceEntity, content: str, base_url: str,
+                  variables: Optional[MutableMapping[str, str]] = None) -> Tuple[str, List[str]]:
+    """
+    按 ruleContent 解析正文页
+
+    参数:
+        source: 书源
+        content: 正文页内容
+        base_url: 正文页地址，用于补全下一页地址
+        variables: @put 写入、@get 读取的变量表
+
+    返回:
+        (正文, 下一页地址列表)
+    """
+    rule = source.rule_content
+    cache = get_result_cache()
+    key = cache.key(source, rule, content, base_url)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached[0], list(cached[1])
+
+    analyzer = AnalyzeRule(content, base_url, variables)
+    text = analyzer.get_string(rule.content) if rule.content else ""
+    # 实体中 source_regex 对应书源 JSON 的 replaceRegex，即正文的替换规则
+    if text and rule.source_regex:
+        text = analyzer.get_string(rule.source_regex, text)
+    next_urls = analyzer.get_string_list(rule.next_content_url, is_url=True) if rule.next_content_url else []
+    cache.put(key, (text, tuple(next_urls)))
+    return text, next_urls
@@ -7,15 +7,322 @@ Author: ddmoyu
 Email: daydaymoyu@gmail.com
 Date: 2024-11-27
 """
+import asyncio
+import copy
+import logging
+from collections import deque
+from dataclasses import dataclass
+from typing import AsyncIterator, Deque, List, MutableMapping, Optional, Sequence, Set, Tuple, Union
 
-def get_chapter_list():
-    pass
+from .legado_cache import get_result_cache
+from .legado_entities import BookSourceEntity
+from .legado_http import DEFAULT_BACKOFF, DEFAULT_RETRIES, DEFAULT_TIMEOUT, Request, Transport, fetch_with_retry
+from .rule_analyzer import AnalyzeRule, RuleEvaluationError
+from .rule_js import call_rules, may_run_js
+from .rule_program import Js
 
-def parse_chapter_list():
-    pass
+logger = logging.getLogger(__name__)
 
-def fetch_contents():
-    pass
+# 同时下载的目录页数
+DEFAULT_CONCURRENCY = 8
+# 单本书最多下载的目录页数
+DEFAULT_MAX_PAGES = 1000
 
-def remove_latest_chapter():
-    pass
\ No newline at end of file
+# 摘要中保存的末尾章节数
+TAIL_SIZE = 5
+
+_FALSE_VALUES = {"", "false", "no", "not", "0", "null"}
+
+
+@dataclass(slots=True)
+class BookChapter:
+    title: str
+    url: str
+    index: int
+    is_volume: bool = False
+    tag: str = ""
+    is_vip: bool = False
+    is_pay: bool = False
+    base_url: str = ""
+
+
+@dataclass(frozen=True, slots=True)
+class TocFingerprint:
+    """
+    已保存目录的摘要，增量更新只需要它而不需要完整的章节列表
+
+    count: 章节总数
+    page_urls: 章节所在的目录页，按出现顺序
+    tail: 最后几个章节的 (标题, 地址)
+    """
+    count: int
+    page_urls: Tuple[str, ...]
+    tail: Tuple[Tuple[str, str], ...]
+
+    @classmethod
+    def of(cls, chapters: Sequence[BookChapter]) -> "TocFingerprint":
+        """根据章节列表生成摘要，章节需带有 get_chapter_list 写入的 base_url"""
+        page_urls = tuple(dict.fromkeys(chapter.base_url for chapter in chapters if chapter.base_url))
+        tail = tuple((chapter.title, chapter.url) for chapter in chapters[-TAIL_SIZE:])
+        return cls(len(chapters), page_urls, tail)
+
+    def extend(self, chapters: Sequence[BookChapter]) -> "TocFingerprint":
+        """追加新章节后的摘要"""
+        if not chapters:
+            return self
+        page_urls = tuple(dict.fromkeys(self.page_urls + tuple(chapter.base_url for chapter in chapters
+                                                               if chapter.base_url)))
+        tail = (self.tail + tuple((chapter.title, chapter.url) for chapter in chapters))[-TAIL_SIZE:]
+        return TocFingerprint(self.count + len(chapters), page_urls, tail)
+
+
+@dataclass(slots=True)
+class TocUpdate:
+    chapters: List[BookChapter]
+    fingerprint: TocFingerprint
+    full: bool
+
+
+async def get_chapter_list(source: BookSourceEntity,
+                           toc_url: str,
+                           concurrency: int = DEFAULT_CONCURRENCY,
+                           retries: int = DEFAULT_RETRIES,
+                           backoff: float = DEFAULT_BACKOFF,
+                           timeout: float = DEFAULT_TIMEOUT,
+                           transport: Optional[Transport] = None,
+                           max_pages: int = DEFAULT_MAX_PAGES,
+                           variables: Optional[MutableMapping[str, str]] = None) -> AsyncIterator[BookChapter]:
+    """
+    下载目录，章节按页逐批返回
+
+    每个目录页解析出的 nextTocUrl 会立即开始下载，多个地址同时下载，
+    结果按页面顺序返回：某一页发现的新地址排在该页之后、后续已知页之前，
+    因此无论下载完成的先后，章节顺序都是稳定的。已经访问过的地址不会重复下载。
+
+    参数:
+        source: 书源
+        toc_url: 目录页地址
+        concurrency: 同时下载的目录页数
+        retries: 单个请求失败后的重试次数
+        backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+        timeout: 单个请求的超时时间（秒）
+        transport: 传输层，默认使用进程级默认传输层
+        max_pages: 最多下载的目录页数
+        variables: @put 写入、@get 读取的变量表，通常是 VariableRegistry.book 返回的书籍变量
+
+    返回:
+        章节的异步迭代器，index 从 0 开始连续编号，base_url 为章节所在的目录页
+    """
+    index = 0
+    async for __, chapters in _iter_pages(source, toc_url, set(), concurrency, retries, backoff, timeout,
+                                          transport, max_pages, variables):
+        for chapter in chapters:
+            chapter.index = index
+            index += 1
+            yield chapter
+
+
+async def update_chapter_list(source: BookSourceEntity,
+                              toc_url: str,
+                              previous: Union[Sequence[BookChapter], TocFingerprint],
+                              concurrency: int = DEFAULT_CONCURRENCY,
+                              retries: int = DEFAULT_RETRIES,
+                              backoff: float = DEFAULT_BACKOFF,
+                              timeout: float = DEFAULT_TIMEOUT,
+                              transport: Optional[Transport] = None,
+                              max_pages: int = DEFAULT_MAX_PAGES,
+                              variables: Optional[MutableMapping[str, str]] = None) -> TocUpdate:
+    """
+    增量更新目录，只下载最后一个已知目录页及其之后的页面
+
+    最后一页重新下载后，在其中查找已保存的末尾章节，之后的章节即为新章节。
+    找不到末尾章节（网站调整了目录）或最后一页无法下载时退回完整下载，
+    此时才执行 ruleToc.preUpdateJs。
+
+    参数:
+        source: 书源
+        toc_url: 目录页地址
+        previous: 已保存的章节列表或其 TocFingerprint
+        其余参数同 get_chapter_list
+
+    返回:
+        TocUpdate，full 为 False 时 chapters 只包含新章节，为 True 时是完整目录
+    """
+    fingerprint = previous if isinstance(previous, TocFingerprint) else TocFingerprint.of(previous)
+    options = (concurrency, retries, backoff, timeout, transport, max_pages, variables)
+
+    if fingerprint.page_urls and fingerprint.tail:
+        last_page = fingerprint.page_urls[-1]
+        # 之前的目录页都标记为已访问，避免最后一页的导航链接把整个目录重新下载一遍
+        visited = set(fingerprint.page_urls[:-1])
+        fetched: List[BookChapter] = []
+        try:
+            async for __, chapters in _iter_pages(source, last_page, visited, *options):
+                fetched.extend(chapters)
+        except Exception as e:
+            logger.debug("书源 %s 增量更新目录失败，改为完整下载: %s", source.name, e)
+        else:
+            anchor = _find_tail(fetched, fingerprint.tail)
+            if anchor is not None:
+                added = fetched[anchor + 1:]
+                for offset, chapter in enumerate(added):
+                    chapter.index = fingerprint.count + offset
+                return TocUpdate(added, fingerprint.extend(added), False)
+
+    await call_rules(may_run_js(source.rule_toc.pre_update_js), run_pre_update_js, source, toc_url, variables,
+                     transport=transport, source=source)
+    chapters = [chapter async for chapter in get_chapter_list(source, toc_url, *options)]
+    return TocUpdate(chapters, TocFingerprint.of(chapters), True)
+
+
+def run_pre_update_js(source: BookSourceEntity, toc_url: str,
+                      variables: Optional[MutableMapping[str, str]] = None) -> None:
+    """
+    执行 ruleToc.preUpdateJs，脚本只用于准备变量等副作用，返回值被忽略
+
+    脚本中的 java.ajax 不能在事件循环线程中执行，异步代码中请通过 rule_js.call_rules 或 asyncio.to_thread 调用。
+    """
+    code = source.rule_toc.pre_update_js
+    if not code:
+        return
+    try:
+        AnalyzeRule(toc_url, toc_url, variables).evaluate(Js(code), toc_url)
+    except RuleEvaluationError as e:
+        logger.debug("书源 %s 的 preUpdateJs 执行失败: %s", source.name, e)
+
+
+async def _iter_pages(source: BookSourceEntity,
+                      start_url: str,
+                      visited: Set[str],
+                      concurrency: int,
+                      retries: int,
+                      backoff: float,
+                      timeout: float,
+                      transport: Optional[Transport],
+                      max_pages: int,
+                      variables: Optional[MutableMapping[str, str]]) -> AsyncIterator[Tuple[str, List[BookChapter]]]:
+    """按页面顺序返回 (目录页地址, 章节列表)，visited 中的地址不会下载"""
+    limit = asyncio.Semaphore(concurrency)
+    visited.add(start_url)
+    budget = len(visited) + max_pages - 1
+    js = may_run_js(*source.rule_toc.to_dict().values())
+
+    async def load(url: str) -> Tuple[List[BookChapter], List[str]]:
+        async with limit:
+            request = Request(url, timeout=timeout, kind="toc")
+            response = await fetch_with_retry(request, source, retries, backoff, transport)
+        return await call_rules(js, parse_chapter_list, source, response.text, response.url or url, variables,
+                                transport=transport, source=source)
+
+    pages: Deque[Tuple[str, asyncio.Task]] = deque([(start_url, asyncio.create_task(load(start_url)))])
+    try:
+        while pages:
+            url, task = pages.popleft()
+            chapters, next_urls = await task
+            discovered = []
+            for next_url in next_urls:
+                if next_url not in visited and len(visited) < budget:
+                    visited.add(next_url)
+                    discovered.append((next_url, asyncio.create_task(load(next_url))))
+            pages.extendleft(reversed(discovered))
+
+            for chapter in chapters:
+                chapter.base_url = url
+            yield url, chapters
+    finally:
+        for __, task in pages:
+            task.cancel()
+        await asyncio.gather(*(task for __, task in pages), return_exceptions=True)
+
+
+def parse_chapter_list(source: BookSourceEntity, content: str, base_url: str,
+                       variables: Optional[MutableMapping[str, str]] = None) -> Tuple[List[BookChapter], List[str]]:
+    """
+    按 ruleToc 解析单个目录页
+
+    参数:
+        source: 书源
+        content: 目录页内容
+        base_url: 目录页地址，用于补全相对地址
+        variables: @put 写入、@get 读取的变量表
+
+    返回:
+        (章节列表, 下一页地址列表)，章节的 index 为页内序号
+    """
+    rule = source.rule_toc
+    cache = get_result_cache()
+    key = cache.key(source, rule, content, base_url)
+    cached = cache.get(key)
+    if cached is not None:
+        # 章节在返回后会被修改，例如设置 base_url 与重新编号，缓存中保留未修改的副本
+        return [copy.copy(chapter) for chapter in cached[0]], list(cached[1])
+
+    analyzer = AnalyzeRule(content, base_url, variables)
+    chapters = []
+    for item in analyzer.get_elements(rule.list) if rule.list else []:
+        title = analyzer.get_string(rule.name, item)
+        if not title:
+            continue
+        is_volume = _is_true(analyzer.get_string(rule.is_volume, item)) if rule.is_volume else False
+        url = analyzer.get_string(rule.url, item, is_url=True)
+        if not url:
+            # 卷名没有地址时用标题加序号区分，普通章节没有地址时指向目录页
+            url = f"{title}{len(chapters)}" if is_volume else base_url
+        chapters.append(BookChapter(
+            title=title,
+            url=url,
+            index=len(chapters),
+            is_volume=is_volume,
+            tag=analyzer.get_string(rule.update_time, item) if rule.update_time else "",
+            is_vip=_is_true(analyzer.get_string(rule.is_vip, item)) if rule.is_vip else False,
+            is_pay=_is_true(analyzer.get_string(rule.is_pay, item)) if rule.is_pay else False,
+        ))
+    next_urls = analyzer.get_string_list(rule.next_url, is_url=True) if rule.next_url else []
+    if key is not None:
+        cache.put(key, (tuple(copy.copy(chapter) for chapter in chapters), tuple(next_urls)))
+    return chapters, next_urls
+
+
+def _is_true(value: str) -> bool:
+    return value.strip().lower() not in _FALSE_VALUES
+
+
+def remove_latest_chapter(chapters: Sequence[BookChapter], toc_url: str = "") -> List[BookChapter]:
+    """
+    去掉目录开头的「最新章节」区块
+
+    许多网站在完整目录前列出最近更新的几章，这些章节在后面会再次出现。
+    开头连续出现、且标题与地址都在之后重复的章节会被去掉；没有地址而指向目录页的章节无法判断是否重复，
+    遇到时停止。传入的章节不会被修改，返回的是重新编号后的副本。
+
+    参数:
+        chapters: 目录章节列表
+        toc_url: 目录页地址，地址等于目录页的章节不参与判断
+
+    返回:
+        去掉「最新章节」区块并重新编号的章节列表
+    """
+    last = {(chapter.title, chapter.url): position for position, chapter in enumerate(chapters)}
+    start = 0
+    while start < len(chapters):
+        chapter = chapters[start]
+        if chapter.is_volume or (toc_url and chapter.url == toc_url) or last[chapter.title, chapter.url] <= start:
+            break
+        start += 1
+
+    result = [copy.copy(chapter) for chapter in chapters[start:]]
+    for index, chapter in enumerate(result):
+        chapter.index = index
+    return result
+
+
+def _find_tail(chapters: Sequence[BookChapter], tail: Tuple[Tuple[str, str], ...]) -> Optional[int]:
+    """查找已保存末尾章节在新列表中的位置，末尾章节可能跨页，只要求页内部分连续匹配"""
+    keys = [(chapter.title, chapter.url) for chapter in chapters]
+    for position in range(len(keys) - 1, -1, -1):
+        if keys[position] != tail[-1]:
+            continue
+        depth = min(position + 1, len(tail))
+        if all(keys[position - k] == tail[-1 - k] for k in range(depth)):
+            return position
+    return None
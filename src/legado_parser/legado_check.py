@@ -0,0 +1,339 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+书源之「校验」
+
+Author: ddmoyu
+Email: daydaymoyu@gmail.com
+Date: 2026-10-18
+"""
+import asyncio
+import logging
+import math
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from .legado_entities import BookSourceEntity
+from .legado_http import DEFAULT_TIMEOUT, Transport, fetch
+from .legado_search import SearchBook, parse_search_result, parse_search_url
+from .legado_variables import VariableRegistry
+from .rule_js import call_rules, may_run_js
+
+logger = logging.getLogger(__name__)
+
+# 书源没有 checkKeyword 时使用的关键字，与阅读一致
+DEFAULT_CHECK_KEYWORD = "我的"
+# 同时校验的书源数
+DEFAULT_CONCURRENCY = 64
+# 同一域名同时校验的书源数
+DEFAULT_PER_HOST = 2
+# 每个书源的搜索次数
+DEFAULT_ATTEMPTS = 3
+# 响应时间不超过该值（毫秒）的书源权重只取决于成功率，与书源的默认 responseTime 一致
+DEFAULT_TARGET_TIME = 1500
+# 统计填充率的字段
+CHECK_FIELDS = ("name", "author", "book_url", "cover_url", "intro", "kind", "last_chapter")
+
+
+@dataclass(slots=True)
+class SourceCheck:
+    """
+    单个书源的校验结果
+
+    latencies 为每次成功取得响应的耗时（秒），只包含网络请求，不包含规则解析。
+    一次搜索返回了至少一本有书名的书才算成功；field_rates 为返回的书籍中各字段不为空的比例。
+    error 为最近一次失败的原因，之后的搜索成功时清空。
+    """
+    url: str
+    name: str
+    keyword: str
+    attempts: int = 0
+    successes: int = 0
+    books: int = 0
+    latencies: Tuple[float, ...] = ()
+    field_rates: Optional[Dict[str, float]] = None
+    error: Optional[str] = None
+
+    @property
+    def success_rate(self) -> float:
+        return self.successes / self.attempts if self.attempts else 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.successes > 0
+
+    @property
+    def response_time(self) -> int:
+        """响应时间的中位数（毫秒），没有取得过响应时为 -1"""
+        if not self.latencies:
+            return -1
+        return int(round(percentile(self.latencies, 50) * 1000))
+
+    def weight(self, target_time: int = DEFAULT_TARGET_TIME) -> int:
+        """
+        根据成功率与响应时间计算权重
+
+        参数:
+            target_time: 不扣分的响应时间（毫秒），更慢的书源按比例降低
+
+        返回:
+            0 到 100 之间的整数，搜索时权重高的书源优先
+        """
+        if not self.ok:
+            return 0
+        speed = min(1.0, target_time / max(self.response_time, 1))
+        return int(round(100 * self.success_rate * speed))
+
+
+@dataclass(frozen=True, slots=True)
+class CheckSummary:
+    """
+    一批书源的汇总，响应时间的分位数（毫秒）只统计可用的书源
+
+    percentiles: 分位到响应时间的映射，例如 {50: 820, 90: 2400, 99: 7300}
+    """
+    total: int
+    healthy: int
+    success_rate: float
+    percentiles: Dict[int, int]
+
+
+async def check_source(source: BookSourceEntity,
+                       keyword: Optional[str] = None,
+                       attempts: int = DEFAULT_ATTEMPTS,
+                       timeout: float = DEFAULT_TIMEOUT,
+                       transport: Optional[Transport] = None,
+                       variables: Optional[VariableRegistry] = None) -> Optional[SourceCheck]:
+    """
+    用 checkKeyword 搜索书源若干次，记录每次的耗时与结果
+
+    传输层不应带有响应缓存，否则之后的搜索直接命中缓存，响应时间失去意义。
+
+    参数:
+        source: 书源
+        keyword: 搜索关键字，默认使用 ruleSearch.checkKeyword，没有时为 DEFAULT_CHECK_KEYWORD
+        attempts: 搜索次数，第一次的耗时通常包含建立连接
+        timeout: 单次搜索的超时时间（秒）
+        transport: 传输层，默认使用进程级默认传输层
+        variables: 变量注册表，搜索地址中的脚本使用书源变量
+
+    返回:
+        校验结果，书源没有搜索地址时为 None
+    """
+    if not (source.search_url or "").strip():
+        return None
+    keyword = keyword or source.rule_search.check_keyword or DEFAULT_CHECK_KEYWORD
+    check = SourceCheck(source.url, source.name, keyword)
+    scope = variables.source(source) if variables is not None else None
+    latencies: List[float] = []
+    counts: Dict[str, int] = dict.fromkeys(CHECK_FIELDS, 0)
+    url_js = may_run_js(source.search_url)
+    rules_js = may_run_js(*source.rule_search.to_dict().values())
+    for __ in range(attempts):
+        check.attempts += 1
+        request = await call_rules(url_js, parse_search_url, source, keyword, 1, scope, transport=transport,
+                                   source=source)
+        if request is None:
+            check.error = "搜索地址无法展开"
+            break
+        request.timeout = timeout
+        started = time.perf_counter()
+        try:
+            response = await asyncio.wait_for(fetch(request, source, transport), timeout)
+        except Exception as e:
+            check.error = str(e) or type(e).__name__
+            continue
+        latencies.append(time.perf_counter() - started)
+        if not 200 <= response.status < 300:
+            check.error = f"HTTP {response.status}"
+            continue
+        try:
+            books = await call_rules(rules_js, parse_search_result, source, response.text,
+                                     response.url or request.url, scope, transport=transport, source=source)
+        except Exception as e:
+            check.error = str(e) or type(e).__name__
+            continue
+        if not books:
+            check.error = "没有搜索结果"
+            continue
+        check.successes += 1
+        check.books += len(books)
+        check.error = None
+        _count_fields(books, counts)
+    check.latencies = tuple(latencies)
+    if check.books:
+        check.field_rates = {name: count / check.books for name, count in counts.items()}
+    return check
+
+
+async def check_sources(sources: Iterable[BookSourceEntity],
+                        keyword: Optional[str] = None,
+                        attempts: int = DEFAULT_ATTEMPTS,
+                        concurrency: int = DEFAULT_CONCURRENCY,
+                        per_host: int = DEFAULT_PER_HOST,
+                        timeout: float = DEFAULT_TIMEOUT,
+                        transport: Optional[Transport] = None,
+                        variables: Optional[VariableRegistry] = None) -> AsyncIterator[SourceCheck]:
+    """
+    并发校验多个书源，结果按完成顺序逐条返回
+
+    固定数量的工作协程从 sources 中依次取出书源，sources 可以是 load_sources 返回的迭代器，
+    数千个书源也不会同时创建任务。没有搜索地址的书源被跳过，不会返回结果。
+
+    参数:
+        sources: 书源，未启用的书源同样会被校验
+        keyword: 搜索关键字，默认使用各书源的 checkKeyword
+        attempts: 每个书源的搜索次数
+        concurrency: 同时校验的书源数
+        per_host: 同一域名同时校验的书源数，避免同一网站的多个书源互相拖慢
+        timeout: 单次搜索的超时时间（秒）
+        transport: 传输层，默认使用进程级默认传输层
+        variables: 变量注册表
+
+    返回:
+        校验结果的异步迭代器
+    """
+    items = iter(sources)
+    host_limits: Dict[str, asyncio.Semaphore] = {}
+    queue: "asyncio.Queue[Optional[SourceCheck]]" = asyncio.Queue()
+
+    async def worker() -> None:
+        try:
+            for source in items:
+                host = _search_host(source)
+                host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+                async with host_limit:
+                    try:
+                        check = await check_source(source, keyword, attempts, timeout, transport, variables)
+                    except Exception as e:
+                        logger.debug("书源 %s 校验失败: %s", source.name, e)
+                        check = SourceCheck(source.url, source.name, keyword or "", error=str(e))
+                if check is not None:
+                    queue.put_nowait(check)
+        finally:
+            queue.put_nowait(None)
+
+    workers = [asyncio.create_task(worker()) for __ in range(max(1, concurrency))]
+    try:
+        running = len(workers)
+        while running:
+            check = await queue.get()
+            if check is None:
+                running -= 1
+            else:
+                yield check
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def _search_host(source: BookSourceEntity) -> str:
+    """搜索请求所在的域名，相对的搜索地址（例如 /search?q={{key}}）按书源地址补全"""
+    return urlsplit(urljoin(source.url or "", (source.search_url or "").strip())).netloc
+
+
+def summarize(checks: Iterable[SourceCheck], percentiles: Sequence[int] = (50, 90, 99)) -> CheckSummary:
+    """
+    汇总校验结果
+
+    参数:
+        checks: 校验结果
+        percentiles: 需要计算的响应时间分位
+
+    返回:
+        汇总，没有可用书源时分位数为空
+    """
+    checks = list(checks)
+    healthy = [check.response_time for check in checks if check.ok]
+    attempts = sum(check.attempts for check in checks)
+    successes = sum(check.successes for check in checks)
+    return CheckSummary(
+        len(checks),
+        len(healthy),
+        successes / attempts if attempts else 0.0,
+        {p: int(round(percentile(healthy, p))) for p in percentiles} if healthy else {},
+    )
+
+
+def apply_checks(sources: Iterable[BookSourceEntity],
+                 checks: Iterable[SourceCheck],
+                 target_time: int = DEFAULT_TARGET_TIME) -> List[BookSourceEntity]:
+    """
+    把校验结果写入书源的 response_time 与 weight
+
+    参数:
+        sources: 书源
+        checks: 校验结果，按书源地址对应
+        target_time: 计算权重时不扣分的响应时间（毫秒）
+
+    返回:
+        书源列表，校验过的书源为 with_overrides 得到的副本，原书源保持不变；
+        从未取得响应的书源 response_time 为 -1，weight 为 0
+    """
+    results = _by_url(checks)
+    updated = []
+    for source in sources:
+        check = results.get(source.url)
+        if check is not None:
+            source = source.with_overrides(response_time=check.response_time, weight=check.weight(target_time))
+        updated.append(source)
+    return updated
+
+
+def prune_sources(sources: Iterable[BookSourceEntity],
+                  checks: Iterable[SourceCheck],
+                  min_success_rate: float = 0.5,
+                  max_response_time: Optional[int] = None,
+                  keep_unchecked: bool = True) -> List[BookSourceEntity]:
+    """
+    剔除不可用或过慢的书源，可以再用 dump_sources 或 save_snapshot 导出
+
+    参数:
+        sources: 书源
+        checks: 校验结果，按书源地址对应
+        min_success_rate: 最低成功率
+        max_response_time: 最长响应时间（毫秒），为 None 时不限制
+        keep_unchecked: 是否保留没有校验结果的书源，例如只有发现的书源
+
+    返回:
+        保留的书源，顺序不变
+    """
+    results = _by_url(checks)
+    kept = []
+    for source in sources:
+        check = results.get(source.url)
+        if check is None:
+            if keep_unchecked:
+                kept.append(source)
+            continue
+        if not check.ok or check.success_rate < min_success_rate:
+            continue
+        if max_response_time is not None and check.response_time > max_response_time:
+            continue
+        kept.append(source)
+    return kept
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """按线性插值计算分位数，values 为空时为 NaN"""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * p / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _by_url(checks: Iterable[SourceCheck]) -> Mapping[str, SourceCheck]:
+    return {check.url: check for check in checks}
+
+
+def _count_fields(books: List[SearchBook], counts: Dict[str, int]) -> None:
+    for book in books:
+        for name in CHECK_FIELDS:
+            if getattr(book, name):
+                counts[name] += 1
@@ -1,10 +1,139 @@
 import copy
-from dataclasses import dataclass
-from typing import Optional
+import hashlib
+import json
+import sys
+from dataclasses import dataclass, field
+from typing import Any, ClassVar, Dict, Iterator, Optional, Tuple
 
 
-@dataclass
-class RuleBookInfoEntity:
+# 不超过该长度的字符串会被驻留，书源之间重复的分组名、常用规则、请求头只保存一份
+INTERN_MAX_LENGTH = 1024
+
+# 相同的键顺序只保存一份，用于 to_dict 还原原始字典
+_key_layouts: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+
+
+def _intern(value: Any) -> Any:
+    if type(value) is str and len(value) <= INTERN_MAX_LENGTH:
+        return sys.intern(value)
+    return value
+
+
+class _Entity:
+    """
+    书源实体的公共基类
+
+    子类通过 _FIELDS 声明 (属性名, 原始字典键名, 默认值)，通过 _NESTED 声明
+    (属性名, 原始字典键名, 实体类型)。实体不保留原始字典，只记录键的顺序与未识别的键，
+    需要时由 to_dict 重新构建。
+    """
+    __slots__ = ()
+
+    _FIELDS: ClassVar[Tuple[Tuple[str, str, Any], ...]] = ()
+    _NESTED: ClassVar[Tuple[Tuple[str, str, type], ...]] = ()
+    _ATTRS: ClassVar[Dict[str, str]] = {}
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls._ATTRS = {key: attr for attr, key, __ in cls._FIELDS + cls._NESTED}
+
+    def _load(self, data: dict) -> None:
+        intern = sys.intern
+        get = data.get
+        # 绕过子类的 __setattr__，载入时不需要逐个字段清除缓存
+        set_value = object.__setattr__
+        for attr, key, default in self._FIELDS:
+            value = get(key, default)
+            if type(value) is str and len(value) <= INTERN_MAX_LENGTH:
+                value = intern(value)
+            set_value(self, attr, value)
+        keys = tuple(data)
+        self._keys = _key_layouts.setdefault(keys, keys)
+        attrs = self._ATTRS
+        if all(key in attrs for key in keys):
+            self._extra = None
+        else:
+            self._extra = {_intern(key): value for key, value in data.items() if key not in attrs}
+
+    def _dump_value(self, attr: str) -> Any:
+        return getattr(self, attr)
+
+    def to_dict(self) -> dict:
+        """
+        还原为阅读书源格式的字典
+
+        返回:
+            键顺序与原始字典一致的新字典，创建后被修改过的字段同样会写入
+        """
+        attrs = self._ATTRS
+        extra = self._extra or {}
+        result = {}
+        for key in self._keys:
+            attr = attrs.get(key)
+            result[key] = self._dump_value(attr) if attr else extra[key]
+        for attr, key, default in self._FIELDS:
+            if key not in result:
+                value = self._dump_value(attr)
+                if value != default:
+                    result[key] = value
+        for attr, key, __ in self._NESTED:
+            if key not in result:
+                value = self._dump_value(attr)
+                if value:
+                    result[key] = value
+        return result
+
+
+class _RuleEntity(_Entity):
+    """
+    子规则实体的公共基类，全部字段规则的摘要缓存在实例上
+
+    字段规则的编译结果由 rule_compiler 的进程级缓存按规则文本共享。修改任一字段都会丢弃缓存的摘要。
+    """
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        object.__setattr__(self, name, value)
+        if not name.startswith("_"):
+            object.__setattr__(self, "_fingerprint", None)
+
+    def _load(self, data: dict) -> None:
+        super()._load(data)
+        self._fingerprint = None
+
+    def copy(self) -> "_RuleEntity":
+        """
+        复制子规则
+
+        字段值均为不可变值，与摘要一起在副本之间共享；修改副本的字段只会丢弃副本自己的摘要，
+        不影响原实体。未识别键的数据深拷贝。
+        """
+        clone = object.__new__(type(self))
+        for name in self.__slots__:
+            object.__setattr__(clone, name, object.__getattribute__(self, name))
+        if self._extra:
+            object.__setattr__(clone, "_extra", copy.deepcopy(self._extra))
+        return clone
+
+    __copy__ = copy
+
+    def fingerprint(self) -> str:
+        """
+        返回全部字段规则的摘要，首次使用时计算并缓存
+
+        返回:
+            十六进制摘要，规则相同的实体摘要相同
+        """
+        digest = self._fingerprint
+        if digest is None:
+            data = json.dumps(self.to_dict(), ensure_ascii=False, sort_keys=True, default=str)
+            digest = hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+            self._fingerprint = digest
+        return digest
+
+
+@dataclass(slots=True)
+class RuleBookInfoEntity(_RuleEntity):
     author: str
     cover_url: str
     intro: str
@@ -15,23 +144,29 @@ class RuleBookInfoEntity:
     update_time: int
     can_re_name: str
     download_urls: str
+    _keys: Tuple[str, ...] = field(default=(), repr=False, compare=False)
+    _extra: Optional[dict] = field(default=None, repr=False, compare=False)
+    _fingerprint: Optional[str] = field(default=None, repr=False, compare=False)
+
+    _FIELDS = (
+        ("author", "author", ""),
+        ("cover_url", "coverUrl", ""),
+        ("intro", "intro", ""),
+        ("kind", "kind", ""),
+        ("last_chapter", "lastChapter", ""),
+        ("name", "name", ""),
+        ("word_count", "wordCount", 0),
+        ("update_time", "updateTime", 0),
+        ("can_re_name", "canReName", ""),
+        ("download_urls", "downloadUrls", ""),
+    )
 
     def __init__(self, rule_book_info: dict) -> None:
-        self._rule_book_info = rule_book_info
-        self.author = rule_book_info.get("author", "")
-        self.cover_url = rule_book_info.get("coverUrl", "")
-        self.intro = rule_book_info.get("intro", "")
-        self.kind = rule_book_info.get("kind", "")
-        self.last_chapter = rule_book_info.get("lastChapter", "")
-        self.name = rule_book_info.get("name", "")
-        self.word_count = rule_book_info.get("wordCount", 0)
-        self.update_time = rule_book_info.get("updateTime", 0)
-        self.can_re_name = rule_book_info.get("canReName", "")
-        self.download_urls = rule_book_info.get("downloadUrls", "")
-
-
-@dataclass
-class RuleContentEntity:
+        self._load(rule_book_info)
+
+
+@dataclass(slots=True)
+class RuleContentEntity(_RuleEntity):
     content: str
     replace_regex: str
     next_content_url: str
@@ -39,20 +174,26 @@ class RuleContentEntity:
     source_regex: str
     image_style: str
     pay_action: str
+    _keys: Tuple[str, ...] = field(default=(), repr=False, compare=False)
+    _extra: Optional[dict] = field(default=None, repr=False, compare=False)
+    _fingerprint: Optional[str] = field(default=None, repr=False, compare=False)
+
+    _FIELDS = (
+        ("content", "content", ""),
+        ("replace_regex", "sourceRegex", ""),
+        ("next_content_url", "nextContentUrl", ""),
+        ("web_js", "webJs", ""),
+        ("source_regex", "replaceRegex", ""),
+        ("image_style", "imageStyle", ""),
+        ("pay_action", "payAction", ""),
+    )
 
     def __init__(self, rule_content: dict) -> None:
-        self._rule_content = rule_content
-        self.content = rule_content.get("content", "")
-        self.replace_regex = rule_content.get("sourceRegex", "")
-        self.next_content_url = rule_content.get("nextContentUrl", "")
-        self.web_js = rule_content.get("webJs", "")
-        self.source_regex = rule_content.get("replaceRegex", "")
-        self.image_style = rule_content.get("imageStyle", "")
-        self.pay_action = rule_content.get("payAction", "")
-
-
-@dataclass
-class RuleExploreEntity:
+        self._load(rule_content)
+
+
+@dataclass(slots=True)
+class RuleExploreEntity(_RuleEntity):
     author: str
     book_list: str
     book_url: str
@@ -62,22 +203,28 @@ class RuleExploreEntity:
     last_chapter: str
     name: str
     word_count: str
+    _keys: Tuple[str, ...] = field(default=(), repr=False, compare=False)
+    _extra: Optional[dict] = field(default=None, repr=False, compare=False)
+    _fingerprint: Optional[str] = field(default=None, repr=False, compare=False)
+
+    _FIELDS = (
+        ("author", "author", ""),
+        ("book_list", "bookList", ""),
+        ("book_url", "bookUrl", ""),
+        ("cover_url", "coverUrl", ""),
+        ("intro", "intro", ""),
+        ("kind", "kind", ""),
+        ("last_chapter", "lastChapter", ""),
+        ("name", "name", ""),
+        ("word_count", "wordCount", ""),
+    )
 
     def __init__(self, rule_explore: dict) -> None:
-        self._rule_explore = rule_explore
-        self.author = rule_explore.get("author", "")
-        self.book_list = rule_explore.get("bookList", "")
-        self.book_url = rule_explore.get("bookUrl", "")
-        self.cover_url = rule_explore.get("coverUrl", "")
-        self.intro = rule_explore.get("intro", "")
-        self.kind = rule_explore.get("kind", "")
-        self.last_chapter = rule_explore.get("lastChapter", "")
-        self.name = rule_explore.get("name", "")
-        self.word_count = rule_explore.get("wordCount", "")
-
-
-@dataclass
-class RuleSearchEntity:
+        self._load(rule_explore)
+
+
+@dataclass(slots=True)
+class RuleSearchEntity(_RuleEntity):
     author: str
     book_list: str
     book_url: str
@@ -89,24 +236,30 @@ class RuleSearchEntity:
     update_time: str
     word_count: str
     check_keyword: str
+    _keys: Tuple[str, ...] = field(default=(), repr=False, compare=False)
+    _extra: Optional[dict] = field(default=None, repr=False, compare=False)
+    _fingerprint: Optional[str] = field(default=None, repr=False, compare=False)
+
+    _FIELDS = (
+        ("author", "author", ""),
+        ("book_list", "bookList", ""),
+        ("book_url", "bookUrl", ""),
+        ("cover_url", "coverUrl", ""),
+        ("intro", "intro", ""),
+        ("kind", "kind", ""),
+        ("last_chapter", "lastChapter", ""),
+        ("name", "name", ""),
+        ("update_time", "updateTime", ""),
+        ("word_count", "wordCount", ""),
+        ("check_keyword", "checkKeyWord", ""),
+    )
 
     def __init__(self, rule_search: dict) -> None:
-        self._rule_search = rule_search
-        self.author = rule_search.get("author", "")
-        self.book_list = rule_search.get("bookList", "")
-        self.book_url = rule_search.get("bookUrl", "")
-        self.cover_url = rule_search.get("coverUrl", "")
-        self.intro = rule_search.get("intro", "")
-        self.kind = rule_search.get("kind", "")
-        self.last_chapter = rule_search.get("lastChapter", "")
-        self.name = rule_search.get("name", "")
-        self.update_time = rule_search.get("updateTime", "")
-        self.word_count = rule_search.get("wordCount", "")
-        self.check_keyword = rule_search.get("checkKeyWord", "")
-
-
-@dataclass
-class RuleTocEntity:
+        self._load(rule_search)
+
+
+@dataclass(slots=True)
+class RuleTocEntity(_RuleEntity):
     list: str
     name: str
     url: str
@@ -116,22 +269,39 @@ class RuleTocEntity:
     is_volume: str
     is_vip: str
     is_pay: str
+    _keys: Tuple[str, ...] = field(default=(), repr=False, compare=False)
+    _extra: Optional[dict] = field(default=None, repr=False, compare=False)
+    _fingerprint: Optional[str] = field(default=None, repr=False, compare=False)
+
+    _FIELDS = (
+        ("list", "chapterList", ""),
+        ("name", "chapterName", ""),
+        ("url", "chapterUrl", ""),
+        ("next_url", "nextTocUrl", ""),
+        ("update_time", "updateTime", ""),
+        ("pre_update_js", "preUpdateJs", ""),
+        ("is_volume", "isVolume", ""),
+        ("is_vip", "isVip", ""),
+        ("is_pay", "isPay", ""),
+    )
 
     def __init__(self, rule_toc: dict) -> None:
-        self._rule_toc = rule_toc
-        self.list = rule_toc.get("chapterList", "")
-        self.name = rule_toc.get("chapterName", "")
-        self.url = rule_toc.get("chapterUrl", "")
-        self.next_url = rule_toc.get("nextTocUrl", "")
-        self.update_time = rule_toc.get("updateTime", "")
-        self.pre_update_js = rule_toc.get("preUpdateJs", "")
-        self.is_volume = rule_toc.get("isVolume", "")
-        self.is_vip = rule_toc.get("isVip", "")
-        self.is_pay = rule_toc.get("isPay", "")
-
-
-@dataclass
-class BookSourceEntity:
+        self._load(rule_toc)
+
+
+# 书源中的子规则: (属性名, 原始字典键名, 实体类型)
+_RULE_FIELDS = (
+    ("rule_book_info", "ruleBookInfo", RuleBookInfoEntity),
+    ("rule_content", "ruleContent", RuleContentEntity),
+    ("rule_explore", "ruleExplore", RuleExploreEntity),
+    ("rule_search", "ruleSearch", RuleSearchEntity),
+    ("rule_toc", "ruleToc", RuleTocEntity),
+)
+_RULE_TYPES = {attr: entity for attr, __, entity in _RULE_FIELDS}
+
+
+@dataclass(slots=True)
+class BookSourceEntity(_Entity):
     comment: str
     group: str
     name: str
@@ -157,34 +327,117 @@ class BookSourceEntity:
 
     search_url: str
     weight: int
+    _keys: Tuple[str, ...] = field(default=(), repr=False, compare=False)
+    _extra: Optional[dict] = field(default=None, repr=False, compare=False)
+    _lazy: Optional[Dict[str, dict]] = field(default=None, repr=False, compare=False)
+
+    _FIELDS = (
+        ("comment", "bookSourceComment", ""),
+        ("group", "bookSourceGroup", ""),
+        ("name", "bookSourceName", ""),
+        ("type", "bookSourceType", 0),
+        ("url", "bookSourceUrl", ""),
+        ("url_pattern", "bookUrlPattern", ""),
+        ("custom_order", "customOrder", 0),
+        ("enabled", "enabled", True),
+        ("enabled_cookie_jar", "enabledCookieJar", False),
+        ("enabled_explore", "enabledExplore", False),
+        ("explore_url", "exploreUrl", ""),
+        ("header", "header", ""),
+        ("last_update_time", "lastUpdateTime", 0),
+        ("login_url", "loginUrl", ""),
+        ("response_time", "responseTime", 1500),
+        ("search_url", "searchUrl", ""),
+        ("weight", "weight", 0),
+    )
+    _NESTED = _RULE_FIELDS
 
     def __init__(self, book_source: dict) -> None:
-        self._book_source = copy.deepcopy(book_source)
-        self.comment = book_source.get("bookSourceComment", "")
-        self.group = book_source.get("bookSourceGroup", "")
-        self.name = book_source.get("bookSourceName", "")
-        self.type = book_source.get("bookSourceType", 0)
-        self.url = book_source.get("bookSourceUrl", "")
-
-        self.url_pattern = book_source.get("bookUrlPattern", "")
-        self.custom_order = book_source.get("customOrder", 0)
-        self.enabled = book_source.get("enabled", True)
-        self.enabled_cookie_jar = book_source.get("enabledCookieJar", False)
-        self.enabled_explore = book_source.get("enabledExplore", False)
-        self.explore_url = book_source.get("exploreUrl", "")
-        self.header = book_source.get("header", "")
-        self.last_update_time = book_source.get("lastUpdateTime", 0)
-        self.login_url = book_source.get("loginUrl", "")
-        self.response_time = book_source.get("responseTime", 1500)
-
-        self.rule_book_info = RuleBookInfoEntity(book_source.get("ruleBookInfo", {}))
-        self.rule_content = RuleContentEntity(book_source.get("ruleContent", {}))
-        self.rule_explore = RuleExploreEntity(book_source.get("ruleExplore", {}))
-        self.rule_search = RuleSearchEntity(book_source.get("ruleSearch", {}))
-        self.rule_toc = RuleTocEntity(book_source.get("ruleToc", {}))
-
-        self.search_url = book_source.get("searchUrl", "")
-        self.weight = book_source.get("weight", 0)
-
-    def copy(self):
-        return copy.deepcopy(self)
+        # 不再深拷贝原始字典，未识别键的值与传入的字典共享
+        self._load(book_source)
+        # 子规则实体在首次访问时才创建，先复制一层，之后修改传入的字典不会影响尚未创建的子规则
+        self._lazy = {attr: dict(book_source.get(key) or {}) for attr, key, __ in _RULE_FIELDS}
+
+    def __getattr__(self, name: str) -> Any:
+        # 只有尚未赋值的槽位才会进入这里
+        entity = _RULE_TYPES.get(name)
+        lazy = self._lazy if entity is not None else None
+        if not lazy or name not in lazy:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        value = entity(lazy.pop(name))
+        setattr(self, name, value)
+        if not lazy:
+            self._lazy = None
+        return value
+
+    def iter_rules(self) -> Iterator[Tuple[str, str, str]]:
+        """
+        遍历子规则中所有非空的字段规则
+
+        返回:
+            (子规则属性名, 字段属性名, 规则文本) 的迭代器
+        """
+        for attr in _RULE_TYPES:
+            entity = getattr(self, attr)
+            for field_attr, *__ in entity._FIELDS:
+                value = getattr(entity, field_attr)
+                if value and isinstance(value, str):
+                    yield attr, field_attr, value
+
+    def _dump_value(self, attr: str) -> Any:
+        try:
+            value = object.__getattribute__(self, attr)
+        except AttributeError:
+            # 尚未创建的子规则直接返回原始数据
+            return dict(self._lazy[attr])
+        return value.to_dict() if isinstance(value, _Entity) else value
+
+    def copy(self) -> "BookSourceEntity":
+        """
+        复制书源
+
+        书源自身的字段（header、weight、response_time 等）均为不可变值，可在副本上单独修改。
+        已创建的子规则实体各复制一份，字段值与摘要仍然共享，修改副本的子规则不影响原书源；
+        尚未创建的子规则在副本中首次访问时单独创建。书源级未识别键的数据在副本之间共享，
+        需要完全独立的副本时请使用 copy.deepcopy。
+        """
+        clone = object.__new__(type(self))
+        for name in self.__slots__:
+            try:
+                value = object.__getattribute__(self, name)
+            except AttributeError:
+                continue
+            if isinstance(value, _RuleEntity):
+                value = value.copy()
+            object.__setattr__(clone, name, value)
+        if self._lazy:
+            # 尚未创建的子规则各自记录，原始数据仍然共享
+            clone._lazy = dict(self._lazy)
+        return clone
+
+    __copy__ = copy
+
+    def with_overrides(self, **fields: Any) -> "BookSourceEntity":
+        """
+        复制书源并修改指定字段
+
+        参数:
+            fields: 要修改的字段，例如 header、weight、response_time；子规则 rule_* 不能替换，
+                请在副本的子规则上修改字段
+
+        返回:
+            修改后的副本，原书源保持不变
+        """
+        unknown = [name for name in fields if name.startswith("_") or name not in _SOURCE_ATTRS]
+        if unknown:
+            raise TypeError(f"BookSourceEntity 没有字段: {', '.join(unknown)}")
+        nested = [name for name in fields if name in _RULE_TYPES]
+        if nested:
+            raise TypeError(f"with_overrides 不能替换子规则: {', '.join(nested)}")
+        clone = self.copy()
+        for name, value in fields.items():
+            setattr(clone, name, value)
+        return clone
+
+
+_SOURCE_ATTRS = frozenset(BookSourceEntity._ATTRS.values())
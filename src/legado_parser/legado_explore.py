@@ -7,9 +7,347 @@ Author: ddmoyu
 Email: daydaymoyu@gmail.com
 Date: 2024-11-27
 """
+import asyncio
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import AsyncIterator, Dict, List, Mapping, MutableMapping, Optional, Tuple
 
-def get_book_info():
-    pass
+from .legado_entities import BookSourceEntity
+from .legado_http import DEFAULT_BACKOFF, DEFAULT_RETRIES, DEFAULT_TIMEOUT, Request, Transport, fetch_with_retry
+from .legado_search import SearchBook, parse_book_list
+from .rule_analyzer import AnalyzeRule, to_string
+from .rule_js import JsError, call_rules, get_js_pool, may_run_js
+from .rule_url import compile_url
 
-def parse_book_info():
-    pass
+logger = logging.getLogger(__name__)
+
+# 缓存脚本生成的分类的书源数
+DEFAULT_MAX_SOURCES = 256
+
+# 与阅读一致，分类之间以 && 或换行分隔
+_KIND_SEPARATOR = re.compile(r"(?:&&|\n)+")
+
+
+@dataclass(frozen=True, slots=True)
+class ExploreKind:
+    """
+    发现页的一个分类
+
+    url 为地址模板，其中可以使用 {{page}} 与 <1,2,3> 页码；url 为空的分类是分组标题，不能打开。
+    style 为 JSON 格式分类中的布局参数，原样保留。
+    """
+    title: str
+    url: str = ""
+    style: Optional[Tuple[Tuple[str, str], ...]] = None
+
+
+@dataclass(frozen=True, slots=True)
+class ExploreIndex:
+    """
+    书源全部分类的索引，kinds 保持书源中的顺序，by_title 按标题查找可以打开的分类
+
+    索引会被缓存并在多个调用者之间共享，by_title 是只读映射。
+    """
+    kinds: Tuple[ExploreKind, ...]
+    by_title: Mapping[str, ExploreKind]
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def __iter__(self):
+        return iter(self.kinds)
+
+
+_generated: "OrderedDict[Tuple[str, int, str], ExploreIndex]" = OrderedDict()
+_generated_lock = threading.Lock()
+
+
+def get_explore_index(source: BookSourceEntity,
+                      variables: Optional[MutableMapping[str, str]] = None) -> ExploreIndex:
+    """
+    解析书源的 exploreUrl，得到分类索引
+
+    支持 标题::地址 的文本格式与 [{"title": ..., "url": ...}] 的 JSON 格式。以 <js> 或 @js: 开头时
+    先执行脚本，脚本返回上述两种格式之一。同一 exploreUrl 只解析一次；脚本生成的分类按书源缓存，
+    书源的 last_update_time 变化后重新生成。脚本中的 java.ajax 不能在事件循环线程中执行，
+    异步代码中请使用 fetch_explore_index。
+
+    参数:
+        source: 书源
+        variables: 脚本中 java.get、java.put 使用的变量表
+
+    返回:
+        分类索引，书源没有发现或脚本执行失败时为空
+    """
+    explore_url = (source.explore_url or "").strip()
+    lowered = explore_url[:4].lower()
+    if lowered != "<js>" and lowered != "@js:":
+        return parse_explore_kinds(explore_url)
+
+    key = (source.url, source.last_update_time, explore_url)
+    with _generated_lock:
+        index = _generated.get(key)
+        if index is not None:
+            _generated.move_to_end(key)
+            return index
+    if lowered == "@js:":
+        code = explore_url[4:]
+    else:
+        end = explore_url.rfind("<")
+        code = explore_url[4:end if end > 4 else len(explore_url)]
+    try:
+        bindings = {"baseUrl": source.url, "key": "", "page": 1, "result": None}
+        generated = get_js_pool().evaluate(code, bindings, AnalyzeRule("", source.url, variables))
+    except JsError as e:
+        logger.debug("书源 %s 的发现地址脚本执行失败: %s", source.name, e)
+        return parse_explore_kinds("")
+    if isinstance(generated, (list, dict)):
+        generated = json.dumps(generated, ensure_ascii=False)
+    index = parse_explore_kinds(to_string(generated).strip())
+    with _generated_lock:
+        _generated[key] = index
+        while len(_generated) > DEFAULT_MAX_SOURCES:
+            _generated.popitem(last=False)
+    return index
+
+
+async def fetch_explore_index(source: BookSourceEntity,
+                              variables: Optional[MutableMapping[str, str]] = None,
+                              transport: Optional[Transport] = None) -> ExploreIndex:
+    """
+    在异步代码中取得分类索引，参数与返回值同 get_explore_index，transport 为脚本中 java.ajax 使用的传输层
+
+    生成分类的脚本在线程中执行，不阻塞事件循环。
+    """
+    return await call_rules(may_run_js(source.explore_url), get_explore_index, source, variables,
+                            transport=transport, source=source)
+
+
+@lru_cache(maxsize=1024)
+def parse_explore_kinds(text: str) -> ExploreIndex:
+    """
+    解析不含脚本的 exploreUrl
+
+    参数:
+        text: 标题::地址 格式或 JSON 数组格式的分类
+
+    返回:
+        分类索引
+    """
+    kinds: List[ExploreKind] = []
+    if text.startswith("["):
+        try:
+            items = json.loads(text)
+        except ValueError:
+            items = None
+        for item in items if isinstance(items, list) else ():
+            if not isinstance(item, dict) or not item.get("title"):
+                continue
+            style = item.get("style")
+            kinds.append(ExploreKind(
+                str(item["title"]),
+                str(item.get("url") or "").strip(),
+                tuple((str(name), str(value)) for name, value in style.items()) if isinstance(style, dict) else None,
+            ))
+    else:
+        for line in _KIND_SEPARATOR.split(text):
+            title, __, url = line.partition("::")
+            if title.strip():
+                kinds.append(ExploreKind(title.strip(), url.strip()))
+    by_title: Dict[str, ExploreKind] = {}
+    for kind in kinds:
+        if kind.url:
+            by_title.setdefault(kind.title, kind)
+    return ExploreIndex(tuple(kinds), MappingProxyType(by_title))
+
+
+def parse_explore_url(source: BookSourceEntity, kind: ExploreKind, page: int = 1,
+                      variables: Optional[MutableMapping[str, str]] = None) -> Optional[Request]:
+    """
+    展开分类地址
+
+    参数:
+        source: 书源
+        kind: 分类
+        page: 页码
+        variables: 脚本中 java.get、java.put 使用的变量表
+
+    返回:
+        请求，分类没有地址或脚本无法执行时为 None
+    """
+    if not kind.url:
+        return None
+    try:
+        request = compile_url(kind.url).render("", page, source.url, variables)
+    except JsError as e:
+        logger.debug("书源 %s 的分类 %s 地址无法展开: %s", source.name, kind.title, e)
+        return None
+    request.kind = "explore"
+    return request
+
+
+async def get_explore_result(source: BookSourceEntity,
+                             request: Request,
+                             retries: int = DEFAULT_RETRIES,
+                             backoff: float = DEFAULT_BACKOFF,
+                             transport: Optional[Transport] = None,
+                             variables: Optional[MutableMapping[str, str]] = None) -> List[SearchBook]:
+    """
+    请求分类页并解析书籍列表
+
+    参数:
+        source: 书源
+        request: parse_explore_url 返回的请求
+        retries: 请求失败后的重试次数
+        backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+        transport: 传输层，默认使用进程级默认传输层
+        variables: @put 写入、@get 读取的变量表
+
+    返回:
+        书籍列表
+    """
+    response = await fetch_with_retry(request, source, retries, backoff, transport)
+    return await call_rules(may_run_js(*source.rule_explore.to_dict().values()), parse_explore_result, source,
+                            response.text, response.url or request.url, variables, transport=transport,
+                            source=source)
+
+
+def parse_explore_result(source: BookSourceEntity, content: str, base_url: str,
+                         variables: Optional[MutableMapping[str, str]] = None) -> List[SearchBook]:
+    """
+    按 ruleExplore 解析分类页，与阅读一致，ruleExplore 没有 bookList 时使用 ruleSearch
+
+    参数:
+        source: 书源
+        content: 分类页内容
+        base_url: 分类页地址，用于补全相对地址
+        variables: @put 写入、@get 读取的变量表
+
+    返回:
+        书籍列表
+    """
+    rule = source.rule_explore if source.rule_explore.book_list else source.rule_search
+    return parse_book_list(source, rule, content, base_url, variables)
+
+
+class ExplorePager:
+    """
+    按页浏览一个分类
+
+    取得第 N 页后在后台开始下载第 N+1 页，用户翻页时通常已经下载完成。
+    第 N+1 页的地址与第 N 页相同（分类地址不含页码）时视为只有一页，不再预取。
+    含脚本的分类地址与搜索一样经 call_rules 在线程中展开。
+    不再使用时调用 close 取消尚未完成的预取，也可以用 async with 管理。
+
+    参数:
+        source: 书源
+        kind: 分类
+        prefetch: 是否预取下一页
+        retries: 单个请求失败后的重试次数
+        backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+        timeout: 单个请求的超时时间（秒）
+        transport: 传输层，默认使用进程级默认传输层
+        variables: @put 写入、@get 读取的变量表，通常是 VariableRegistry.source 返回的书源变量
+    """
+
+    def __init__(self,
+                 source: BookSourceEntity,
+                 kind: ExploreKind,
+                 prefetch: bool = True,
+                 retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 transport: Optional[Transport] = None,
+                 variables: Optional[MutableMapping[str, str]] = None) -> None:
+        self.source = source
+        self.kind = kind
+        self.prefetch = prefetch
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.transport = transport
+        self.variables = variables
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._requests: Dict[int, Optional[Request]] = {}
+
+    async def page(self, page: int = 1) -> List[SearchBook]:
+        """
+        返回第 page 页的书籍，页码从 1 开始，没有该页时为空列表
+
+        下载失败时抛出异常，之后再次请求同一页会重新下载。
+        """
+        task = self._tasks.pop(page, None)
+        if task is None:
+            task = self._load(page)
+        # 只保留下一页的预取，跳页时丢弃其余页面
+        for stale in [number for number in self._tasks if number != page + 1]:
+            self._tasks.pop(stale).cancel()
+        if self.prefetch and page + 1 not in self._tasks and await self._has_next(page):
+            self._tasks[page + 1] = self._load(page + 1)
+        try:
+            return await task
+        except BaseException:
+            # 本页失败时下一页大概率也会失败，避免预取的异常无人读取
+            next_task = self._tasks.pop(page + 1, None)
+            if next_task is not None:
+                next_task.cancel()
+            raise
+
+    async def pages(self, start: int = 1) -> AsyncIterator[List[SearchBook]]:
+        """从 start 页开始逐页返回，遇到空页或只有一页的分类时停止"""
+        page = start
+        while True:
+            books = await self.page(page)
+            if not books:
+                return
+            yield books
+            if not await self._has_next(page):
+                return
+            page += 1
+
+    async def close(self) -> None:
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def __aenter__(self) -> "ExplorePager":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+    async def _request(self, page: int) -> Optional[Request]:
+        if page not in self._requests:
+            request = await call_rules(may_run_js(self.kind.url), parse_explore_url, self.source, self.kind, page,
+                                       self.variables, transport=self.transport, source=self.source)
+            # 并发展开同一页时保留先完成的结果
+            self._requests.setdefault(page, request)
+        return self._requests[page]
+
+    async def _has_next(self, page: int) -> bool:
+        current, following = await self._request(page), await self._request(page + 1)
+        if current is None or following is None:
+            return False
+        return (following.url, following.method, following.body) != (current.url, current.method, current.body)
+
+    def _load(self, page: int) -> asyncio.Task:
+        async def load() -> List[SearchBook]:
+            request = await self._request(page)
+            if request is None:
+                return []
+            request.timeout = self.timeout
+            return await get_explore_result(self.source, request, self.retries, self.backoff, self.transport,
+                                            self.variables)
+
+        task = asyncio.create_task(load())
+        # 被丢弃的预取即使失败也无人读取，不应产生警告
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        return task
@@ -0,0 +1,425 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+书源之「网络请求」
+
+Author: ddmoyu
+Email: daydaymoyu@gmail.com
+Date: 2026-10-18
+"""
+import asyncio
+import http.client
+import http.cookiejar
+import json
+import random
+import re
+import ssl
+import threading
+import time
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Pattern, Tuple, Union
+from urllib.parse import quote, urljoin, urlsplit
+
+DEFAULT_TIMEOUT = 15.0
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) " \
+                     "Chrome/120.0.0.0 Safari/537.36"
+# 每个域名最多保留的空闲连接数
+DEFAULT_MAX_IDLE_PER_HOST = 8
+# 空闲连接的最长保留时间（秒）
+DEFAULT_IDLE_TIMEOUT = 30.0
+# 执行阻塞请求的线程数
+DEFAULT_WORKERS = 64
+MAX_REDIRECTS = 10
+# 单个请求失败后的重试次数
+DEFAULT_RETRIES = 3
+# 第一次重试前的等待时间（秒），之后每次翻倍
+DEFAULT_BACKOFF = 0.5
+
+_META_CHARSET = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w-]+)""", re.IGNORECASE)
+_REDIRECT_STATUS = {301, 302, 303, 307, 308}
+# 请求行中保持原样的字符，其余字符（中文等）按 UTF-8 百分号编码，与浏览器一致
+_PATH_SAFE = "".join(chr(code) for code in range(0x21, 0x7f))
+# 服务端繁忙或临时故障，值得重试的状态码
+_RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+# 复用连接时服务端可能已经关闭连接，这些错误需要换新连接重试一次
+_STALE_ERRORS = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionResetError,
+                 BrokenPipeError, ConnectionAbortedError)
+# 可以安全重发的方法，其余方法在旧连接上失败时服务端可能已经处理过请求
+_IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"}
+
+
+class HttpError(Exception):
+    pass
+
+
+@dataclass(slots=True)
+class Request:
+    url: str
+    method: str = "GET"
+    body: Optional[Union[str, bytes]] = None
+    headers: Dict[str, str] = field(default_factory=dict)
+    charset: Optional[str] = None
+    timeout: float = DEFAULT_TIMEOUT
+    # 请求的用途：search、explore、book_info、toc、content，缓存层据此选择过期时间
+    kind: str = ""
+
+
+@dataclass(slots=True)
+class Response:
+    url: str
+    status: int
+    headers: Dict[str, str]
+    content: bytes
+    charset: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        """按请求指定的编码、响应头或页面 meta 中的编码解码，默认 UTF-8"""
+        charset = self.charset
+        if not charset:
+            matcher = _META_CHARSET.search(self.content[:2048])
+            charset = matcher.group(1).decode("ascii") if matcher else "utf-8"
+        try:
+            return self.content.decode(charset, errors="replace")
+        except LookupError:
+            return self.content.decode("utf-8", errors="replace")
+
+
+def parse_headers(header: str) -> Dict[str, str]:
+    """
+    解析书源的 header 字段
+
+    参数:
+        header: JSON 格式的请求头，以 @js: 或 <js> 开头的动态请求头暂不支持
+
+    返回:
+        请求头字典，无法解析时为空字典
+    """
+    header = (header or "").strip()
+    if not header.startswith("{"):
+        return {}
+    try:
+        data = json.loads(header)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    return {str(key): str(value) for key, value in data.items()}
+
+
+class Transport:
+    """
+    传输层基类
+
+    书源相关的请求都通过传输层发送，测试时可以替换为 FakeTransport。
+    source 参数为发起请求的书源，用于附加书源的请求头与 Cookie。
+    """
+
+    async def send(self, request: Request, source=None) -> Response:
+        raise NotImplementedError
+
+    async def close(self) -> None:
+        pass
+
+    async def __aenter__(self) -> "Transport":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.close()
+
+
+class PooledTransport(Transport):
+    """
+    基于 http.client 的传输层，按域名复用长连接
+
+    参数:
+        max_idle_per_host: 每个域名最多保留的空闲连接数
+        idle_timeout: 空闲连接的最长保留时间（秒）
+        workers: 执行阻塞请求的线程数
+        verify: 是否校验 HTTPS 证书
+        user_agent: 请求头中没有 User-Agent 时使用的值
+    """
+
+    def __init__(self,
+                 max_idle_per_host: int = DEFAULT_MAX_IDLE_PER_HOST,
+                 idle_timeout: float = DEFAULT_IDLE_TIMEOUT,
+                 workers: int = DEFAULT_WORKERS,
+                 verify: bool = True,
+                 user_agent: str = DEFAULT_USER_AGENT) -> None:
+        self.max_idle_per_host = max_idle_per_host
+        self.idle_timeout = idle_timeout
+        self.user_agent = user_agent
+        self._ssl_context = ssl.create_default_context()
+        if not verify:
+            self._ssl_context.check_hostname = False
+            self._ssl_context.verify_mode = ssl.CERT_NONE
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="legado-http")
+        self._lock = threading.Lock()
+        self._idle: Dict[Tuple[str, str, int], List[Tuple[http.client.HTTPConnection, float]]] = {}
+        self._cookie_jars: Dict[str, http.cookiejar.CookieJar] = {}
+        self.connections_opened = 0
+
+    async def send(self, request: Request, source=None) -> Response:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.send_blocking, request, source)
+
+    def send_blocking(self, request: Request, source=None) -> Response:
+        """在当前线程中发送请求，按需跟随重定向"""
+        headers = {"User-Agent": self.user_agent, "Accept-Encoding": "gzip, deflate"}
+        if source is not None:
+            headers.update(parse_headers(source.header))
+        headers.update(request.headers)
+        jar = self.cookie_jar(source) if source is not None and source.enabled_cookie_jar else None
+
+        method = request.method.upper()
+        body = request.body
+        if isinstance(body, str):
+            try:
+                body = body.encode(request.charset or "utf-8")
+            except (LookupError, UnicodeEncodeError) as e:
+                raise HttpError(f"请求内容无法按 {request.charset} 编码: {request.url}: {e}") from e
+        if body is not None and not any(key.lower() == "content-type" for key in headers):
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+
+        url = request.url
+        for __ in range(MAX_REDIRECTS + 1):
+            status, response_headers, content, raw_headers = self._roundtrip(method, url, body, headers, jar,
+                                                                             request.timeout)
+            location = response_headers.get("location")
+            if status not in _REDIRECT_STATUS or not location:
+                return Response(url, status, response_headers, content,
+                                request.charset or raw_headers.get_content_charset())
+            url = urljoin(url, location)
+            if status == 303 or (status in (301, 302) and method == "POST"):
+                method, body = "GET", None
+                headers = {key: value for key, value in headers.items() if key.lower() != "content-type"}
+        raise HttpError(f"重定向次数过多: {request.url}")
+
+    def cookie_jar(self, source) -> http.cookiejar.CookieJar:
+        """返回书源对应的 CookieJar，同一书源的请求共享"""
+        with self._lock:
+            jar = self._cookie_jars.get(source.url)
+            if jar is None:
+                jar = self._cookie_jars[source.url] = http.cookiejar.CookieJar()
+            return jar
+
+    def idle_connections(self) -> int:
+        """当前空闲连接的数量"""
+        with self._lock:
+            return sum(len(items) for items in self._idle.values())
+
+    async def close(self) -> None:
+        with self._lock:
+            pools = list(self._idle.values())
+            self._idle.clear()
+        for items in pools:
+            for connection, __ in items:
+                connection.close()
+        self._executor.shutdown(wait=False)
+
+    def _roundtrip(self, method: str, url: str, body: Optional[bytes], headers: Dict[str, str],
+                   jar: Optional[http.cookiejar.CookieJar], timeout: float):
+        try:
+            parts = urlsplit(url)
+            port = parts.port
+        except ValueError as e:
+            # 端口不是数字或超出范围、IPv6 地址格式错误等
+            raise HttpError(f"地址格式错误: {url}: {e}") from e
+        scheme = parts.scheme.lower()
+        if scheme not in ("http", "https"):
+            raise HttpError(f"不支持的协议: {url}")
+        key = (scheme, parts.hostname or "", port or (443 if scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        if not path.isascii():
+            path = quote(path, safe=_PATH_SAFE)
+
+        send_headers = dict(headers)
+        cookie_request = None
+        if jar is not None:
+            cookie_request = urllib.request.Request(url, headers=send_headers, method=method)
+            jar.add_cookie_header(cookie_request)
+            cookie = cookie_request.get_header("Cookie")
+            if cookie:
+                send_headers["Cookie"] = cookie
+
+        connection, reused = self._acquire(key, timeout)
+        try:
+            try:
+                response = self._request(connection, method, path, body, send_headers, timeout)
+            except _STALE_ERRORS:
+                connection.close()
+                if not reused or method not in _IDEMPOTENT_METHODS:
+                    raise
+                connection, reused = self._open(key, timeout), False
+                response = self._request(connection, method, path, body, send_headers, timeout)
+            content = response.read()
+        except (OSError, http.client.HTTPException, UnicodeError) as e:
+            # UnicodeError 来自无法按 latin-1 编码的请求头或无法编码的域名
+            connection.close()
+            raise HttpError(f"请求失败: {url}: {e}") from e
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._release(key, connection)
+
+        if cookie_request is not None:
+            jar.extract_cookies(response, cookie_request)
+
+        encoding = (response.getheader("Content-Encoding") or "").lower()
+        try:
+            if encoding == "gzip":
+                content = zlib.decompress(content, 16 + zlib.MAX_WBITS)
+            elif encoding == "deflate":
+                try:
+                    content = zlib.decompress(content)
+                except zlib.error:
+                    content = zlib.decompress(content, -zlib.MAX_WBITS)
+        except zlib.error as e:
+            raise HttpError(f"响应内容解压失败: {url}: {e}") from e
+        response_headers = {name.lower(): value for name, value in response.getheaders()}
+        return response.status, response_headers, content, response.msg
+
+    @staticmethod
+    def _request(connection: http.client.HTTPConnection, method: str, path: str, body: Optional[bytes],
+                 headers: Dict[str, str], timeout: float) -> http.client.HTTPResponse:
+        connection.timeout = timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(timeout)
+        connection.request(method, path, body=body, headers=headers)
+        return connection.getresponse()
+
+    def _acquire(self, key: Tuple[str, str, int], timeout: float) -> Tuple[http.client.HTTPConnection, bool]:
+        now = time.monotonic()
+        with self._lock:
+            items = self._idle.get(key)
+            while items:
+                connection, last_used = items.pop()
+                if now - last_used < self.idle_timeout:
+                    return connection, True
+                connection.close()
+        return self._open(key, timeout), False
+
+    def _open(self, key: Tuple[str, str, int], timeout: float) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        with self._lock:
+            self.connections_opened += 1
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=timeout, context=self._ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=timeout)
+
+    def _release(self, key: Tuple[str, str, int], connection: http.client.HTTPConnection) -> None:
+        with self._lock:
+            items = self._idle.setdefault(key, [])
+            if len(items) < self.max_idle_per_host:
+                items.append((connection, time.monotonic()))
+                return
+        connection.close()
+
+
+FakeHandler = Callable[[Request], Union[Response, str, bytes, Tuple[int, Union[str, bytes]]]]
+
+
+class FakeTransport(Transport):
+    """
+    进程内的假服务器，按地址返回预设的响应，用于测试
+
+    参数:
+        routes: 地址到响应的映射，响应可以是文本、字节、(状态码, 内容) 或接收请求的函数
+    """
+
+    def __init__(self, routes: Optional[Dict[str, Union[str, bytes, FakeHandler]]] = None) -> None:
+        self._routes: Dict[str, Union[str, bytes, FakeHandler]] = dict(routes or {})
+        self._patterns: List[Tuple[Pattern[str], Union[str, bytes, FakeHandler]]] = []
+        self.requests: List[Request] = []
+
+    def route(self, url: str, response: Union[str, bytes, FakeHandler], regex: bool = False) -> None:
+        """注册响应，regex 为 True 时 url 按正则完整匹配"""
+        if regex:
+            self._patterns.append((re.compile(url), response))
+        else:
+            self._routes[url] = response
+
+    async def send(self, request: Request, source=None) -> Response:
+        self.requests.append(request)
+        handler = self._routes.get(request.url)
+        if handler is None:
+            handler = next((item for pattern, item in self._patterns if pattern.fullmatch(request.url)), None)
+        if handler is None:
+            return Response(request.url, 404, {}, b"", request.charset)
+
+        result = handler(request) if callable(handler) else handler
+        if isinstance(result, Response):
+            return result
+        status = 200
+        if isinstance(result, tuple):
+            status, result = result
+        content = result.encode(request.charset or "utf-8") if isinstance(result, str) else result
+        return Response(request.url, status, {}, content, request.charset)
+
+
+_default_transport: Optional[Transport] = None
+
+
+def get_transport() -> Transport:
+    """返回进程级默认传输层，首次调用时创建 PooledTransport"""
+    global _default_transport
+    if _default_transport is None:
+        _default_transport = PooledTransport()
+    return _default_transport
+
+
+def set_transport(transport: Optional[Transport]) -> None:
+    """替换进程级默认传输层，传入 None 时下次使用会重新创建"""
+    global _default_transport
+    _default_transport = transport
+
+
+async def fetch(request: Request, source=None, transport: Optional[Transport] = None) -> Response:
+    """
+    发送请求并读取完整响应
+
+    参数:
+        request: 请求
+        source: 发起请求的书源，用于附加请求头与 Cookie
+        transport: 传输层，默认使用进程级默认传输层
+
+    返回:
+        响应
+    """
+    return await (transport or get_transport()).send(request, source)
+
+
+async def fetch_with_retry(request: Request,
+                           source=None,
+                           retries: int = DEFAULT_RETRIES,
+                           backoff: float = DEFAULT_BACKOFF,
+                           transport: Optional[Transport] = None) -> Response:
+    """
+    发送请求，网络错误、超时与临时故障的状态码按指数退避重试
+
+    返回:
+        状态码为 2xx 的响应
+    """
+    attempt = 0
+    while True:
+        try:
+            response = await asyncio.wait_for(fetch(request, source, transport), request.timeout)
+        except (HttpError, asyncio.TimeoutError) as e:
+            error: Exception = e
+        else:
+            if 200 <= response.status < 300:
+                return response
+            error = HttpError(f"HTTP {response.status}: {request.url}")
+            if response.status not in _RETRY_STATUS:
+                raise error
+        if attempt >= retries:
+            raise error
+        # 加入随机抖动，避免同一域名的请求同时重试
+        await asyncio.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
+        attempt += 1
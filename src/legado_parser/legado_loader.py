@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+书源之「批量导入」
+
+Author: ddmoyu
+Email: daydaymoyu@gmail.com
+Date: 2026-10-18
+"""
+import io
+import json
+import os
+import re
+from typing import Any, Callable, Collection, Iterable, Iterator, Optional, TextIO, Union
+
+from .legado_entities import BookSourceEntity
+
+# 每次从输入中读取的字符数
+CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_GROUP_SEPARATOR = re.compile(r"[,;，；]")
+
+SourceInput = Union[str, "os.PathLike[str]", TextIO, io.RawIOBase, io.BufferedIOBase]
+
+
+class SourceLoadError(Exception):
+    pass
+
+
+def load_sources(path_or_stream: SourceInput,
+                 enabled: Optional[bool] = None,
+                 group: Optional[str] = None,
+                 source_type: Optional[Union[int, Collection[int]]] = None,
+                 predicate: Optional[Callable[[dict], bool]] = None) -> Iterator[BookSourceEntity]:
+    """
+    流式读取书源文件，逐个生成书源实体
+
+    顶层 JSON 数组按元素增量解析，任意时刻只持有当前书源的数据，内存占用与书源包大小无关。
+
+    参数:
+        path_or_stream: 文件路径，或文本/二进制文件对象
+        enabled: 只保留 enabled 字段等于该值的书源
+        group: 只保留 bookSourceGroup 中包含该分组的书源
+        source_type: 只保留 bookSourceType 等于该值（或属于该集合）的书源
+        predicate: 自定义过滤函数，参数为书源的原始字典
+
+    返回:
+        书源实体的迭代器
+    """
+    if isinstance(source_type, int):
+        source_type = (source_type,)
+
+    for book_source in iter_source_dicts(path_or_stream):
+        if enabled is not None and book_source.get("enabled", True) != enabled:
+            continue
+        if group is not None and group not in _split_groups(book_source.get("bookSourceGroup", "")):
+            continue
+        if source_type is not None and book_source.get("bookSourceType", 0) not in source_type:
+            continue
+        if predicate is not None and not predicate(book_source):
+            continue
+        try:
+            entity = BookSourceEntity(book_source)
+        except (TypeError, ValueError) as e:
+            # 例如子规则不是对象
+            raise SourceLoadError(f"书源 {book_source.get('bookSourceUrl', '')} 格式错误: {e}") from e
+        yield entity
+
+
+def iter_source_dicts(path_or_stream: SourceInput) -> Iterator[dict]:
+    """
+    流式读取书源文件，逐个生成书源的原始字典
+
+    参数:
+        path_or_stream: 文件路径，或文本/二进制文件对象
+
+    返回:
+        书源字典的迭代器，文件内容为单个书源对象时只生成一个元素
+    """
+    if isinstance(path_or_stream, (str, os.PathLike)):
+        with open(path_or_stream, "r", encoding="utf-8-sig") as stream:
+            yield from _iter_json_array(stream)
+        return
+
+    if isinstance(path_or_stream, (io.RawIOBase, io.BufferedIOBase)):
+        stream = io.TextIOWrapper(path_or_stream, encoding="utf-8-sig")
+        try:
+            yield from _iter_json_array(stream)
+        finally:
+            stream.detach()
+        return
+
+    yield from _iter_json_array(path_or_stream)
+
+
+def dump_sources(sources: Iterable[BookSourceEntity], path_or_stream: Union[str, "os.PathLike[str]", TextIO],
+                 indent: Optional[int] = None) -> int:
+    """
+    把书源写为阅读格式的 JSON 数组，逐个书源写出，不会先拼接整个文件
+
+    参数:
+        sources: 书源实体，例如 legado_check.prune_sources 保留的书源
+        path_or_stream: 文件路径或文本文件对象
+        indent: 每个书源内部的缩进，为 None 时写为紧凑格式
+
+    返回:
+        写入的书源数量
+    """
+    if isinstance(path_or_stream, (str, os.PathLike)):
+        with open(path_or_stream, "w", encoding="utf-8") as stream:
+            return dump_sources(sources, stream, indent)
+
+    count = 0
+    path_or_stream.write("[")
+    for source in sources:
+        if count:
+            path_or_stream.write(",")
+        path_or_stream.write("\n")
+        path_or_stream.write(json.dumps(source.to_dict(), ensure_ascii=False, indent=indent))
+        count += 1
+    path_or_stream.write("\n]\n" if count else "]\n")
+    return count
+
+
+def _split_groups(group: str) -> Collection[str]:
+    return {item.strip() for item in _GROUP_SEPARATOR.split(group or "")}
+
+
+def _iter_json_array(stream: TextIO) -> Iterator[dict]:
+    decoder = json.JSONDecoder()
+    reader = _ChunkReader(stream)
+
+    char = reader.peek()
+    if char == "\ufeff":
+        # 以 utf-8 而不是 utf-8-sig 打开的文本流会保留 BOM
+        reader.skip(1)
+        char = reader.peek()
+    if char == "{":
+        # 单个书源对象
+        value = reader.decode(decoder)
+        _check_source(value, reader)
+        if reader.peek():
+            raise SourceLoadError(f"书源文件在第 {reader.offset} 个字符处有多余内容")
+        yield value
+        return
+    if char != "[":
+        raise SourceLoadError("书源文件应为 JSON 数组或对象")
+    reader.skip(1)
+
+    if reader.peek() == "]":
+        reader.skip(1)
+        return
+    while True:
+        value = reader.decode(decoder)
+        _check_source(value, reader)
+        yield value
+
+        char = reader.peek()
+        if char == ",":
+            reader.skip(1)
+        elif char == "]":
+            reader.skip(1)
+            break
+        else:
+            raise SourceLoadError(f"书源文件在第 {reader.offset} 个字符处格式错误")
+
+    if reader.peek():
+        raise SourceLoadError(f"书源文件在第 {reader.offset} 个字符处有多余内容")
+
+
+def _check_source(value: Any, reader: "_ChunkReader") -> None:
+    if not isinstance(value, dict):
+        raise SourceLoadError(f"书源文件在第 {reader.offset} 个字符之前的元素不是书源对象")
+
+
+class _ChunkReader:
+    """按块读取文本，缓冲区只保留尚未解析的部分"""
+
+    def __init__(self, stream: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._consumed = 0
+        self._eof = False
+
+    @property
+    def offset(self) -> int:
+        """当前位置在整个输入中的字符偏移"""
+        return self._consumed + self._pos
+
+    def _fill(self, size: int) -> bool:
+        if self._eof:
+            return False
+        try:
+            chunk = self._stream.read(size)
+        except UnicodeDecodeError as e:
+            raise SourceLoadError(f"书源文件在第 {self.offset} 个字符之后编码错误: {e.reason}") from e
+        if not chunk:
+            self._eof = True
+            return False
+        self._consumed += self._pos
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
+
+    def peek(self) -> str:
+        """跳过空白并返回下一个字符，输入结束时返回空字符串"""
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill(self._chunk_size):
+                return ""
+
+    def skip(self, count: int) -> None:
+        self._pos += count
+
+    def decode(self, decoder: json.JSONDecoder) -> Any:
+        """解析下一个完整的 JSON 值，数据不完整时继续读取"""
+        self.peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                # 元素跨越了缓冲区末尾，读取更多数据后重试；单个元素过大时逐步加大读取量
+                if self._fill(size):
+                    size *= 2
+                    continue
+                raise SourceLoadError(f"书源文件解析失败: {e.msg}，位置 {self._consumed + e.pos}") from e
+            self._pos = end
+            return value
@@ -7,12 +7,275 @@ Author: ddmoyu
 Email: daydaymoyu@gmail.com
 Date: 2024-11-27
 """
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Iterable, List, MutableMapping, Optional, Tuple, Union
+from urllib.parse import urlsplit
 
-def search():
-    pass
+from .legado_cache import get_result_cache
+from .legado_entities import BookSourceEntity, RuleExploreEntity, RuleSearchEntity
+from .legado_http import DEFAULT_BACKOFF, DEFAULT_RETRIES, DEFAULT_TIMEOUT, Request, Transport, fetch_with_retry
+from .legado_variables import VariableRegistry
+from .rule_analyzer import AnalyzeRule
+from .rule_js import JsError, call_rules, may_run_js
+from .rule_plan import ExtractionPlan, compile_plan
+from .rule_url import compile_url
 
-def parse_search_url():
-    pass
+logger = logging.getLogger(__name__)
 
-def get_search_result():
-    pass
\ No newline at end of file
+# 同时处理的书源数
+DEFAULT_CONCURRENCY = 64
+# 同一域名同时进行的搜索请求数
+DEFAULT_PER_HOST = 4
+
+# 书籍列表中每个条目的字段
+BOOK_LIST_FIELDS = ("name", "author", "kind", "word_count", "last_chapter", "intro", "cover_url", "book_url",
+                    "update_time")
+_URL_FIELDS = {"cover_url", "book_url"}
+
+# 待搜索的书源：(书源, 书源变量, 已展开的请求)
+_SearchJob = Tuple[BookSourceEntity, Optional[MutableMapping[str, str]], Optional[Request]]
+
+
+@dataclass(slots=True)
+class SearchBook:
+    name: str
+    author: str
+    kind: str
+    word_count: str
+    last_chapter: str
+    intro: str
+    cover_url: str
+    book_url: str
+    update_time: str
+    origin: str
+    origin_name: str
+    # 条目内 @put 写入的变量，加入书架时作为书籍变量的初始值
+    variables: Dict[str, str] = field(default_factory=dict)
+
+
+async def search(keyword: str,
+                 sources: Iterable[BookSourceEntity],
+                 page: int = 1,
+                 limit: Optional[int] = None,
+                 concurrency: int = DEFAULT_CONCURRENCY,
+                 per_host: int = DEFAULT_PER_HOST,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 transport: Optional[Transport] = None,
+                 variables: Optional[VariableRegistry] = None,
+                 retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF) -> AsyncIterator[SearchBook]:
+    """
+    并发搜索多个书源，结果按到达顺序逐条返回
+
+    参数:
+        keyword: 搜索关键字
+        sources: 参与搜索的书源，未启用或没有搜索地址的书源会被跳过
+        page: 页码
+        limit: 返回的结果达到该数量后停止，并取消尚未完成的请求
+        concurrency: 同时处理的书源数，包括展开搜索地址与请求
+        per_host: 同一域名同时进行的请求数
+        timeout: 单个书源的超时时间（秒），包括重试
+        transport: 传输层，默认使用进程级默认传输层
+        variables: 变量注册表，每个书源使用自己的书源变量
+        retries: 单个请求失败后的重试次数
+        backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+
+    返回:
+        搜索结果的异步迭代器
+    """
+    host_limits: Dict[str, asyncio.Semaphore] = {}
+    # 域名名额已满的请求暂存在这里，由占用该域名名额的工作协程完成请求后接手
+    deferred: Dict[str, Deque[_SearchJob]] = {}
+    queue: "asyncio.Queue[Union[List[SearchBook], Exception, None]]" = asyncio.Queue()
+    pending = ((source, variables.source(source) if variables is not None else None, None)
+               for source in sources if source.enabled and (source.search_url or "").strip())
+
+    def take() -> Optional[_SearchJob]:
+        for host, jobs in deferred.items():
+            if not host_limits[host].locked():
+                job = jobs.popleft()
+                if not jobs:
+                    del deferred[host]
+                return job
+        return next(pending, None)
+
+    async def run(source: BookSourceEntity, scope: Optional[MutableMapping[str, str]],
+                  request: Optional[Request]) -> None:
+        if request is None:
+            request = await call_rules(may_run_js(source.search_url), parse_search_url, source, keyword, page,
+                                       scope, transport=transport, source=source)
+            if request is None:
+                return
+        host = urlsplit(request.url).netloc
+        host_limit = host_limits.setdefault(host, asyncio.Semaphore(per_host))
+        # 等待单个域名时不占用工作协程，暂存的请求不超过 concurrency 个，超出时原地等待
+        if host_limit.locked() and sum(map(len, deferred.values())) < concurrency:
+            deferred.setdefault(host, deque()).append((source, scope, request))
+            return
+        async with host_limit:
+            books = await asyncio.wait_for(get_search_result(source, request, transport, scope, retries, backoff),
+                                           timeout)
+        if books:
+            queue.put_nowait(books)
+
+    async def worker() -> None:
+        try:
+            while (job := take()) is not None:
+                try:
+                    await run(*job)
+                except Exception as e:
+                    logger.debug("书源 %s 搜索失败: %s", job[0].name, e)
+        except Exception as e:
+            # 读取书源出错，例如书源文件格式错误，交给调用方处理
+            queue.put_nowait(e)
+        finally:
+            queue.put_nowait(None)
+
+    # 固定数量的工作协程依次领取书源，地址的展开与请求都在名额之内，书源按需读取
+    workers = [asyncio.create_task(worker()) for __ in range(max(concurrency, 1))]
+    count = 0
+    running = len(workers)
+    try:
+        while running:
+            books = await queue.get()
+            if books is None:
+                running -= 1
+                continue
+            if isinstance(books, Exception):
+                raise books
+            for book in books:
+                yield book
+                count += 1
+                if limit is not None and count >= limit:
+                    return
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+
+
+def parse_search_url(source: BookSourceEntity, keyword: str, page: int = 1,
+                     variables: Optional[MutableMapping[str, str]] = None) -> Optional[Request]:
+    """
+    展开书源的搜索地址
+
+    地址由 rule_url.compile_url 编译并缓存，支持 {{ }} 表达式、<1,2,3> 页码、<js></js> 与 @js: 脚本，
+    以及 ,{"method": ..., "body": ..., "charset": ..., "headers": ...} 请求参数。
+    书源的 header 在发送时由传输层附加。
+
+    参数:
+        source: 书源
+        keyword: 搜索关键字
+        page: 页码
+        variables: 脚本中 java.get、java.put 使用的变量表
+
+    返回:
+        请求，书源没有可用的搜索地址或脚本无法执行时为 None
+    """
+    search_url = (source.search_url or "").strip()
+    if not search_url:
+        return None
+    try:
+        request = compile_url(search_url).render(keyword, page, source.url, variables)
+    except JsError as e:
+        logger.debug("书源 %s 的搜索地址无法展开: %s", source.name, e)
+        return None
+    request.kind = "search"
+    return request
+
+
+async def get_search_result(source: BookSourceEntity, request: Request,
+                            transport: Optional[Transport] = None,
+                            variables: Optional[MutableMapping[str, str]] = None,
+                            retries: int = DEFAULT_RETRIES,
+                            backoff: float = DEFAULT_BACKOFF) -> List[SearchBook]:
+    """
+    请求单个书源的搜索页并解析结果
+
+    网络错误与临时故障的状态码按指数退避重试，重试后仍然失败或状态码不是 2xx 时抛出 HttpError，
+    错误页不会被当作搜索结果解析。
+
+    参数:
+        source: 书源
+        request: parse_search_url 返回的请求
+        transport: 传输层，书源的请求头与 Cookie 由传输层附加
+        variables: @put 写入、@get 读取的变量表
+        retries: 请求失败后的重试次数
+        backoff: 第一次重试前的等待时间（秒），之后每次翻倍
+
+    返回:
+        搜索结果列表
+    """
+    response = await fetch_with_retry(request, source, retries, backoff, transport)
+    return await call_rules(may_run_js(*source.rule_search.to_dict().values()), parse_search_result, source,
+                            response.text, response.url or request.url, variables, transport=transport,
+                            source=source)
+
+
+def parse_search_result(source: BookSourceEntity, content: str, base_url: str,
+                        variables: Optional[MutableMapping[str, str]] = None) -> List[SearchBook]:
+    """
+    按 ruleSearch 解析搜索页
+
+    参数:
+        source: 书源
+        content: 搜索页内容
+        base_url: 搜索页地址，用于补全相对地址
+        variables: @put 写入、@get 读取的变量表
+
+    返回:
+        搜索结果列表
+    """
+    return parse_book_list(source, source.rule_search, content, base_url, variables)
+
+
+def parse_book_list(source: BookSourceEntity, rule: Union[RuleSearchEntity, RuleExploreEntity], content: str,
+                    base_url: str, variables: Optional[MutableMapping[str, str]] = None) -> List[SearchBook]:
+    """
+    按搜索或发现规则解析书籍列表页，参数同 parse_search_result，rule 为 ruleSearch 或 ruleExplore
+
+    每个条目使用 variables 上分出的一层，条目内 @put 的变量只在该条目的规则之间可见，
+    并保存在 SearchBook.variables 中，可以传给 VariableRegistry.book 作为书籍变量的初始值。
+    """
+    if not rule.book_list:
+        return []
+
+    cache = get_result_cache()
+    key = cache.key(source, rule, content, base_url)
+    records = cache.get(key)
+    if records is None:
+        # 每本书在变量表上分出一层，条目内 @put 的变量不会写入书源变量，也不会串到其他条目
+        records = book_list_plan(rule).extract_with_variables(AnalyzeRule(content, base_url, variables))
+        cache.put(key, records)
+    books = []
+    for (name, author, kind, word_count, last_chapter, intro, cover_url, book_url,
+         update_time), book_variables in records:
+        books.append(SearchBook(
+            name=name,
+            author=author,
+            kind=kind,
+            word_count=word_count,
+            last_chapter=last_chapter,
+            intro=intro,
+            cover_url=cover_url,
+            book_url=book_url or base_url,
+            update_time=update_time,
+            origin=source.url,
+            origin_name=source.name,
+            variables=dict(book_variables),
+        ))
+    return books
+
+
+def book_list_plan(rule: Union[RuleSearchEntity, RuleExploreEntity]) -> ExtractionPlan:
+    """
+    返回搜索或发现规则的批量取值计划
+
+    字段顺序为 name、author、kind、word_count、last_chapter、intro、cover_url、book_url、update_time，
+    name 为空的条目被跳过。发现规则没有 update_time，该字段总为空。
+    """
+    fields = tuple((str(getattr(rule, attr, "") or ""), attr in _URL_FIELDS) for attr in BOOK_LIST_FIELDS)
+    return compile_plan(rule.book_list, fields, (0,))
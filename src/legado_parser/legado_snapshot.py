@@ -0,0 +1,270 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+书源之「快照」
+
+将书源与预编译的规则写入二进制文件，加载时通过 mmap 映射，多个进程共享同一份页面，
+书源按下标在访问时才解码。
+
+文件布局（整数均为小端）:
+    头部        magic(4s) version(H) reserved(H) source_count(I) rule_count(I) reserved(I)
+                source_index_offset(Q) rule_index_offset(Q)
+    书源记录    UTF-8 JSON: {"s": 书源字典, "r": [规则编号, ...]}
+    规则记录    UTF-8 JSON: [规则文本, 分词结果, 分组规则类型, [[规则类型, 语法树], [规则类型, 语法树]]]，
+                末尾两项依次对应 contentIsJson 为 False、True 时的编译结果，无法分词的规则为 null
+    书源索引    source_count + 1 个 Q，第 i 条记录位于 [index[i], index[i + 1])
+    规则索引    rule_count + 1 个 Q
+
+Author: ddmoyu
+Email: daydaymoyu@gmail.com
+Date: 2026-10-18
+"""
+import json
+import mmap
+import os
+import struct
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Union, overload
+
+from .legado_entities import BookSourceEntity
+from .rule_compiler import CompiledRule, build_rule, get_rule_cache
+from .rule_program import Program
+from .rule_tokenizer import TokenizerError
+from .rule_type import RuleType
+
+MAGIC = b"LGDS"
+FORMAT_VERSION = 2
+
+_HEADER = struct.Struct("<4sHHIIIQQ")
+_OFFSET = struct.Struct("<Q")
+_RULE_TYPES = {item.value: item for item in RuleType}
+# 分析器只以 hasEndRule=False 请求规则，contentIsJson 随内容变化，两种组合都预编译
+_CONTENT_IS_JSON = (False, True)
+
+PathType = Union[str, "os.PathLike[str]"]
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def save_snapshot(sources: Iterable[BookSourceEntity], path: PathType) -> int:
+    """
+    将书源及其预编译规则写入快照文件
+
+    无法分词的规则不预编译，书源仍然写入，使用时与未经快照加载的书源一样在执行时报错。
+
+    参数:
+        sources: 书源实体，可以是 load_sources 返回的迭代器
+        path: 快照文件路径
+
+    返回:
+        写入的书源数量
+    """
+    rule_ids: Dict[str, int] = {}
+    rules: List[str] = []
+    source_offsets: List[int] = []
+
+    with open(path, "wb") as stream:
+        stream.write(b"\0" * _HEADER.size)
+
+        for source in sources:
+            ids = []
+            for __, ___, text in source.iter_rules():
+                rule_id = rule_ids.get(text)
+                if rule_id is None:
+                    rule_id = rule_ids[text] = len(rules)
+                    rules.append(text)
+                ids.append(rule_id)
+            source_offsets.append(stream.tell())
+            stream.write(_dumps({"s": source.to_dict(), "r": ids}))
+        source_offsets.append(stream.tell())
+
+        rule_offsets: List[int] = []
+        for text in rules:
+            rule_offsets.append(stream.tell())
+            try:
+                data = _rule_to_data([build_rule(text, False, is_json) for is_json in _CONTENT_IS_JSON])
+            except TokenizerError:
+                data = None
+            stream.write(_dumps(data))
+        rule_offsets.append(stream.tell())
+
+        source_index = _write_index(stream, source_offsets)
+        rule_index = _write_index(stream, rule_offsets)
+
+        stream.seek(0)
+        stream.write(_HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(source_offsets) - 1, len(rules), 0,
+                                  source_index, rule_index))
+
+    return len(source_offsets) - 1
+
+
+def load_snapshot(path: PathType) -> "SourceSnapshot":
+    """
+    通过 mmap 打开快照文件，只读取头部，书源在访问时才解码
+
+    参数:
+        path: 快照文件路径
+
+    返回:
+        按下标访问书源的只读序列
+    """
+    return SourceSnapshot(path)
+
+
+class SourceSnapshot(Sequence[BookSourceEntity]):
+    """
+    映射到内存的书源快照
+
+    打开时向进程级规则缓存注册为规则来源。按下标访问书源时只记录它的规则文本对应的编号，
+    compile_rule 第一次请求某条规则时才从快照中解码，之后由缓存按最近最少使用管理，
+    不会因为访问大量书源而挤掉缓存中的其他规则。关闭时取消注册。
+    """
+
+    def __init__(self, path: PathType) -> None:
+        with open(path, "rb") as stream:
+            try:
+                self._mmap = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                raise SnapshotError(f"快照文件为空: {path}") from e
+
+        try:
+            magic, version, __, count, rule_count, ___, source_index, rule_index = _HEADER.unpack_from(self._mmap)
+        except struct.error as e:
+            self._mmap.close()
+            raise SnapshotError(f"快照文件不完整: {path}") from e
+        if magic != MAGIC:
+            self._mmap.close()
+            raise SnapshotError(f"不是书源快照文件: {path}")
+        if version != FORMAT_VERSION:
+            self._mmap.close()
+            raise SnapshotError(f"不支持的快照版本 {version}，当前版本为 {FORMAT_VERSION}")
+        size = len(self._mmap)
+        if source_index + (count + 1) * _OFFSET.size > size or rule_index + (rule_count + 1) * _OFFSET.size > size:
+            self._mmap.close()
+            raise SnapshotError(f"快照文件不完整: {path}")
+
+        self._count = count
+        self._rule_count = rule_count
+        self._source_index = source_index
+        self._rule_index = rule_index
+        # 已访问书源的规则文本 -> 规则编号，规则本身在 compile_rule 请求时才解码
+        self._rule_ids: Dict[str, int] = {}
+        get_rule_cache().add_loader(self._load_rule)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @overload
+    def __getitem__(self, index: int) -> BookSourceEntity: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> List[BookSourceEntity]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("快照下标越界")
+
+        record = self._decode(self._source_index, index)
+        try:
+            source = BookSourceEntity(record["s"])
+            for (__, ___, text), rule_id in zip(source.iter_rules(), record["r"]):
+                self._rule_ids.setdefault(text, rule_id)
+        except (KeyError, TypeError, ValueError) as e:
+            raise SnapshotError(f"第 {index} 条书源记录已损坏") from e
+        return source
+
+    def __iter__(self) -> Iterator[BookSourceEntity]:
+        for index in range(self._count):
+            yield self[index]
+
+    def __enter__(self) -> "SourceSnapshot":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    @property
+    def rule_count(self) -> int:
+        """快照中不重复的规则数量"""
+        return self._rule_count
+
+    def rule(self, rule_id: int, contentIsJson: bool = False) -> Optional[CompiledRule]:
+        """
+        解码快照中的第 rule_id 条预编译规则
+
+        参数:
+            rule_id: 规则编号
+            contentIsJson: 内容是否为 JSON
+
+        返回:
+            hasEndRule 为 False 时的编译结果，保存时无法分词的规则返回 None
+        """
+        if not 0 <= rule_id < self._rule_count:
+            raise IndexError("规则编号越界")
+        data = self._decode(self._rule_index, rule_id)
+        if data is None:
+            return None
+        try:
+            return _rule_from_data(data, contentIsJson)
+        except (KeyError, TypeError, ValueError, IndexError) as e:
+            raise SnapshotError(f"第 {rule_id} 条规则记录已损坏") from e
+
+    def close(self) -> None:
+        """取消规则来源的注册并解除内存映射"""
+        get_rule_cache().remove_loader(self._load_rule)
+        self._mmap.close()
+
+    def _load_rule(self, text: str, hasEndRule: bool, contentIsJson: bool) -> Optional[CompiledRule]:
+        rule_id = self._rule_ids.get(text)
+        if rule_id is None or hasEndRule:
+            return None
+        return self.rule(rule_id, contentIsJson)
+
+    def _decode(self, index_offset: int, index: int):
+        start, end = struct.unpack_from("<QQ", self._mmap, index_offset + index * _OFFSET.size)
+        if not start <= end <= len(self._mmap):
+            raise SnapshotError(f"快照索引已损坏: [{start}, {end})")
+        try:
+            return json.loads(self._mmap[start:end])
+        except ValueError as e:
+            raise SnapshotError(f"快照记录已损坏: [{start}, {end})") from e
+
+
+def _dumps(data) -> bytes:
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _write_index(stream: BinaryIO, offsets: List[int]) -> int:
+    position = stream.tell()
+    stream.write(struct.pack(f"<{len(offsets)}Q", *offsets))
+    return position
+
+
+def _rule_to_data(rules: List[CompiledRule]) -> list:
+    first = rules[0]
+    return [
+        first.text,
+        list(first.tokens),
+        [item.value for item in first.group_types],
+        [[[item.value for item in rule.types], rule.program.to_data() if rule.program is not None else None]
+         for rule in rules],
+    ]
+
+
+def _rule_from_data(data: list, contentIsJson: bool) -> CompiledRule:
+    text, tokens, group_types, variants = data
+    types, program = variants[_CONTENT_IS_JSON.index(contentIsJson)]
+    return CompiledRule(
+        text,
+        tuple(tokens),
+        tuple(_RULE_TYPES[item] for item in types),
+        tuple(_RULE_TYPES[item] for item in group_types),
+        False,
+        contentIsJson,
+        program=Program.from_data(program) if program is not None else None,
+    )
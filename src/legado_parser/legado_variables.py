@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+书源之「变量」
+
+Author: ddmoyu
+Email: daydaymoyu@gmail.com
+Date: 2026-10-18
+"""
+import json
+import sqlite3
+import threading
+from collections import ChainMap, OrderedDict
+from typing import Dict, Mapping, Optional, Tuple
+
+from .legado_entities import BookSourceEntity
+
+# 内存中最多保留变量的书籍数
+DEFAULT_MAX_BOOKS = 256
+
+
+class VariableScope(ChainMap):
+    """
+    分层变量表，@put 写入最内层，@get 与 {{ }} 依次从内层向外层查找
+
+    与阅读一致，层级从内到外为章节、书籍、书源。fork 只新增一层空字典，
+    不复制已有变量，因此为每个章节分出一层的开销是常数。
+    """
+
+    def get(self, key, default=None):
+        for mapping in self.maps:
+            if key in mapping:
+                return mapping[key]
+        return default
+
+    def fork(self) -> "VariableScope":
+        """新增一层，写入只影响新层，读取仍能看到外层"""
+        return self.new_child()
+
+
+class VariableRegistry:
+    """
+    按书源与书籍保存的变量
+
+    书源变量在整个进程内保留；书籍变量按最近使用保留 max_books 本，超出时写回数据库后释放，
+    因此长时间运行时内存占用与读过的书籍数无关。释放后的书籍再次使用时从数据库重新读取，
+    仍在使用的 VariableScope 之后写入的变量需要再次 release 或 save 才会保存，
+    max_books 应大于同时处理的书籍数。
+
+    没有数据库时释放就等于丢弃变量，因此不按 max_books 淘汰，书籍变量只在 release 时释放。
+
+    参数:
+        path: SQLite 数据库路径，为 None 时变量只保存在内存中
+        max_books: 有数据库时内存中最多保留变量的书籍数
+    """
+
+    def __init__(self, path: Optional[str] = None, max_books: int = DEFAULT_MAX_BOOKS) -> None:
+        self.path = path
+        self.max_books = max_books
+        self._sources: Dict[str, Dict[str, str]] = {}
+        self._books: "OrderedDict[Tuple[str, str], Dict[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS variables "
+                             "(source TEXT NOT NULL, book TEXT NOT NULL, data TEXT NOT NULL, "
+                             "PRIMARY KEY (source, book))")
+            self._db.commit()
+
+    def source(self, source: BookSourceEntity) -> VariableScope:
+        """书源级变量，搜索、发现等不属于某本书的流程使用"""
+        with self._lock:
+            return VariableScope(self._source_map(source.url))
+
+    def book(self, source: BookSourceEntity, book_url: str,
+             initial: Optional[Mapping[str, str]] = None) -> VariableScope:
+        """
+        书籍级变量，外层为书源变量
+
+        参数:
+            source: 书源
+            book_url: 书籍地址
+            initial: 书籍还没有变量时写入的初始值，例如搜索结果的 SearchBook.variables
+
+        返回:
+            书籍的变量表
+        """
+        key = (source.url, book_url)
+        with self._lock:
+            variables = self._books.get(key)
+            if variables is None:
+                variables = self._books[key] = self._load(source.url, book_url)
+                while self._db is not None and len(self._books) > self.max_books:
+                    evicted, data = self._books.popitem(last=False)
+                    self._store(evicted[0], evicted[1], data)
+                self._commit()
+            else:
+                self._books.move_to_end(key)
+            if initial and not variables:
+                variables.update(initial)
+            return VariableScope(variables, self._source_map(source.url))
+
+    def release(self, source: BookSourceEntity, book_url: str) -> None:
+        """书籍处理完毕，写回其变量并从内存中释放"""
+        with self._lock:
+            variables = self._books.pop((source.url, book_url), None)
+            if variables is not None:
+                self._store(source.url, book_url, variables)
+                self._commit()
+
+    def save(self) -> None:
+        """把内存中的全部变量写入数据库"""
+        with self._lock:
+            for url, variables in self._sources.items():
+                self._store(url, "", variables)
+            for (url, book_url), variables in self._books.items():
+                self._store(url, book_url, variables)
+            self._commit()
+
+    def close(self) -> None:
+        """保存并关闭数据库"""
+        self.save()
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def _source_map(self, url: str) -> Dict[str, str]:
+        variables = self._sources.get(url)
+        if variables is None:
+            variables = self._sources[url] = self._load(url, "")
+        return variables
+
+    def _load(self, url: str, book_url: str) -> Dict[str, str]:
+        if self._db is None:
+            return {}
+        row = self._db.execute("SELECT data FROM variables WHERE source = ? AND book = ?", (url, book_url)).fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def _store(self, url: str, book_url: str, variables: Dict[str, str]) -> None:
+        if self._db is None:
+            return
+        if variables:
+            self._db.execute("INSERT OR REPLACE INTO variables (source, book, data) VALUES (?, ?, ?)",
+                             (url, book_url, json.dumps(variables, ensure_ascii=False)))
+        else:
+            self._db.execute("DELETE FROM variables WHERE source = ? AND book = ?", (url, book_url))
+
+    def _commit(self) -> None:
+        if self._db is not None:
+            self._db.commit()
@@ -0,0 +1,313 @@
+import json
+import re
+from typing import Any, Callable, Dict, List, MutableMapping, Optional
+from urllib.parse import urljoin
+
+from .rule_compiler import compile_rule
+from .rule_dom import Document, Element
+from .rule_js import JsError, get_js_pool
+from .rule_jsonpath import JsonPathError, compile_path, parse_json
+from .rule_program import (Format, Get, GroupRef, Join, Js, JsonPath, Literal, Node, Pipeline, Program, Put, Regex,
+                           Replace, Selector, XPath)
+from .rule_regex import compile_regex, compile_replace
+from .rule_selector import select_elements, select_strings
+from .rule_xpath import compile_xpath
+
+class RuleEvaluationError(Exception):
+    pass
+
+
+class AnalyzeRule:
+    """
+    规则执行器，直接遍历编译后的规则程序
+
+    同一个执行器中的 HTML 与 JSON 文本只解析一次，之后的规则共用解析结果与其索引。
+    get_string 与 get_string_list 中默认语法规则的最后一段作为取值规则，
+    get_elements 中则全部作为元素选择。
+
+    参数:
+        content: 待解析的内容，通常是响应文本
+        base_url: 用于补全相对地址的页面地址
+        variables: @put 写入、@get 读取的变量表，通常是 legado_variables.VariableScope
+    """
+
+    def __init__(self, content: Any, base_url: str = "",
+                 variables: Optional[MutableMapping[str, str]] = None) -> None:
+        self.content = content
+        self.base_url = base_url
+        self.variables: MutableMapping[str, str] = {} if variables is None else variables
+        self.as_strings = False
+        self._documents: Dict[str, Document] = {}
+        self._json: Dict[str, Any] = {}
+
+    def program(self, rule: str, content: Any) -> Program:
+        """取得规则的编译结果，内容为 JSON 时默认语法按 JSONPath 处理"""
+        return compile_rule(rule, False, is_json_content(content)).program
+
+    def get_elements(self, rule: str, content: Any = None) -> List[Any]:
+        """
+        获取规则匹配的元素列表
+
+        参数:
+            rule: 规则文本
+            content: 解析对象，默认为构造时传入的内容
+
+        返回:
+            元素列表，规则以 - 开头时倒序
+        """
+        return self._run(rule, content, False)
+
+    def get_string_list(self, rule: str, content: Any = None, is_url: bool = False) -> List[str]:
+        """获取规则匹配的字符串列表，is_url 为 True 时补全为绝对地址"""
+        values = [to_string(item) for item in self._run(rule, content, True)]
+        if is_url:
+            return [self.absolute_url(item) for item in values if item]
+        return values
+
+    def get_string(self, rule: str, content: Any = None, is_url: bool = False) -> str:
+        """获取规则匹配的字符串，多个结果以换行连接"""
+        value = "\n".join(to_string(item) for item in self._run(rule, content, True)).strip()
+        if is_url:
+            return self.absolute_url(value) if value else ""
+        return value
+
+    def absolute_url(self, url: str) -> str:
+        return urljoin(self.base_url, url) if self.base_url else url
+
+    def document(self, html: str) -> Document:
+        """解析 HTML 文本，同一文本只解析一次"""
+        document = self._documents.get(html)
+        if document is None:
+            document = self._documents[html] = Document(html, self.base_url)
+        return document
+
+    def json(self, text: str) -> Any:
+        """解析 JSON 文本，同一文本只解析一次"""
+        try:
+            return self._json[text]
+        except KeyError:
+            data = self._json[text] = parse_json(text)
+            return data
+
+    def _run(self, rule: str, content: Any, as_strings: bool) -> List[Any]:
+        content = self.content if content is None else content
+        if not rule:
+            return []
+        program = self.program(rule, content)
+        previous, self.as_strings = self.as_strings, as_strings
+        try:
+            result = self.evaluate(program.root, content)
+        finally:
+            self.as_strings = previous
+        if program.reverse:
+            result.reverse()
+        return result
+
+    def evaluate(self, node: Node, content: Any) -> List[Any]:
+        """执行单个节点，返回结果列表"""
+        handler = _HANDLERS.get(type(node))
+        if handler is None:
+            raise RuleEvaluationError(f"暂不支持的规则类型: {type(node).__name__}")
+        return handler(self, node, content)
+
+
+def is_json_content(content: Any) -> bool:
+    """判断内容是否为 JSON，决定没有前缀的规则按哪种语法执行"""
+    if isinstance(content, str):
+        return content.lstrip()[:1] in ("{", "[")
+    if isinstance(content, dict):
+        return True
+    return isinstance(content, list) and bool(content) and isinstance(content[0], (dict, list))
+
+
+def to_string(value: Any) -> str:
+    """把执行结果转换为字符串"""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, re.Match):
+        return value.group(0)
+    if isinstance(value, Element):
+        return value.outer_html()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _unwrap(result: List[Any]) -> Any:
+    return result[0] if len(result) == 1 else result
+
+
+def _eval_pipeline(analyzer: AnalyzeRule, node: Pipeline, content: Any) -> List[Any]:
+    result: List[Any] = []
+    value = content
+    for step in node.steps:
+        result = analyzer.evaluate(step, value)
+        if not result:
+            return []
+        value = _unwrap(result)
+    return result
+
+
+def _eval_join(analyzer: AnalyzeRule, node: Join, content: Any) -> List[Any]:
+    if node.op == "||":
+        for operand in node.operands:
+            result = analyzer.evaluate(operand, content)
+            if result and any(to_string(item) for item in result):
+                return result
+        return []
+
+    results = [analyzer.evaluate(operand, content) for operand in node.operands]
+    if node.op == "&&":
+        return [item for result in results for item in result]
+
+    # %% 依次交替取各规则的结果
+    merged: List[Any] = []
+    for index in range(max((len(result) for result in results), default=0)):
+        merged.extend(result[index] for result in results if index < len(result))
+    return merged
+
+
+def _eval_literal(analyzer: AnalyzeRule, node: Literal, content: Any) -> List[Any]:
+    return [node.text]
+
+
+def _eval_format(analyzer: AnalyzeRule, node: Format, content: Any) -> List[Any]:
+    return [render_format(analyzer, node, content)]
+
+
+def render_format(analyzer: AnalyzeRule, node: Format, content: Any) -> str:
+    """渲染模板节点"""
+    pieces: List[str] = []
+    for part in node.parts:
+        if isinstance(part, Literal):
+            pieces.append(part.text)
+        elif isinstance(part, GroupRef):
+            pieces.append(_group(content, part.index))
+        elif isinstance(part, Get):
+            pieces.append(analyzer.variables.get(part.key, ""))
+        else:
+            pieces.append("\n".join(to_string(item) for item in analyzer.evaluate(part, content)))
+    return "".join(pieces)
+
+
+def _group(content: Any, index: int) -> str:
+    if isinstance(content, re.Match) and index <= (content.re.groups or 0):
+        return content.group(index) or ""
+    return ""
+
+
+def _eval_group(analyzer: AnalyzeRule, node: GroupRef, content: Any) -> List[Any]:
+    return [_group(content, node.index)]
+
+
+def _eval_get(analyzer: AnalyzeRule, node: Get, content: Any) -> List[Any]:
+    return [analyzer.variables.get(node.key, "")]
+
+
+def _eval_put(analyzer: AnalyzeRule, node: Put, content: Any) -> List[Any]:
+    for key, value in node.entries:
+        analyzer.variables[key] = "\n".join(to_string(item) for item in analyzer.evaluate(value, content))
+    return [content]
+
+
+def _scope(analyzer: AnalyzeRule, content: Any) -> Any:
+    """把内容转换为 DOM 上的起始元素，文本按需解析且每个执行器只解析一次"""
+    if isinstance(content, list):
+        return [item if isinstance(item, Element) else analyzer.document(to_string(item)).root for item in content]
+    if isinstance(content, Element):
+        return content
+    if isinstance(content, Document):
+        return content.root
+    return analyzer.document(to_string(content)).root
+
+
+def _eval_selector(analyzer: AnalyzeRule, node: Selector, content: Any) -> List[Any]:
+    scope = _scope(analyzer, content)
+    if analyzer.as_strings:
+        return select_strings(scope, node.rule, node.css)
+    return select_elements(scope, node.rule, node.css)
+
+
+def _eval_xpath(analyzer: AnalyzeRule, node: XPath, content: Any) -> List[Any]:
+    scope = _scope(analyzer, content)
+    path = compile_xpath(node.path)
+    if isinstance(scope, list):
+        return [item for element in scope for item in path.select(element)]
+    return path.select(scope)
+
+
+def _eval_jsonpath(analyzer: AnalyzeRule, node: JsonPath, content: Any) -> List[Any]:
+    if isinstance(content, str):
+        try:
+            content = analyzer.json(content)
+        except JsonPathError:
+            return []
+    elif isinstance(content, Element):
+        return []
+    return compile_path(node.path).read(content)
+
+
+def _eval_js(analyzer: AnalyzeRule, node: Js, content: Any) -> List[Any]:
+    """执行脚本，result 为当前内容，baseUrl 为页面地址，src 为原始响应文本"""
+    bindings = {"result": _js_value(content), "baseUrl": analyzer.base_url}
+    if isinstance(analyzer.content, str):
+        bindings["src"] = analyzer.content
+    try:
+        value = get_js_pool().evaluate(node.code, bindings, analyzer, content)
+    except JsError as e:
+        raise RuleEvaluationError(f"JavaScript 执行失败: {e}") from e
+    if value is None:
+        return []
+    return value if isinstance(value, list) else [value]
+
+
+def _js_value(value: Any) -> Any:
+    """把内容转换为可以传给脚本的 JSON 值，元素与正则匹配转换为文本"""
+    if isinstance(value, list):
+        return [_js_value(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool, dict)):
+        return value
+    return to_string(value)
+
+
+def _eval_regex(analyzer: AnalyzeRule, node: Regex, content: Any) -> List[Any]:
+    return list(compile_regex(node.pattern).finditer(to_string(content)))
+
+
+def _eval_replace(analyzer: AnalyzeRule, node: Replace, content: Any) -> List[Any]:
+    if isinstance(content, list):
+        return [replace_regex(to_string(item), node) for item in content]
+    return [replace_regex(to_string(content), node)]
+
+
+def replace_regex(text: str, node: Replace) -> str:
+    """
+    执行 ##正则##替换内容 后缀
+
+    替换内容中的 $1 按 Java 的写法引用分组；### 只保留第一个匹配替换后的结果；
+    正则无效时按普通文本替换。正则只编译一次，执行超时按没有匹配处理。
+    """
+    return compile_replace(node.pattern, node.replacement, node.first_only).apply(text)
+
+
+_HANDLERS: Dict[type, Callable[[AnalyzeRule, Any, Any], List[Any]]] = {
+    Pipeline: _eval_pipeline,
+    Join: _eval_join,
+    Literal: _eval_literal,
+    Format: _eval_format,
+    GroupRef: _eval_group,
+    Get: _eval_get,
+    Put: _eval_put,
+    Js: _eval_js,
+    Regex: _eval_regex,
+    Selector: _eval_selector,
+    JsonPath: _eval_jsonpath,
+    XPath: _eval_xpath,
+    Replace: _eval_replace,
+}
@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from threading import Lock
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .rule_program import Program, compile_program
+from .rule_tokenizer import tokenizer
+from .rule_type import RuleType, get_rule_type, get_rule_type_for_group
+
+# 默认缓存的规则条数
+DEFAULT_RULE_CACHE_SIZE = 4096
+
+
+@dataclass(frozen=True)
+class CompiledRule:
+    """
+    编译后的规则，分词结果与各语法单元的规则类型只计算一次
+
+    属性:
+        text: 原始规则文本
+        tokens: tokenizer 的分词结果
+        types: 各语法单元对应的 get_rule_type 结果
+        group_types: 各语法单元对应的 get_rule_type_for_group 结果
+        has_end_rule: 编译时使用的 hasEndRule 参数
+        content_is_json: 编译时使用的 contentIsJson 参数
+        program: 规则编译得到的语法树
+    """
+    text: str
+    tokens: Tuple[str, ...]
+    types: Tuple[RuleType, ...]
+    group_types: Tuple[RuleType, ...]
+    has_end_rule: bool = False
+    content_is_json: bool = False
+    program: Optional[Program] = None
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+
+def build_rule(text: str, hasEndRule: bool = False, contentIsJson: bool = False) -> CompiledRule:
+    """
+    不经过缓存直接编译规则
+
+    参数:
+        text: 规则文本
+        hasEndRule: 规则是否带结束规则
+        contentIsJson: 内容是否为 JSON
+
+    返回:
+        编译后的规则
+    """
+    tokens = tokenizer(text)
+    types = tuple(get_rule_type(tokens, i, hasEndRule, contentIsJson) for i in range(len(tokens)))
+    group_types = tuple(get_rule_type_for_group(tokens, i) for i in range(len(tokens)))
+    program = compile_program(text, contentIsJson)
+    return CompiledRule(text, tuple(tokens), types, group_types, hasEndRule, contentIsJson, program)
+
+
+# 未命中时先于编译查询的规则来源，参数与 build_rule 相同，找不到时返回 None
+RuleLoader = Callable[[str, bool, bool], Optional[CompiledRule]]
+
+
+class RuleCache:
+    """
+    进程内的规则编译缓存，按最近最少使用淘汰
+
+    未命中时先依次查询 add_loader 注册的规则来源（例如书源快照），都找不到时才重新编译。
+
+    参数:
+        maxsize: 最多缓存的规则条数，为 0 时不缓存
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_RULE_CACHE_SIZE) -> None:
+        if maxsize < 0:
+            raise ValueError(f"缓存大小不能为负数: {maxsize}")
+        self._maxsize = maxsize
+        self._data: "OrderedDict[Tuple[str, bool, bool], CompiledRule]" = OrderedDict()
+        self._lock = Lock()
+        self._loaders: List[RuleLoader] = []
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+
+    @property
+    def maxsize(self) -> int:
+        return self._maxsize
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, text: str, hasEndRule: bool = False, contentIsJson: bool = False) -> CompiledRule:
+        """获取编译后的规则，未命中时编译并写入缓存"""
+        key = (text, hasEndRule, contentIsJson)
+        with self._lock:
+            rule = self._data.get(key)
+            if rule is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return rule
+            self.misses += 1
+
+        # 加载与编译过程不持有锁，并发处理同一条规则时结果相同，后写入者覆盖即可
+        for loader in tuple(self._loaders):
+            rule = loader(text, hasEndRule, contentIsJson)
+            if rule is not None:
+                with self._lock:
+                    self.loaded += 1
+                break
+        else:
+            rule = build_rule(text, hasEndRule, contentIsJson)
+        self.put(rule)
+        return rule
+
+    def add_loader(self, loader: RuleLoader) -> None:
+        """注册未命中时查询的规则来源"""
+        with self._lock:
+            self._loaders.append(loader)
+
+    def remove_loader(self, loader: RuleLoader) -> None:
+        """移除规则来源，未注册时忽略"""
+        with self._lock:
+            if loader in self._loaders:
+                self._loaders.remove(loader)
+
+    def put(self, rule: CompiledRule) -> None:
+        """写入已编译的规则，例如从快照中恢复"""
+        if not self._maxsize:
+            return
+        key = (rule.text, rule.has_end_rule, rule.content_is_json)
+        with self._lock:
+            self._data[key] = rule
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def resize(self, maxsize: int) -> None:
+        """调整缓存大小，超出部分按最近最少使用淘汰"""
+        if maxsize < 0:
+            raise ValueError(f"缓存大小不能为负数: {maxsize}")
+        with self._lock:
+            self._maxsize = maxsize
+            while len(self._data) > maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """清空缓存与命中统计"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.loaded = 0
+
+    def info(self) -> Dict[str, int]:
+        """返回缓存统计信息"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "loaded": self.loaded,
+                "size": len(self._data),
+                "maxsize": self._maxsize,
+            }
+
+
+_rule_cache = RuleCache()
+
+
+def compile_rule(text: str, hasEndRule: bool = False, contentIsJson: bool = False) -> CompiledRule:
+    """
+    通过进程级缓存编译规则
+
+    参数:
+        text: 规则文本
+        hasEndRule: 规则是否带结束规则
+        contentIsJson: 内容是否为 JSON
+
+    返回:
+        编译后的规则，相同参数多次调用返回同一对象
+    """
+    return _rule_cache.get(text, hasEndRule, contentIsJson)
+
+
+def get_rule_cache() -> RuleCache:
+    """返回进程级规则缓存"""
+    return _rule_cache
+
+
+def set_rule_cache_size(maxsize: int) -> None:
+    """调整进程级规则缓存的大小"""
+    _rule_cache.resize(maxsize)
+
+
+def rule_cache_info() -> Dict[str, int]:
+    """返回进程级规则缓存的统计信息"""
+    return _rule_cache.info()
+
+
+def clear_rule_cache() -> None:
+    """清空进程级规则缓存"""
+    _rule_cache.clear()
@@ -0,0 +1,618 @@
+import re
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+from html import escape
+from html.parser import HTMLParser
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urljoin
+
+# 没有结束标签的元素
+VOID_TAGS = frozenset({
+    "area", "base", "br", "col", "embed", "hr", "img", "input", "keygen", "link", "meta", "param", "source",
+    "track", "wbr",
+})
+# 计算 text() 时前后补空格的块级元素
+BLOCK_TAGS = frozenset({
+    "address", "article", "aside", "blockquote", "dd", "div", "dl", "dt", "fieldset", "figcaption", "figure",
+    "footer", "form", "h1", "h2", "h3", "h4", "h5", "h6", "header", "hr", "li", "main", "nav", "ol", "p", "pre",
+    "section", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "ul",
+})
+# 内容不参与 text() 的元素
+DATA_TAGS = frozenset({"script", "style"})
+# 打开这些元素时，未关闭的 <p> 会被隐式关闭
+_CLOSES_P = BLOCK_TAGS - {"li", "dd", "dt", "td", "th", "tr", "tbody", "thead", "tfoot"}
+# 打开键对应的元素时隐式关闭值中的元素，遇到边界元素为止
+_IMPLIED_END = {
+    "li": ({"li"}, {"ul", "ol"}),
+    "dt": ({"dt", "dd"}, {"dl"}),
+    "dd": ({"dt", "dd"}, {"dl"}),
+    "tr": ({"tr", "td", "th"}, {"table", "tbody", "thead", "tfoot"}),
+    "td": ({"td", "th"}, {"tr", "table"}),
+    "th": ({"td", "th"}, {"tr", "table"}),
+    "option": ({"option"}, {"select", "datalist"}),
+    "tbody": ({"tbody", "thead", "tfoot", "tr", "td", "th"}, {"table"}),
+    "tfoot": ({"tbody", "thead", "tr", "td", "th"}, {"table"}),
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class SelectorError(Exception):
+    pass
+
+
+class Element:
+    """
+    HTML 元素
+
+    children 中依次保存子元素与文本（str），elements 只保存子元素。
+    pos 为元素在文档中的先序编号，end 为最后一个后代的编号，
+    因此 pos < other.pos <= end 即表示 other 是后代。
+    """
+    __slots__ = ("tag", "attrs", "children", "elements", "parent", "document", "pos", "end", "sibling_index")
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["Element"], document: "Document") -> None:
+        self.tag = tag
+        self.attrs = attrs
+        self.children: List[Union["Element", str]] = []
+        self.elements: List["Element"] = []
+        self.parent = parent
+        self.document = document
+        self.pos = 0
+        self.end = 0
+        self.sibling_index = 0
+
+    def __repr__(self) -> str:
+        return f"<Element {self.tag} pos={self.pos}>"
+
+    @property
+    def classes(self) -> List[str]:
+        return self.attrs.get("class", "").split()
+
+    def attr(self, name: str) -> str:
+        """属性值，abs: 前缀表示按文档地址补全为绝对地址"""
+        if name.startswith("abs:"):
+            value = self.attrs.get(name[4:], "")
+            return urljoin(self.document.base_url, value) if value and self.document.base_url else value
+        return self.attrs.get(name, "")
+
+    def iter_descendants(self) -> Iterator["Element"]:
+        """按文档顺序遍历后代元素，不含自身"""
+        return iter(self.document.elements[self.pos + 1:self.end + 1])
+
+    def text(self) -> str:
+        """所有后代文本，空白合并为一个空格，块级元素与 <br> 之间以空格分隔"""
+        pieces: List[str] = []
+        _collect_text(self, pieces)
+        return _WHITESPACE.sub(" ", "".join(pieces)).strip()
+
+    def own_text(self) -> str:
+        """直接子文本，不含子元素中的文本"""
+        pieces = []
+        for child in self.children:
+            if isinstance(child, str):
+                pieces.append(child)
+            elif child.tag == "br":
+                pieces.append(" ")
+        return _WHITESPACE.sub(" ", "".join(pieces)).strip()
+
+    def text_nodes(self) -> List[str]:
+        """直接子文本节点"""
+        return [child for child in self.children if isinstance(child, str)]
+
+    def inner_html(self, skip: Iterable[str] = ()) -> str:
+        pieces: List[str] = []
+        for child in self.children:
+            _serialize(child, pieces, frozenset(skip), self.tag in DATA_TAGS)
+        return "".join(pieces)
+
+    def outer_html(self, skip: Iterable[str] = ()) -> str:
+        """序列化为 HTML，skip 中的元素（例如 script、style）不输出"""
+        pieces: List[str] = []
+        _serialize(self, pieces, frozenset(skip), False)
+        return "".join(pieces)
+
+    def select(self, selector: str) -> List["Element"]:
+        """按 CSS 选择器查找元素，结果包含匹配的自身，按文档顺序排列"""
+        return select(self, selector)
+
+
+def _collect_text(element: Element, pieces: List[str]) -> None:
+    for child in element.children:
+        if isinstance(child, str):
+            pieces.append(child)
+        elif child.tag == "br":
+            pieces.append(" ")
+        elif child.tag not in DATA_TAGS:
+            block = child.tag in BLOCK_TAGS
+            if block:
+                pieces.append(" ")
+            _collect_text(child, pieces)
+            if block:
+                pieces.append(" ")
+
+
+def _serialize(node: Union[Element, str], pieces: List[str], skip: frozenset, raw: bool) -> None:
+    if isinstance(node, str):
+        pieces.append(node if raw else escape(node, quote=False))
+        return
+    if node.tag in skip:
+        return
+    pieces.append("<" + node.tag)
+    for name, value in node.attrs.items():
+        pieces.append(f' {name}="{escape(value)}"')
+    pieces.append(">")
+    if node.tag in VOID_TAGS:
+        return
+    data = node.tag in DATA_TAGS
+    for child in node.children:
+        _serialize(child, pieces, skip, data)
+    pieces.append(f"</{node.tag}>")
+
+
+class Document:
+    """
+    解析后的 HTML 文档
+
+    按标签、class 与 id 的索引在第一次使用时一次性建立，之后同一文档上的
+    所有规则都通过索引与先序编号的二分查找定位候选元素，不再遍历整棵树。
+    """
+
+    def __init__(self, html: str, base_url: str = "") -> None:
+        self.base_url = base_url
+        self.root = Element("#root", {}, None, self)
+        self.elements: List[Element] = [self.root]
+        self._by_tag: Optional[Dict[str, List[Element]]] = None
+        self._by_class: Optional[Dict[str, List[Element]]] = None
+        self._by_id: Optional[Dict[str, List[Element]]] = None
+        _TreeBuilder(self).build(html)
+
+    def __repr__(self) -> str:
+        return f"<Document elements={len(self.elements) - 1}>"
+
+    def by_tag(self, tag: str, scope: Optional[Element] = None) -> List[Element]:
+        """scope 子树（含自身）中指定标签的元素"""
+        if self._by_tag is None:
+            self._build_indexes()
+        return _within(self._by_tag.get(tag.lower(), []), scope)
+
+    def by_class(self, name: str, scope: Optional[Element] = None) -> List[Element]:
+        """scope 子树（含自身）中带有指定 class 的元素"""
+        if self._by_class is None:
+            self._build_indexes()
+        return _within(self._by_class.get(name, []), scope)
+
+    def by_id(self, name: str, scope: Optional[Element] = None) -> List[Element]:
+        """scope 子树（含自身）中指定 id 的元素"""
+        if self._by_id is None:
+            self._build_indexes()
+        return _within(self._by_id.get(name, []), scope)
+
+    def subtree(self, scope: Element) -> List[Element]:
+        """scope 及其全部后代"""
+        return self.elements[scope.pos:scope.end + 1]
+
+    def _build_indexes(self) -> None:
+        by_tag: Dict[str, List[Element]] = {}
+        by_class: Dict[str, List[Element]] = {}
+        by_id: Dict[str, List[Element]] = {}
+        for element in self.elements[1:]:
+            by_tag.setdefault(element.tag, []).append(element)
+            attrs = element.attrs
+            if "class" in attrs:
+                for name in dict.fromkeys(attrs["class"].split()):
+                    by_class.setdefault(name, []).append(element)
+            if "id" in attrs:
+                by_id.setdefault(attrs["id"], []).append(element)
+        self._by_tag, self._by_class, self._by_id = by_tag, by_class, by_id
+
+
+def _position(element: Element) -> int:
+    return element.pos
+
+
+def _within(items: List[Element], scope: Optional[Element]) -> List[Element]:
+    if scope is None or scope.pos == 0:
+        return items
+    start = bisect_left(items, scope.pos, key=_position)
+    stop = bisect_right(items, scope.end, lo=start, key=_position)
+    return items[start:stop]
+
+
+class _TreeBuilder(HTMLParser):
+    """按宽松的 HTML 规则建树：自动闭合空元素与可省略结束标签的元素，忽略无法匹配的结束标签"""
+
+    def __init__(self, document: Document) -> None:
+        super().__init__(convert_charrefs=True)
+        self.document = document
+        self.stack: List[Element] = [document.root]
+
+    def build(self, html: str) -> None:
+        self.feed(html)
+        self.close()
+        while len(self.stack) > 1:
+            self._pop()
+        self.document.root.end = len(self.document.elements) - 1
+
+    def handle_starttag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self._open(tag, attrs, tag in VOID_TAGS)
+
+    def handle_startendtag(self, tag: str, attrs: List[Tuple[str, Optional[str]]]) -> None:
+        self._open(tag, attrs, True)
+
+    def handle_endtag(self, tag: str) -> None:
+        for depth in range(len(self.stack) - 1, 0, -1):
+            if self.stack[depth].tag == tag:
+                while len(self.stack) > depth:
+                    self._pop()
+                return
+        if tag == "p":
+            # 与浏览器一致，孤立的 </p> 视为空段落
+            self._open("p", [], True)
+        elif tag == "br":
+            self._open("br", [], True)
+
+    def handle_data(self, data: str) -> None:
+        parent = self.stack[-1]
+        children = parent.children
+        if children and isinstance(children[-1], str):
+            children[-1] += data
+        else:
+            children.append(data)
+
+    def _open(self, tag: str, attrs: List[Tuple[str, Optional[str]]], void: bool) -> None:
+        self._close_implied(tag)
+        document = self.document
+        parent = self.stack[-1]
+        element = Element(tag, {name: value or "" for name, value in attrs}, parent, document)
+        element.pos = len(document.elements)
+        element.sibling_index = len(parent.elements)
+        document.elements.append(element)
+        parent.children.append(element)
+        parent.elements.append(element)
+        if void:
+            element.end = element.pos
+        else:
+            self.stack.append(element)
+
+    def _close_implied(self, tag: str) -> None:
+        if tag in _CLOSES_P:
+            self._close_until({"p"}, {"div", "td", "th", "li", "table", "button"})
+        implied = _IMPLIED_END.get(tag)
+        if implied is not None:
+            self._close_until(*implied)
+
+    def _close_until(self, targets: set, boundaries: set) -> None:
+        for depth in range(len(self.stack) - 1, 0, -1):
+            tag = self.stack[depth].tag
+            if tag in targets:
+                while len(self.stack) > depth:
+                    self._pop()
+                return
+            if tag in boundaries:
+                return
+
+    def _pop(self) -> None:
+        element = self.stack.pop()
+        element.end = len(self.document.elements) - 1
+
+
+def parse_html(html: str, base_url: str = "") -> Document:
+    """解析 HTML 文本"""
+    return Document(html, base_url)
+
+
+# ---------------------------------------------------------------------------
+# CSS 选择器
+# ---------------------------------------------------------------------------
+
+@dataclass(frozen=True, slots=True)
+class Compound:
+    """不含组合符的简单选择器序列，例如 div.a#b[href]:eq(0)"""
+    tag: Optional[str] = None
+    id: Optional[str] = None
+    classes: Tuple[str, ...] = ()
+    attrs: Tuple[Tuple[str, str, str], ...] = ()
+    pseudos: Tuple[Tuple[str, object], ...] = ()
+
+
+# 选择器链按从左到右保存，每一项的组合符表示它与前一项的关系，第一项的组合符为空
+Chain = Tuple[Tuple[str, Compound], ...]
+
+_IDENT = re.compile(r"-?(?:[\w\-]|\\.)+", re.UNICODE)
+_ATTR = re.compile(r"\[\s*([^\s~|^$*!=\]]+)\s*(?:([~|^$*!]?=)\s*(\"[^\"]*\"|'[^']*'|[^\]]*?)\s*)?\]")
+_NTH = re.compile(r"^\s*(?:(odd)|(even)|([+-]?\d*)n\s*(?:([+-])\s*(\d+))?|([+-]?\d+))\s*$", re.IGNORECASE)
+
+
+@lru_cache(maxsize=2048)
+def compile_selector(selector: str) -> Tuple[Chain, ...]:
+    """把 CSS 选择器编译为以逗号分隔的选择器链"""
+    return tuple(_parse_chain(part) for part in _split_top(selector, ","))
+
+
+def _split_top(text: str, separator: str) -> List[str]:
+    """在括号、方括号与引号之外按分隔符拆分"""
+    parts, depth, quote, start = [], 0, "", 0
+    for index, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = ""
+        elif char in "\"'":
+            quote = char
+        elif char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == separator and depth == 0:
+            parts.append(text[start:index])
+            start = index + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+
+def _parse_chain(text: str) -> Chain:
+    chain: List[Tuple[str, Compound]] = []
+    combinator = ""
+    cursor, length = 0, len(text)
+    while cursor < length:
+        char = text[cursor]
+        if char.isspace():
+            cursor += 1
+            if chain and not combinator:
+                combinator = " "
+            continue
+        if char in ">+~":
+            combinator = char
+            cursor += 1
+            continue
+        compound, cursor = _parse_compound(text, cursor)
+        chain.append((combinator if chain else "", compound))
+        combinator = ""
+    if not chain or combinator.strip():
+        raise SelectorError(f"无效的选择器: {text}")
+    return tuple(chain)
+
+
+def _parse_compound(text: str, cursor: int) -> Tuple[Compound, int]:
+    tag = id_ = None
+    classes: List[str] = []
+    attrs: List[Tuple[str, str, str]] = []
+    pseudos: List[Tuple[str, object]] = []
+    start, length = cursor, len(text)
+
+    if text[cursor] == "*":
+        cursor += 1
+    else:
+        matcher = _IDENT.match(text, cursor)
+        if matcher:
+            tag = matcher.group(0).lower()
+            cursor = matcher.end()
+
+    while cursor < length:
+        char = text[cursor]
+        if char in ".#":
+            matcher = _IDENT.match(text, cursor + 1)
+            if not matcher:
+                raise SelectorError(f"无效的选择器: {text}")
+            if char == ".":
+                classes.append(matcher.group(0))
+            else:
+                id_ = matcher.group(0)
+            cursor = matcher.end()
+        elif char == "[":
+            matcher = _ATTR.match(text, cursor)
+            if not matcher:
+                raise SelectorError(f"无效的属性选择器: {text}")
+            name, op, value = matcher.group(1).lower(), matcher.group(2) or "", matcher.group(3) or ""
+            if value[:1] in "\"'" and value[-1:] == value[:1] and len(value) > 1:
+                value = value[1:-1]
+            attrs.append((name, op, value))
+            cursor = matcher.end()
+        elif char == ":":
+            matcher = _IDENT.match(text, cursor + 1)
+            if not matcher:
+                raise SelectorError(f"无效的伪类: {text}")
+            name = matcher.group(0).lower()
+            cursor = matcher.end()
+            argument = None
+            if cursor < length and text[cursor] == "(":
+                depth, index = 1, cursor + 1
+                while index < length and depth:
+                    depth += {"(": 1, ")": -1}.get(text[index], 0)
+                    index += 1
+                argument = text[cursor + 1:index - 1].strip()
+                cursor = index
+            pseudos.append((name, _pseudo_argument(name, argument)))
+        else:
+            break
+
+    if cursor == start:
+        raise SelectorError(f"无效的选择器: {text}")
+    return Compound(tag, id_, tuple(classes), tuple(attrs), tuple(pseudos)), cursor
+
+
+def _pseudo_argument(name: str, argument: Optional[str]) -> object:
+    if name in ("nth-child", "nth-last-child", "nth-of-type", "nth-last-of-type"):
+        matcher = _NTH.match(argument or "")
+        if not matcher:
+            raise SelectorError(f"无效的 {name} 参数: {argument}")
+        odd, even, a, sign, b, single = matcher.groups()
+        if odd:
+            return 2, 1
+        if even:
+            return 2, 0
+        if single is not None:
+            return 0, int(single)
+        step = -1 if a == "-" else int(a) if a not in ("", "+") else 1
+        offset = int(b) if b else 0
+        return step, -offset if sign == "-" else offset
+    if name in ("eq", "lt", "gt"):
+        try:
+            return int(argument or "")
+        except ValueError:
+            raise SelectorError(f"无效的 :{name} 参数: {argument}") from None
+    if name in ("not", "has", "is"):
+        return compile_selector(argument or "")
+    if name in ("contains", "containsown"):
+        return (argument or "").strip("\"'").lower()
+    if name in ("matches", "matchesown"):
+        return re.compile((argument or "").strip("\"'"))
+    return argument
+
+
+def select(scope: Element, selector: str) -> List[Element]:
+    """在 scope 子树（含自身）中按 CSS 选择器查找元素，结果按文档顺序排列且不重复"""
+    chains = compile_selector(selector)
+    if len(chains) == 1:
+        return _select_chain(scope, chains[0])
+    found: Dict[int, Element] = {}
+    for chain in chains:
+        for element in _select_chain(scope, chain):
+            found[element.pos] = element
+    return [found[pos] for pos in sorted(found)]
+
+
+def _select_chain(scope: Element, chain: Chain) -> List[Element]:
+    __, last = chain[-1]
+    document = scope.document
+    if last.id is not None:
+        candidates = document.by_id(last.id, scope)
+    elif last.classes:
+        candidates = document.by_class(last.classes[0], scope)
+    elif last.tag is not None:
+        candidates = document.by_tag(last.tag, scope)
+    else:
+        candidates = document.subtree(scope)
+    return [element for element in candidates
+            if element.pos and _matches(element, last) and _matches_left(element, chain, len(chain) - 1)]
+
+
+def matches(element: Element, selector: str) -> bool:
+    """判断元素是否匹配 CSS 选择器"""
+    return any(_matches(element, chain[-1][1]) and _matches_left(element, chain, len(chain) - 1)
+               for chain in compile_selector(selector))
+
+
+def _matches_left(element: Element, chain: Chain, index: int) -> bool:
+    if index == 0:
+        return True
+    combinator = chain[index][0]
+    target = chain[index - 1][1]
+    if combinator == ">":
+        parent = element.parent
+        return parent is not None and parent.pos != 0 and _matches(parent, target) \
+            and _matches_left(parent, chain, index - 1)
+    if combinator == " ":
+        parent = element.parent
+        while parent is not None and parent.pos != 0:
+            if _matches(parent, target) and _matches_left(parent, chain, index - 1):
+                return True
+            parent = parent.parent
+        return False
+    siblings = element.parent.elements
+    if combinator == "+":
+        position = element.sibling_index - 1
+        return position >= 0 and _matches(siblings[position], target) \
+            and _matches_left(siblings[position], chain, index - 1)
+    # ~
+    return any(_matches(sibling, target) and _matches_left(sibling, chain, index - 1)
+               for sibling in siblings[:element.sibling_index])
+
+
+def _matches(element: Element, compound: Compound) -> bool:
+    if compound.tag is not None and element.tag != compound.tag:
+        return False
+    attrs = element.attrs
+    if compound.id is not None and attrs.get("id") != compound.id:
+        return False
+    if compound.classes:
+        classes = attrs.get("class", "").split()
+        if any(name not in classes for name in compound.classes):
+            return False
+    for name, op, value in compound.attrs:
+        if name not in attrs:
+            return False
+        if op and not _match_attr(attrs[name], op, value):
+            return False
+    for name, argument in compound.pseudos:
+        if not _match_pseudo(element, name, argument):
+            return False
+    return True
+
+
+def _match_attr(actual: str, op: str, value: str) -> bool:
+    if op == "=":
+        return actual.lower() == value.lower()
+    if op == "!=":
+        return actual.lower() != value.lower()
+    if op == "^=":
+        return actual.lower().startswith(value.lower())
+    if op == "$=":
+        return actual.lower().endswith(value.lower())
+    if op == "*=":
+        return value.lower() in actual.lower()
+    if op == "~=":
+        return value in actual.split()
+    if op == "|=":
+        return actual == value or actual.startswith(value + "-")
+    return False
+
+
+def _nth(position: int, argument: Tuple[int, int]) -> bool:
+    step, offset = argument
+    if step == 0:
+        return position == offset
+    return (position - offset) % step == 0 and (position - offset) // step >= 0
+
+
+def _match_pseudo(element: Element, name: str, argument) -> bool:
+    parent = element.parent
+    siblings = parent.elements if parent is not None else [element]
+    index = element.sibling_index
+    if name == "first-child":
+        return index == 0
+    if name == "last-child":
+        return index == len(siblings) - 1
+    if name == "only-child":
+        return len(siblings) == 1
+    if name == "nth-child":
+        return _nth(index + 1, argument)
+    if name == "nth-last-child":
+        return _nth(len(siblings) - index, argument)
+    if name in ("nth-of-type", "nth-last-of-type", "first-of-type", "last-of-type"):
+        same = [sibling for sibling in siblings if sibling.tag == element.tag]
+        position = same.index(element)
+        if name == "first-of-type":
+            return position == 0
+        if name == "last-of-type":
+            return position == len(same) - 1
+        return _nth(position + 1 if name == "nth-of-type" else len(same) - position, argument)
+    # jsoup 扩展：按同级元素中的位置筛选
+    if name == "eq":
+        return index == argument
+    if name == "lt":
+        return index < argument
+    if name == "gt":
+        return index > argument
+    if name == "empty":
+        return not element.elements and not any(child.strip() for child in element.text_nodes())
+    if name == "root":
+        return parent is not None and parent.pos == 0
+    if name == "contains":
+        return argument in element.text().lower()
+    if name == "containsown":
+        return argument in element.own_text().lower()
+    if name == "matches":
+        return argument.search(element.text()) is not None
+    if name == "matchesown":
+        return argument.search(element.own_text()) is not None
+    if name == "not":
+        return not any(_matches(element, chain[-1][1]) and _matches_left(element, chain, len(chain) - 1)
+                       for chain in argument)
+    if name == "is":
+        return any(_matches(element, chain[-1][1]) and _matches_left(element, chain, len(chain) - 1)
+                   for chain in argument)
+    if name == "has":
+        return any(other.pos != element.pos for chain in argument for other in _select_chain(element, chain))
+    raise SelectorError(f"暂不支持的伪类: :{name}")
@@ -0,0 +1,397 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+from urllib.parse import quote_plus
+
+from .legado_http import Request, Transport, get_transport
+
+try:
+    # 可选依赖，未安装时 <js>、@js: 与 {{ }} 中的脚本无法执行
+    import quickjs
+except ImportError:
+    quickjs = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 进程级默认池中的上下文数
+DEFAULT_POOL_SIZE = 4
+# 单次执行的 CPU 时间上限（秒）
+DEFAULT_TIME_LIMIT = 5.0
+# 单个上下文的内存上限（字节）
+DEFAULT_MEMORY_LIMIT = 64 * 1024 * 1024
+# 单个上下文的栈大小上限（字节）
+DEFAULT_STACK_SIZE = 1024 * 1024
+# 单个上下文缓存的脚本数
+DEFAULT_SCRIPT_CACHE = 512
+
+# 出现这些错误后上下文的状态不可信，归还时丢弃
+_FATAL_ERRORS = ("interrupted", "out of memory", "stack overflow")
+
+# 一定经过脚本引擎的写法
+_JS_MARKER = re.compile(r"<js>|@js:|java\.|ajax", re.IGNORECASE)
+_EXPRESSION = re.compile(r"\{\{([\w\W]*?)\}\}")
+# {{ }} 中的变量名、页码运算与 JSONPath、XPath、@@ 规则开销很小，不必为此切换线程
+_CHEAP_EXPRESSION = re.compile(r"[\w\s+\-*/.]*|\s*[$@/][\w\W]*")
+
+# call_rules 在线程中执行规则时，java.ajax 使用的 (传输层, 书源, 事件循环)
+_ajax_target: "ContextVar[Optional[Tuple[Transport, Any, asyncio.AbstractEventLoop]]]" = \
+    ContextVar("legado_ajax_target", default=None)
+
+_PRELUDE = r"""
+var __legado_scripts = [];
+var __legado_bound = [];
+
+function __legado_call(id) {
+    var bindings = JSON.parse(__legado_input());
+    for (var i = 0; i < __legado_bound.length; i++) {
+        delete globalThis[__legado_bound[i]];
+    }
+    __legado_bound = Object.keys(bindings);
+    for (var key in bindings) {
+        globalThis[key] = bindings[key];
+    }
+    var value = __legado_scripts[id]();
+    return JSON.stringify({v: value === undefined ? null : value});
+}
+
+function __legado_statement(__legado_code) {
+    __legado_scripts.push(function () { return eval(__legado_code); });
+    return __legado_scripts.length - 1;
+}
+
+var java = {
+    ajax: function (url) { return __java_ajax(String(url)); },
+    base64Decode: function (str) { return __java_base64Decode(String(str)); },
+    base64Encode: function (str) { return __java_base64Encode(String(str)); },
+    encodeURI: function (str, charset) { return __java_encodeURI(String(str), charset ? String(charset) : "UTF-8"); },
+    get: function (key) { return __java_get(String(key)); },
+    getString: function (rule) { return __java_getString(String(rule)); },
+    getStringList: function (rule) { return JSON.parse(__java_getStringList(String(rule))); },
+    hexDecodeToString: function (hex) { return __java_hexDecodeToString(String(hex)); },
+    hexEncodeToString: function (str) { return __java_hexEncodeToString(String(str)); },
+    log: function (msg) { __java_log(String(msg)); return msg; },
+    md5Encode: function (str) { return __java_md5Encode(String(str)); },
+    md5Encode16: function (str) { return __java_md5Encode(String(str)).substring(8, 24); },
+    put: function (key, value) { __java_put(String(key), String(value)); return value; },
+    randomUUID: function () { return __java_randomUUID(); },
+    timeFormat: function (time) { return __java_timeFormat(Number(time)); }
+};
+"""
+
+
+class JsError(Exception):
+    pass
+
+
+class JsContext:
+    """
+    预先载入 java.* 辅助函数的 QuickJS 上下文，同一时间只能被一个线程使用
+
+    脚本按源码缓存：单个表达式编译为函数后直接调用，含语句的脚本在函数作用域内执行，
+    var 声明不会泄漏到下一次执行。
+
+    java.ajax 通过 call_rules 所在流程的传输层发送请求，并带上书源的请求头与 Cookie；
+    不经过 call_rules 执行时使用进程级默认传输层的 send_blocking。
+
+    参数:
+        time_limit: 单次执行的 CPU 时间上限（秒）
+        memory_limit: 内存上限（字节）
+        cache_size: 缓存的脚本数
+    """
+
+    def __init__(self,
+                 time_limit: float = DEFAULT_TIME_LIMIT,
+                 memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 cache_size: int = DEFAULT_SCRIPT_CACHE) -> None:
+        if quickjs is None:
+            raise JsError("未安装 quickjs，无法执行 JavaScript 规则")
+        self.cache_size = cache_size
+        self.broken = False
+        self._scripts: "OrderedDict[str, int]" = OrderedDict()
+        self._bindings = "{}"
+        self._analyzer = None
+        self._content = None
+
+        self._context = quickjs.Context()
+        self._context.set_memory_limit(memory_limit)
+        self._context.set_max_stack_size(DEFAULT_STACK_SIZE)
+        self._context.add_callable("__legado_input", lambda: self._bindings)
+        for name in ("ajax", "base64Decode", "base64Encode", "encodeURI", "get", "getString", "getStringList",
+                     "hexDecodeToString", "hexEncodeToString", "log", "md5Encode", "put", "randomUUID",
+                     "timeFormat"):
+            self._context.add_callable(f"__java_{name}", getattr(self, f"_java_{name}"))
+        self._context.eval(_PRELUDE)
+        # 载入辅助函数之后才限制时间，之后每次 eval 单独计时
+        self._context.set_time_limit(time_limit)
+
+    def run(self, code: str, bindings: Dict[str, Any], analyzer: Any = None, content: Any = None) -> Any:
+        """
+        执行脚本
+
+        参数:
+            code: 脚本源码，最后一个表达式的值作为结果
+            bindings: 作为全局变量注入的 result、baseUrl 等，必须可以序列化为 JSON
+            analyzer: java.getString、java.put 等使用的规则执行器
+            content: java.getString 解析的内容
+
+        返回:
+            脚本结果转换得到的 Python 值，undefined 与 null 为 None
+        """
+        try:
+            script = self._script(code)
+            self._bindings = json.dumps(bindings, ensure_ascii=False, default=str)
+            self._analyzer, self._content = analyzer, content
+            output = self._context.eval(f"__legado_call({script})")
+        except quickjs.JSException as e:
+            message = str(e)
+            self.broken = any(error in message for error in _FATAL_ERRORS)
+            raise JsError(message) from e
+        finally:
+            self._analyzer = self._content = None
+        return json.loads(output)["v"] if isinstance(output, str) else None
+
+    def _script(self, code: str) -> int:
+        script = self._scripts.get(code)
+        if script is not None:
+            self._scripts.move_to_end(code)
+            return script
+
+        expression = code.strip().rstrip(";").rstrip()
+        try:
+            script = self._context.eval(f"__legado_scripts.push(function () {{ return (\n{expression}\n); }}) - 1")
+        except quickjs.JSException:
+            script = self._context.eval(f"__legado_statement({json.dumps(code)})")
+        self._scripts[code] = script
+        if len(self._scripts) > self.cache_size:
+            __, evicted = self._scripts.popitem(last=False)
+            self._context.eval(f"__legado_scripts[{evicted}] = null")
+        return script
+
+    @staticmethod
+    def _java_ajax(url: str) -> str:
+        # 同步请求会让事件循环上的全部任务停下等待，这类规则应通过 call_rules 在线程中执行
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            raise JsError("java.ajax 不能在事件循环线程中执行")
+        target = _ajax_target.get()
+        if target is not None:
+            transport, source, loop = target
+            return asyncio.run_coroutine_threadsafe(transport.send(Request(url), source), loop).result().text
+        transport = get_transport()
+        if not hasattr(transport, "send_blocking"):
+            raise JsError("当前传输层不支持同步请求")
+        return transport.send_blocking(Request(url)).text
+
+    @staticmethod
+    def _java_base64Decode(text: str) -> str:
+        return base64.b64decode(text + "=" * (-len(text) % 4)).decode("utf-8", "replace")
+
+    @staticmethod
+    def _java_base64Encode(text: str) -> str:
+        return base64.b64encode(text.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _java_encodeURI(text: str, charset: str) -> str:
+        # 与 java.net.URLEncoder 一致，空格编码为 +
+        return quote_plus(text, safe="*", encoding=charset)
+
+    def _java_get(self, key: str) -> str:
+        return self._analyzer.variables.get(key, "") if self._analyzer is not None else ""
+
+    def _java_getString(self, rule: str) -> str:
+        return self._analyzer.get_string(rule, self._content) if self._analyzer is not None else ""
+
+    def _java_getStringList(self, rule: str) -> str:
+        values = self._analyzer.get_string_list(rule, self._content) if self._analyzer is not None else []
+        return json.dumps(values, ensure_ascii=False)
+
+    @staticmethod
+    def _java_hexDecodeToString(text: str) -> str:
+        return bytes.fromhex(text).decode("utf-8", "replace")
+
+    @staticmethod
+    def _java_hexEncodeToString(text: str) -> str:
+        return text.encode("utf-8").hex()
+
+    @staticmethod
+    def _java_log(message: str) -> None:
+        logger.debug("js: %s", message)
+
+    @staticmethod
+    def _java_md5Encode(text: str) -> str:
+        return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+    def _java_put(self, key: str, value: str) -> None:
+        if self._analyzer is not None:
+            self._analyzer.variables[key] = value
+
+    @staticmethod
+    def _java_randomUUID() -> str:
+        return str(uuid.uuid4())
+
+    @staticmethod
+    def _java_timeFormat(milliseconds: float) -> str:
+        return time.strftime("%Y/%m/%d %H:%M", time.localtime(milliseconds / 1000))
+
+
+class JsPool:
+    """
+    QuickJS 上下文池
+
+    上下文在首次使用时创建并一直复用，脚本缓存随上下文保留；全部上下文都在使用时等待归还。
+    脚本中通过 java.getString 等间接执行的脚本不受池大小限制，避免同一线程互相等待。
+
+    参数:
+        size: 最多同时存在的上下文数
+        time_limit: 单次执行的 CPU 时间上限（秒）
+        memory_limit: 单个上下文的内存上限（字节）
+        cache_size: 单个上下文缓存的脚本数
+    """
+
+    def __init__(self,
+                 size: int = DEFAULT_POOL_SIZE,
+                 time_limit: float = DEFAULT_TIME_LIMIT,
+                 memory_limit: int = DEFAULT_MEMORY_LIMIT,
+                 cache_size: int = DEFAULT_SCRIPT_CACHE) -> None:
+        self.size = max(1, size)
+        self.time_limit = time_limit
+        self.memory_limit = memory_limit
+        self.cache_size = cache_size
+        # 后进先出，优先复用刚用过、脚本缓存最热的上下文
+        self._idle: "queue.LifoQueue[Optional[JsContext]]" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.created = 0
+
+    def evaluate(self, code: str, bindings: Optional[Dict[str, Any]] = None, analyzer: Any = None,
+                 content: Any = None) -> Any:
+        """借出一个上下文执行脚本，参数与返回值同 JsContext.run"""
+        context = self._acquire()
+        depth = getattr(self._local, "depth", 0)
+        self._local.depth = depth + 1
+        try:
+            return context.run(code, bindings or {}, analyzer, content)
+        finally:
+            self._local.depth = depth
+            self._release(context)
+
+    def warm(self, count: Optional[int] = None) -> None:
+        """预先创建上下文，默认创建到池的大小"""
+        contexts = []
+        for __ in range(self.size if count is None else min(count, self.size)):
+            contexts.append(self._acquire())
+        for context in contexts:
+            self._release(context)
+
+    def idle(self) -> int:
+        """空闲的上下文数"""
+        with self._idle.mutex:
+            return sum(1 for context in self._idle.queue if context is not None)
+
+    def _acquire(self) -> JsContext:
+        nested = getattr(self._local, "depth", 0) > 0
+        with self._lock:
+            create = self._idle.empty() and (nested or self.created < self.size)
+            if create:
+                self.created += 1
+        # 队列中的 None 表示有上下文被丢弃，取到它的线程负责补建
+        context = None if create else self._idle.get()
+        if context is not None:
+            return context
+        if not create:
+            with self._lock:
+                self.created += 1
+        try:
+            return JsContext(self.time_limit, self.memory_limit, self.cache_size)
+        except Exception:
+            with self._lock:
+                self.created -= 1
+            if not create:
+                self._idle.put(None)
+            raise
+
+    def _release(self, context: JsContext) -> None:
+        with self._lock:
+            drop = context.broken or self.created > self.size
+            if drop:
+                self.created -= 1
+        if not drop:
+            self._idle.put(context)
+        elif context.broken:
+            self._idle.put(None)
+
+
+def may_run_js(*texts: Any) -> bool:
+    """
+    规则或脚本中是否可能执行开销较大的 JavaScript，非字符串的值被忽略
+
+    <js></js>、@js:、java.* 调用以及变量名、页码运算与规则之外的 {{ }} 表达式都算作脚本。
+    """
+    for text in texts:
+        if not isinstance(text, str):
+            continue
+        if _JS_MARKER.search(text):
+            return True
+        if any(not _CHEAP_EXPRESSION.fullmatch(match.group(1)) for match in _EXPRESSION.finditer(text)):
+            return True
+    return False
+
+
+async def call_rules(js: bool, function: Callable[..., T], *args: Any,
+                     transport: Optional[Transport] = None, source: Any = None) -> T:
+    """
+    在异步流程中执行规则
+
+    脚本最长可以运行 DEFAULT_TIME_LIMIT 秒，java.ajax 还会发出同步请求，都不能在事件循环线程中执行。
+    js 为 True（通常由 may_run_js 判断）时在线程中执行 function，否则直接执行，不为每个页面切换线程。
+
+    参数:
+        js: 规则中是否可能执行脚本
+        function: 执行规则的函数
+        args: function 的参数
+        transport: 脚本中 java.ajax 使用的传输层，默认使用进程级默认传输层
+        source: java.ajax 请求所属的书源，传输层据此附加请求头与 Cookie
+
+    返回:
+        function 的返回值
+    """
+    if not js:
+        return function(*args)
+    # to_thread 复制当前上下文，线程中的 java.ajax 由此取得传输层与书源
+    token = _ajax_target.set((transport or get_transport(), source, asyncio.get_running_loop()))
+    try:
+        return await asyncio.to_thread(function, *args)
+    finally:
+        _ajax_target.reset(token)
+
+
+_default_pool: Optional[JsPool] = None
+
+
+def get_js_pool() -> JsPool:
+    """返回进程级默认上下文池，首次调用时创建"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = JsPool()
+    return _default_pool
+
+
+def set_js_pool(pool: Optional[JsPool]) -> None:
+    """替换进程级默认上下文池，传入 None 时下次使用会重新创建"""
+    global _default_pool
+    _default_pool = pool
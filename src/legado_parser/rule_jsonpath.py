@@ -0,0 +1,436 @@
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Iterator, List, Optional, Tuple
+
+
+class JsonPathError(Exception):
+    pass
+
+
+# 路径不存在时的占位值，与 None（JSON 的 null）区分
+_MISSING = object()
+
+
+@dataclass(frozen=True, slots=True)
+class Segment:
+    """
+    路径中的一段
+
+    kind 为 name（names 中的属性）、wildcard、index（indexes 中的下标）、slice、filter 或 length，
+    recursive 为 True 时表示 .. 深度扫描，先展开全部后代再应用本段。
+    """
+    kind: str
+    recursive: bool = False
+    names: Tuple[str, ...] = ()
+    indexes: Tuple[int, ...] = ()
+    slice: Tuple[Optional[int], Optional[int], Optional[int]] = (None, None, None)
+    predicate: Optional[Callable[[Any, Any], bool]] = None
+
+
+@dataclass(frozen=True, slots=True)
+class JsonPath:
+    """
+    编译后的 JSONPath
+
+    definite 为 True 时路径最多匹配一个值（只含单个属性名与单个下标），
+    此时匹配到的数组会被展开为结果列表，与阅读中 Jayway JsonPath 的用法一致。
+    """
+    text: str
+    relative: bool
+    segments: Tuple[Segment, ...]
+    definite: bool
+
+    def find(self, data: Any, root: Any = None) -> List[Any]:
+        """返回全部匹配的值，按文档顺序排列"""
+        nodes = [data]
+        for segment in self.segments:
+            nodes = list(_apply(segment, nodes, data if root is None else root))
+            if not nodes:
+                break
+        return nodes
+
+    def read(self, data: Any, root: Any = None) -> List[Any]:
+        """按阅读的语义读取：确定路径匹配到数组时返回数组元素，否则返回全部匹配"""
+        nodes = self.find(data, root)
+        if self.definite and len(nodes) == 1 and isinstance(nodes[0], list):
+            return list(nodes[0])
+        return nodes
+
+
+@lru_cache(maxsize=4096)
+def compile_path(path: str) -> JsonPath:
+    """
+    编译 JSONPath，同一路径只编译一次
+
+    支持 $.a.b、$['a']、$.a[0]、$.a[-1]、$.a[0,2]、$.a[1:3]、$.a[*]、$..a、$.a[?(@.b > 1)] 与 .length()，
+    与 Jayway 一致，不以 $ 或 @ 开头的路径视为 $. 开头。
+    """
+    text = path.strip()
+    if not text.startswith(("$", "@")):
+        text = "$." + text
+    return _PathParser(text).parse()
+
+
+def read_json(data: Any, path: str) -> List[Any]:
+    """在已解析的 JSON 上执行路径"""
+    return compile_path(path).read(data)
+
+
+def parse_json(text: str) -> Any:
+    """解析 JSON 文本，无效时抛出 JsonPathError"""
+    try:
+        return json.loads(text)
+    except ValueError as e:
+        raise JsonPathError(f"无效的 JSON: {e}") from e
+
+
+def _descendants(node: Any) -> Iterator[Any]:
+    yield node
+    if isinstance(node, dict):
+        for value in node.values():
+            if isinstance(value, (dict, list)):
+                yield from _descendants(value)
+    elif isinstance(node, list):
+        for value in node:
+            if isinstance(value, (dict, list)):
+                yield from _descendants(value)
+
+
+def _apply(segment: Segment, nodes: List[Any], root: Any) -> Iterator[Any]:
+    if segment.recursive:
+        nodes = [item for node in nodes for item in _descendants(node)]
+    kind = segment.kind
+    for node in nodes:
+        if kind == "name":
+            if isinstance(node, dict):
+                for name in segment.names:
+                    if name in node:
+                        yield node[name]
+        elif kind == "wildcard":
+            if isinstance(node, dict):
+                yield from node.values()
+            elif isinstance(node, list):
+                yield from node
+        elif kind == "index":
+            if isinstance(node, list):
+                length = len(node)
+                for index in segment.indexes:
+                    if -length <= index < length:
+                        yield node[index]
+        elif kind == "slice":
+            if isinstance(node, list):
+                start, stop, step = segment.slice
+                yield from node[start:stop:step]
+        elif kind == "filter":
+            predicate = segment.predicate
+            if isinstance(node, list):
+                yield from (item for item in node if predicate(item, root))
+            elif isinstance(node, dict) and not segment.recursive and predicate(node, root):
+                yield node
+        elif kind == "length":
+            if isinstance(node, (dict, list, str)):
+                yield len(node)
+
+
+class _PathParser:
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.cursor = 1
+        self.segments: List[Segment] = []
+
+    def parse(self) -> JsonPath:
+        text, length = self.text, len(self.text)
+        while self.cursor < length:
+            char = text[self.cursor]
+            if text.startswith("..", self.cursor):
+                self.cursor += 2
+                if self.cursor < length and text[self.cursor] == "[":
+                    self._bracket(True)
+                else:
+                    self._dot_name(True)
+            elif char == ".":
+                self.cursor += 1
+                self._dot_name(False)
+            elif char == "[":
+                self._bracket(False)
+            elif char.isspace():
+                self.cursor += 1
+            else:
+                raise JsonPathError(f"无效的 JSONPath: {text}")
+
+        definite = all(not segment.recursive and (segment.kind == "name" and len(segment.names) == 1 or
+                                                  segment.kind == "index" and len(segment.indexes) == 1 or
+                                                  segment.kind == "length")
+                       for segment in self.segments)
+        return JsonPath(text, text.startswith("@"), tuple(self.segments), definite)
+
+    def _dot_name(self, recursive: bool) -> None:
+        text = self.text
+        start = self.cursor
+        while self.cursor < len(text) and text[self.cursor] not in ".[":
+            self.cursor += 1
+        name = text[start:self.cursor].strip()
+        if name == "*":
+            self.segments.append(Segment("wildcard", recursive))
+        elif name == "length()":
+            self.segments.append(Segment("length", recursive))
+        elif name:
+            self.segments.append(Segment("name", recursive, names=(name,)))
+        else:
+            raise JsonPathError(f"无效的 JSONPath: {text}")
+
+    def _bracket(self, recursive: bool) -> None:
+        text = self.text
+        end = _find_close(text, self.cursor)
+        inner = text[self.cursor + 1:end].strip()
+        self.cursor = end + 1
+
+        if inner == "*":
+            self.segments.append(Segment("wildcard", recursive))
+        elif inner.startswith("?"):
+            expression = inner[1:].strip()
+            if expression.startswith("(") and expression.endswith(")"):
+                expression = expression[1:-1]
+            self.segments.append(Segment("filter", recursive, predicate=compile_filter(expression)))
+        elif inner[:1] in ("'", '"'):
+            names = tuple(_unquote(item) for item in _split_outside_quotes(inner, ","))
+            self.segments.append(Segment("name", recursive, names=names))
+        elif ":" in inner:
+            parts = [item.strip() for item in inner.split(":")]
+            if len(parts) > 3:
+                raise JsonPathError(f"无效的切片: {inner}")
+            values = [int(item) if item else None for item in parts] + [None] * (3 - len(parts))
+            self.segments.append(Segment("slice", recursive, slice=tuple(values)))
+        else:
+            try:
+                indexes = tuple(int(item) for item in inner.split(","))
+            except ValueError:
+                raise JsonPathError(f"无效的下标: {inner}") from None
+            self.segments.append(Segment("index", recursive, indexes=indexes))
+
+
+def _find_close(text: str, start: int) -> int:
+    """查找与 start 处 [ 匹配的 ]，忽略引号与正则字面量中的括号"""
+    depth, quote = 0, ""
+    for index in range(start, len(text)):
+        char = text[index]
+        if quote:
+            if char == "\\":
+                continue
+            if char == quote and text[index - 1] != "\\":
+                quote = ""
+        elif char in "'\"":
+            quote = char
+        elif char == "[":
+            depth += 1
+        elif char == "]":
+            depth -= 1
+            if depth == 0:
+                return index
+    raise JsonPathError(f"缺少 ]: {text}")
+
+
+def _split_outside_quotes(text: str, separator: str) -> List[str]:
+    parts, quote, start = [], "", 0
+    for index, char in enumerate(text):
+        if quote:
+            if char == quote:
+                quote = ""
+        elif char in "'\"":
+            quote = char
+        elif char == separator:
+            parts.append(text[start:index].strip())
+            start = index + 1
+    parts.append(text[start:].strip())
+    return parts
+
+
+def _unquote(text: str) -> str:
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "'\"":
+        return text[1:-1].replace("\\" + text[0], text[0])
+    return text
+
+
+# ---------------------------------------------------------------------------
+# 过滤表达式
+# ---------------------------------------------------------------------------
+
+_FILTER_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<op>&&|\|\||==|!=|<=|>=|=~|<|>|!|\(|\))
+      | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+      | (?P<regex>/(?:[^/\\]|\\.)*/[imsx]*)
+      | (?P<number>-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+      | (?P<word>true|false|null|in|nin|contains|size|empty)\b
+      | (?P<list>\[[^\]]*\])
+      | (?P<path>[@$](?:\[[^\]]*\]|[^\s=!<>&|()\[\]]|\[)*)
+    )""", re.VERBOSE)
+
+Predicate = Callable[[Any, Any], bool]
+Operand = Callable[[Any, Any], Any]
+
+
+@lru_cache(maxsize=1024)
+def compile_filter(expression: str) -> Predicate:
+    """把 [?(...)] 中的表达式编译为 predicate(当前节点, 根节点)"""
+    tokens = _tokenize_filter(expression)
+    parser = _FilterParser(tokens, expression)
+    predicate = parser.parse_or()
+    if parser.position != len(tokens):
+        raise JsonPathError(f"无效的过滤表达式: {expression}")
+    return predicate
+
+
+def _tokenize_filter(expression: str) -> List[Tuple[str, str]]:
+    tokens, cursor = [], 0
+    expression = expression.strip()
+    while cursor < len(expression):
+        matcher = _FILTER_TOKEN.match(expression, cursor)
+        if not matcher or matcher.end() == cursor:
+            raise JsonPathError(f"无效的过滤表达式: {expression}")
+        kind = matcher.lastgroup
+        tokens.append((kind, matcher.group(kind)))
+        cursor = matcher.end()
+        while cursor < len(expression) and expression[cursor].isspace():
+            cursor += 1
+    return tokens
+
+
+class _FilterParser:
+    def __init__(self, tokens: List[Tuple[str, str]], expression: str) -> None:
+        self.tokens = tokens
+        self.expression = expression
+        self.position = 0
+
+    def peek(self) -> Tuple[str, str]:
+        return self.tokens[self.position] if self.position < len(self.tokens) else ("", "")
+
+    def take(self) -> Tuple[str, str]:
+        token = self.peek()
+        self.position += 1
+        return token
+
+    def parse_or(self) -> Predicate:
+        left = self.parse_and()
+        while self.peek() == ("op", "||"):
+            self.take()
+            right = self.parse_and()
+            left = (lambda a, b: lambda node, root: a(node, root) or b(node, root))(left, right)
+        return left
+
+    def parse_and(self) -> Predicate:
+        left = self.parse_unary()
+        while self.peek() == ("op", "&&"):
+            self.take()
+            right = self.parse_unary()
+            left = (lambda a, b: lambda node, root: a(node, root) and b(node, root))(left, right)
+        return left
+
+    def parse_unary(self) -> Predicate:
+        token = self.peek()
+        if token == ("op", "!"):
+            self.take()
+            inner = self.parse_unary()
+            return lambda node, root: not inner(node, root)
+        if token == ("op", "("):
+            self.take()
+            inner = self.parse_or()
+            if self.take() != ("op", ")"):
+                raise JsonPathError(f"缺少 ): {self.expression}")
+            return inner
+        return self.parse_comparison()
+
+    def parse_comparison(self) -> Predicate:
+        left = self.parse_operand()
+        kind, value = self.peek()
+        if (kind == "op" and value in _COMPARATORS) or (kind == "word" and value in _COMPARATORS):
+            self.take()
+            right = self.parse_operand()
+            compare = _COMPARATORS[value]
+
+            def predicate(node, root):
+                a, b = left(node, root), right(node, root)
+                if a is _MISSING or b is _MISSING:
+                    return False
+                try:
+                    return compare(a, b)
+                except TypeError:
+                    return False
+            return predicate
+        return lambda node, root: _truthy(left(node, root))
+
+    def parse_operand(self) -> Operand:
+        kind, value = self.take()
+        if kind == "path":
+            path = compile_path(value)
+            relative = value.startswith("@")
+
+            def operand(node, root):
+                matches = path.find(node if relative else root, root)
+                if path.definite:
+                    return matches[0] if matches else _MISSING
+                return matches
+            return operand
+        if kind == "string":
+            text = _unquote(value)
+            return lambda node, root: text
+        if kind == "number":
+            number = float(value) if any(char in value for char in ".eE") else int(value)
+            return lambda node, root: number
+        if kind == "word" and value in ("true", "false", "null"):
+            literal = {"true": True, "false": False, "null": None}[value]
+            return lambda node, root: literal
+        if kind == "regex":
+            body, __, flags = value[1:].rpartition("/")
+            pattern = re.compile(body, sum(_REGEX_FLAGS[flag] for flag in flags))
+            return lambda node, root: pattern
+        if kind == "list":
+            try:
+                items = json.loads(value.replace("'", '"'))
+            except ValueError:
+                raise JsonPathError(f"无效的列表: {value}") from None
+            return lambda node, root: items
+        raise JsonPathError(f"无效的过滤表达式: {self.expression}")
+
+
+def _truthy(value: Any) -> bool:
+    if value is _MISSING:
+        return False
+    if isinstance(value, list):
+        return bool(value)
+    return value is not None and value is not False
+
+
+def _equals(a: Any, b: Any) -> bool:
+    if isinstance(a, bool) or isinstance(b, bool):
+        return a is b
+    return a == b
+
+
+def _regex_match(a: Any, pattern: "re.Pattern") -> bool:
+    return isinstance(a, str) and pattern.fullmatch(a) is not None
+
+
+def _contains(a: Any, b: Any) -> bool:
+    if isinstance(a, (str, list, dict)):
+        return b in a
+    return False
+
+
+_REGEX_FLAGS = {"i": re.IGNORECASE, "m": re.MULTILINE, "s": re.DOTALL, "x": re.VERBOSE}
+_COMPARATORS: dict = {
+    "==": _equals,
+    "!=": lambda a, b: not _equals(a, b),
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+    "=~": _regex_match,
+    "in": lambda a, b: isinstance(b, list) and a in b,
+    "nin": lambda a, b: isinstance(b, list) and a not in b,
+    "contains": _contains,
+    "size": lambda a, b: isinstance(a, (str, list, dict)) and len(a) == b,
+    "empty": lambda a, b: isinstance(a, (str, list, dict)) and (len(a) == 0) == b,
+}
@@ -0,0 +1,166 @@
+from collections import ChainMap
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .rule_analyzer import AnalyzeRule, is_json_content, to_string
+from .rule_compiler import compile_rule
+from .rule_dom import Element
+from .rule_program import Pipeline, Selector
+from .rule_selector import Step, compile_steps, extract, select_elements, select_step
+
+
+@dataclass(frozen=True, slots=True)
+class FieldPlan:
+    """
+    单个字段的执行计划
+
+    path 为元素选择部分逐段展开后的 (前缀, 这一段)，同一条目上前缀相同的段只执行一次，
+    例如 class.info@class.name 与 class.info@class.author 共用 class.info 的结果；
+    @css: 选择器整体作为一段。path 为空表示条目本身，为 None 时整条规则交给执行器。
+    last 为取值规则，rest 为取值之后的步骤，例如 ##替换。
+    """
+    rule: str
+    is_url: bool
+    path: Optional[Tuple[Tuple[Tuple[bool, str], Union[Step, str]], ...]]
+    last: str
+    rest: Optional[Pipeline]
+
+
+@dataclass(frozen=True, slots=True)
+class ExtractionPlan:
+    """
+    列表页的批量取值计划，例如搜索结果与发现页
+
+    每个条目上的字段依次执行，默认语法与 @css: 字段的元素选择部分按前缀共用，
+    例如 tag.a@text 与 tag.a@href 只选择一次 tag.a。必填字段最先执行，为空时跳过该条目。
+    结果为与字段顺序一致的字符串元组。
+    """
+    list_rule: str
+    fields: Tuple[FieldPlan, ...]
+    json_fields: Tuple[FieldPlan, ...]
+    order: Tuple[int, ...]
+    required: Tuple[int, ...]
+
+    def extract(self, analyzer: AnalyzeRule, content: Any = None,
+                fork_variables: bool = False) -> List[Tuple[str, ...]]:
+        """
+        执行计划
+
+        参数:
+            analyzer: 规则执行器
+            content: 列表页内容，默认为执行器的内容
+            fork_variables: 为每个条目在执行器的变量表上分出一层，条目内 @put 的变量不会写入共享的变量表，
+                也不会被后面的条目读到
+
+        返回:
+            每个条目一个元组
+        """
+        return [values for values, __ in self._run(analyzer, content, fork_variables)]
+
+    def extract_with_variables(self, analyzer: AnalyzeRule,
+                               content: Any = None) -> List[Tuple[Tuple[str, ...], Dict[str, str]]]:
+        """
+        与 extract(fork_variables=True) 相同，同时返回每个条目内 @put 写入的变量
+
+        返回:
+            每个条目一个 (字段值元组, 条目变量) 元组
+        """
+        return self._run(analyzer, content, True)
+
+    def _run(self, analyzer: AnalyzeRule, content: Any,
+             fork_variables: bool) -> List[Tuple[Tuple[str, ...], Dict[str, str]]]:
+        content = analyzer.content if content is None else content
+        if not self.list_rule:
+            return []
+        items = analyzer.get_elements(self.list_rule, content)
+        fields = self.json_fields if is_json_content(content) else self.fields
+        required = self.required
+        records = []
+        previous, analyzer.as_strings = analyzer.as_strings, True
+        variables = analyzer.variables
+        try:
+            for item in items:
+                if fork_variables:
+                    analyzer.variables = (variables.new_child() if isinstance(variables, ChainMap)
+                                          else ChainMap({}, variables))
+                memo: Dict[Tuple[bool, str], List[Element]] = {}
+                values = [""] * len(fields)
+                for index in self.order:
+                    value = values[index] = _field_value(analyzer, fields[index], item, memo)
+                    if not value and index in required:
+                        break
+                else:
+                    records.append((tuple(values), dict(analyzer.variables.maps[0]) if fork_variables else {}))
+        finally:
+            analyzer.as_strings = previous
+            analyzer.variables = variables
+        return records
+
+
+@lru_cache(maxsize=1024)
+def compile_plan(list_rule: str, fields: Tuple[Tuple[str, bool], ...],
+                 required: Tuple[int, ...] = ()) -> ExtractionPlan:
+    """
+    编译批量取值计划，同一组规则只编译一次
+
+    参数:
+        list_rule: 列表规则，例如 ruleSearch.bookList
+        fields: 每个字段的 (规则, 是否为地址)
+        required: 值为空时跳过条目的字段序号
+    """
+    order = tuple(required) + tuple(index for index in range(len(fields)) if index not in required)
+    return ExtractionPlan(
+        list_rule,
+        tuple(_plan_field(rule, is_url) for rule, is_url in fields),
+        tuple(FieldPlan(rule, is_url, None, "", None) for rule, is_url in fields),
+        order,
+        tuple(required),
+    )
+
+
+def _plan_field(rule: str, is_url: bool) -> FieldPlan:
+    fallback = FieldPlan(rule, is_url, None, "", None)
+    if not rule:
+        return fallback
+    program = compile_rule(rule, False, False).program
+    root = program.root
+    steps = root.steps if isinstance(root, Pipeline) else (root,)
+    first = steps[0]
+    if program.reverse or not isinstance(first, Selector):
+        return fallback
+    selector, separator, last = first.rule.rpartition("@")
+    if first.css and not separator:
+        return fallback
+
+    path: List[Tuple[Tuple[bool, str], Union[Step, str]]] = []
+    if first.css:
+        path.append(((True, selector), selector))
+    elif separator:
+        parts = selector.split("@")
+        for index, step in enumerate(compile_steps(selector)):
+            path.append(((False, "@".join(parts[:index + 1])), step))
+    rest = Pipeline(tuple(steps[1:])) if len(steps) > 1 else None
+    return FieldPlan(rule, is_url, tuple(path), last.strip(), rest)
+
+
+def _field_value(analyzer: AnalyzeRule, field: FieldPlan, item: Any,
+                 memo: Dict[Tuple[bool, str], List[Element]]) -> str:
+    if field.path is None or not isinstance(item, Element):
+        return analyzer.get_string(field.rule, item, field.is_url) if field.rule else ""
+
+    elements = [item]
+    for key, step in field.path:
+        selected = memo.get(key)
+        if selected is None:
+            if isinstance(step, str):
+                selected = select_elements(elements, step, True)
+            else:
+                selected = [found for element in elements for found in select_step(element, step)]
+            memo[key] = selected
+        elements = selected
+    result: List[Any] = extract(elements, field.last)
+    if field.rest is not None and result:
+        result = analyzer.evaluate(field.rest, result[0] if len(result) == 1 else result)
+    value = "\n".join(to_string(item) for item in result).strip()
+    return analyzer.absolute_url(value) if field.is_url and value else value
@@ -0,0 +1,331 @@
+import json
+from dataclasses import dataclass, fields
+from typing import Any, ClassVar, Dict, Iterator, List, Sequence, Tuple, Type
+
+from .rule_tokenizer import ProgramToken, split_rule, tokenizer_program, tokenizer_source
+from .rule_type import RuleType
+
+
+class ProgramError(Exception):
+    pass
+
+
+@dataclass(frozen=True, slots=True)
+class Node:
+    """规则语法树节点的基类"""
+    rule_type: ClassVar[RuleType] = RuleType.Unknown
+
+
+@dataclass(frozen=True, slots=True)
+class Literal(Node):
+    """模板中的普通文本"""
+    text: str
+    rule_type: ClassVar[RuleType] = RuleType.Format
+
+
+@dataclass(frozen=True, slots=True)
+class Selector(Node):
+    """默认语法（JSoup）规则，css 为 True 时表示 @css: 选择器"""
+    rule: str
+    css: bool = False
+    rule_type: ClassVar[RuleType] = RuleType.DefaultOrEnd
+
+
+@dataclass(frozen=True, slots=True)
+class JsonPath(Node):
+    """JSONPath 规则"""
+    path: str
+    rule_type: ClassVar[RuleType] = RuleType.Json
+
+
+@dataclass(frozen=True, slots=True)
+class XPath(Node):
+    """XPath 规则"""
+    path: str
+    rule_type: ClassVar[RuleType] = RuleType.Xpath
+
+
+@dataclass(frozen=True, slots=True)
+class Js(Node):
+    """<js></js> 或 @js: 中的 JavaScript 代码"""
+    code: str
+    rule_type: ClassVar[RuleType] = RuleType.Js
+
+
+@dataclass(frozen=True, slots=True)
+class Regex(Node):
+    """以 : 开头的 AllInOne 正则规则"""
+    pattern: str
+    rule_type: ClassVar[RuleType] = RuleType.Regex
+
+
+@dataclass(frozen=True, slots=True)
+class Replace(Node):
+    """##正则##替换内容 后缀，first_only 对应 ### 只替换第一个匹配"""
+    pattern: str
+    replacement: str = ""
+    first_only: bool = False
+    rule_type: ClassVar[RuleType] = RuleType.Regex
+
+
+@dataclass(frozen=True, slots=True)
+class Join(Node):
+    """&&、||、%% 连接的多个规则"""
+    op: str
+    operands: Tuple[Node, ...]
+    rule_type: ClassVar[RuleType] = RuleType.JoinSymbol
+
+
+@dataclass(frozen=True, slots=True)
+class Put(Node):
+    """@put:{key:rule} 变量写入，不改变当前结果"""
+    entries: Tuple[Tuple[str, Node], ...]
+    rule_type: ClassVar[RuleType] = RuleType.Put
+
+
+@dataclass(frozen=True, slots=True)
+class Get(Node):
+    """@get:{key} 变量读取"""
+    key: str
+    rule_type: ClassVar[RuleType] = RuleType.Get
+
+
+@dataclass(frozen=True, slots=True)
+class GroupRef(Node):
+    """模板中引用正则分组的 $1 ~ $99"""
+    index: int
+    rule_type: ClassVar[RuleType] = RuleType.Format
+
+
+@dataclass(frozen=True, slots=True)
+class Format(Node):
+    """由 Literal、Get、GroupRef 及 {{ }}、{$. } 内嵌规则拼接而成的模板"""
+    parts: Tuple[Node, ...]
+    rule_type: ClassVar[RuleType] = RuleType.Format
+
+
+@dataclass(frozen=True, slots=True)
+class Pipeline(Node):
+    """依次执行的规则，前一步的结果作为后一步的输入"""
+    steps: Tuple[Node, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class Program:
+    """
+    编译后的规则程序
+
+    属性:
+        text: 原始规则文本
+        root: 语法树根节点
+        reverse: 规则以 - 开头时为 True，列表结果需要倒序
+    """
+    text: str
+    root: Node
+    reverse: bool = False
+
+    def walk(self) -> Iterator[Node]:
+        """深度优先遍历所有节点"""
+        return iter_nodes(self.root)
+
+    def to_data(self) -> Dict[str, Any]:
+        """转换为只包含基础类型的数据，可直接 JSON 序列化"""
+        return {"text": self.text, "root": node_to_data(self.root), "reverse": self.reverse}
+
+    @classmethod
+    def from_data(cls, data: Dict[str, Any]) -> "Program":
+        """从 to_data 的结果还原"""
+        return cls(data["text"], node_from_data(data["root"]), data.get("reverse", False))
+
+
+_NODE_TYPES: Dict[str, Type[Node]] = {
+    cls.__name__: cls
+    for cls in (Literal, Selector, JsonPath, XPath, Js, Regex, Replace, Join, Put, Get, GroupRef, Format, Pipeline)
+}
+
+
+def compile_program(text: str, contentIsJson: bool = False) -> Program:
+    """
+    将规则编译为语法树
+
+    语法单元由 rule_tokenizer.tokenizer_program 拆分并标注类型，这里只按单元类型组装节点。
+
+    参数:
+        text: 规则文本
+        contentIsJson: 内容是否为 JSON，为 True 时默认语法按 JSONPath 处理
+
+    返回:
+        编译后的规则程序
+    """
+    tokens = tokenizer_program(text, contentIsJson)
+    reverse = False
+    if tokens and tokens[0][0] is RuleType.Order:
+        reverse = tokens[0][1] == "-"
+        tokens = tokens[1:]
+    if tokens and tokens[0] == (RuleType.RuleSymbol, ":"):
+        return Program(text, Regex(tokens[1][1]), reverse)
+    return Program(text, _build_source(tokens, contentIsJson), reverse)
+
+
+def iter_nodes(node: Node) -> Iterator[Node]:
+    """深度优先遍历节点及其子节点"""
+    yield node
+    if isinstance(node, Pipeline):
+        for step in node.steps:
+            yield from iter_nodes(step)
+    elif isinstance(node, Join):
+        for operand in node.operands:
+            yield from iter_nodes(operand)
+    elif isinstance(node, Format):
+        for part in node.parts:
+            yield from iter_nodes(part)
+    elif isinstance(node, Put):
+        for __, value in node.entries:
+            yield from iter_nodes(value)
+
+
+def node_to_data(node: Node) -> Dict[str, Any]:
+    """将节点转换为只包含基础类型的字典"""
+    data: Dict[str, Any] = {"node": type(node).__name__}
+    for item in fields(node):
+        data[item.name] = _value_to_data(getattr(node, item.name))
+    return data
+
+
+def node_from_data(data: Dict[str, Any]) -> Node:
+    """从 node_to_data 的结果还原节点"""
+    cls = _NODE_TYPES.get(data.get("node", ""))
+    if cls is None:
+        raise ProgramError(f"未知的节点类型: {data.get('node')}")
+    values = {item.name: _value_from_data(data[item.name]) for item in fields(cls) if item.name in data}
+    return cls(**values)
+
+
+def _value_to_data(value: Any) -> Any:
+    if isinstance(value, Node):
+        return node_to_data(value)
+    if isinstance(value, tuple):
+        return [_value_to_data(item) for item in value]
+    return value
+
+
+def _value_from_data(value: Any) -> Any:
+    if isinstance(value, dict):
+        return node_from_data(value)
+    if isinstance(value, list):
+        return tuple(_value_from_data(item) for item in value)
+    return value
+
+
+def _build_source(tokens: Sequence[ProgramToken], is_json: bool) -> Node:
+    """按 JS 单元拆分，对应阅读的 splitSourceRule"""
+    steps: List[Node] = []
+    segment: List[ProgramToken] = []
+    for token in tokens:
+        if token[0] is RuleType.Js:
+            steps.extend(_build_segment(segment, is_json))
+            segment = []
+            steps.append(Js(token[1]))
+        else:
+            segment.append(token)
+    steps.extend(_build_segment(segment, is_json))
+
+    if len(steps) == 1:
+        return steps[0]
+    return Pipeline(tuple(steps))
+
+
+def _build_segment(tokens: Sequence[ProgramToken], is_json: bool) -> List[Node]:
+    """组装不含 JS 的单段规则，对应阅读的 SourceRule"""
+    if not tokens:
+        return []
+    entries: List[Tuple[str, Node]] = []
+    body: List[ProgramToken] = []
+    pieces: List[str] = []
+    css = False
+    for index, (kind, value) in enumerate(tokens):
+        if kind is RuleType.Put:
+            for key, rule in _parse_put_map(value):
+                entries.append((key, _build_source(tokenizer_source(rule, is_json), is_json)))
+        elif kind is RuleType.RuleSymbol:
+            if value != "##":
+                css = value.lower() == "@css:"
+        elif index and tokens[index - 1] == (RuleType.RuleSymbol, "##"):
+            pieces.append(value)
+        else:
+            body.append((kind, value))
+
+    steps: List[Node] = []
+    if entries:
+        steps.append(Put(tuple(entries)))
+    if body or not pieces:
+        steps.append(_build_body(body, css))
+    if pieces:
+        steps.append(Replace(pieces[0], pieces[1] if len(pieces) > 1 else "", len(pieces) > 2))
+    return steps
+
+
+_OPERANDS = {RuleType.DefaultOrEnd, RuleType.Json, RuleType.Xpath, RuleType.JoinSymbol}
+
+
+def _build_body(tokens: Sequence[ProgramToken], css: bool) -> Node:
+    if not tokens:
+        return Literal("")
+    if tokens[0][0] in _OPERANDS:
+        return _build_join(tokens, css)
+    return Format(tuple(_build_part(kind, value) for kind, value in tokens))
+
+
+def _build_join(tokens: Sequence[ProgramToken], css: bool) -> Node:
+    """第一个出现的连接符决定本层的连接方式，其余连接符留给各部分"""
+    op = next((value for kind, value in tokens if kind is RuleType.JoinSymbol), None)
+    if op is None:
+        kind, value = tokens[0]
+        if kind is RuleType.Json:
+            return JsonPath(value.strip())
+        if kind is RuleType.Xpath:
+            return XPath(value.strip())
+        return Selector(value.strip(), css)
+    parts: List[List[ProgramToken]] = [[]]
+    for token in tokens:
+        if token == (RuleType.JoinSymbol, op):
+            parts.append([])
+        else:
+            parts[-1].append(token)
+    return Join(op, tuple(_build_join(part, css) for part in parts))
+
+
+def _build_part(kind: RuleType, value: str) -> Node:
+    if kind is RuleType.Get:
+        return Get(value)
+    if kind is RuleType.Inner:
+        return _build_inner(value)
+    if kind is RuleType.JsonInner:
+        return JsonPath(value)
+    if kind is RuleType.Regex:
+        return GroupRef(int(value))
+    return Literal(value)
+
+
+def _build_inner(inner: str) -> Node:
+    """{{ }} 中以 @、$.、$[、// 开头的视为规则，其余视为 JavaScript"""
+    if inner.startswith(("@", "$.", "$[", "//")):
+        return _build_source(tokenizer_source(inner, False), False)
+    return Js(inner)
+
+
+def _parse_put_map(text: str) -> List[Tuple[str, str]]:
+    """解析 @put 的映射，兼容不带引号的宽松写法"""
+    try:
+        data = json.loads(text)
+        if isinstance(data, dict):
+            return [(str(key), str(value)) for key, value in data.items()]
+    except ValueError:
+        pass
+
+    pairs: List[Tuple[str, str]] = []
+    for item in split_rule(text[1:-1], (",",))[1]:
+        key, sep, value = item.partition(":")
+        if sep:
+            pairs.append((key.strip().strip("\"'"), value.strip().strip("\"'")))
+    return pairs
@@ -0,0 +1,373 @@
+import logging
+import multiprocessing
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    # 可选依赖，安装后替换规则可以设置超时，未安装时使用标准库 re
+    import regex as _regex
+except ImportError:
+    _regex = None
+
+logger = logging.getLogger(__name__)
+
+# 单个替换规则在一段文本上的最长执行时间（秒），与阅读的正则替换超时一致
+DEFAULT_TIMEOUT = 3.0
+# 未安装 regex 模块时保留的空闲子进程数
+MAX_IDLE_SANDBOXES = 2
+
+_JAVA_GROUP = re.compile(r"\$(\d+)")
+_JAVA_NAMED_GROUP = re.compile(r"(?<!\\)\(\?<(?![=!])")
+_JAVA_BACKREFERENCE = re.compile(r"\\k<(\w+)>")
+# 量词，{n,} 的 , 之后为空时没有上限
+_QUANTIFIER = re.compile(r"([*+?])[?+]?|\{\d*(?:(,)|,\d+)?\}[?+]?")
+_GROUP_PREFIX = re.compile(r"\?(?::|=|!|>|<=|<!|P?<\w+>|P=\w+\)|[a-zA-Z-]+(?::|\)))")
+
+_engine = _regex if _regex is not None else re
+_warned = set()
+# 执行超时或无法限时执行而跳过的正则及次数
+_timeouts: Dict[str, int] = {}
+_timeouts_lock = threading.Lock()
+
+
+def translate_pattern(pattern: str) -> str:
+    """把 Java 正则中 Python 不支持的写法转换过来：(?<name>...) 与 \\k<name>"""
+    if "(?<" in pattern:
+        pattern = _JAVA_NAMED_GROUP.sub("(?P<", pattern)
+    if "\\k<" in pattern:
+        pattern = _JAVA_BACKREFERENCE.sub(r"(?P=\1)", pattern)
+    return pattern
+
+
+def translate_replacement(replacement: str) -> str:
+    """把 Java 替换内容中的 $1 转换为 \\g<1>，其余反斜杠按字面处理"""
+    return _JAVA_GROUP.sub(r"\\g<\1>", replacement.replace("\\", "\\\\"))
+
+
+@lru_cache(maxsize=4096)
+def compile_regex(pattern: str) -> re.Pattern:
+    """
+    编译 AllInOne 正则，同一正则只编译一次
+
+    AllInOne 的匹配结果作为 re.Match 参与后续 $1 取值，因此总是使用标准库 re。
+    正则无效时抛出 re.error。
+    """
+    return re.compile(translate_pattern(pattern))
+
+
+def is_risky(pattern: str) -> bool:
+    """
+    判断正则是否可能出现灾难性回溯
+
+    只识别最常见的形式：无上限的重复，其内部全部由重复组成且至少一个无上限，
+    例如 (a+)+、(\\w+\\s?)*、(.*)*。(\\s*\\n)+ 这类内部有固定字符的写法不算在内。
+    """
+    try:
+        items, __ = _scan(translate_pattern(pattern), 0)
+    except IndexError:
+        return False
+    return _has_nested_repeat(items)
+
+
+@dataclass(frozen=True, slots=True)
+class _Atom:
+    """
+    正则中的一个元素
+
+    repeat 为 None 表示没有量词，True 为无上限的量词（*、+、{n,}），False 为有上限的量词。
+    body 为分组内的元素，非分组为空；transparent 表示普通分组，展开时可以看作其内容。
+    """
+    repeat: Optional[bool]
+    body: Tuple["_Atom", ...]
+    transparent: bool
+
+
+def _scan(pattern: str, position: int) -> Tuple[Tuple[_Atom, ...], int]:
+    """扫描到分组结束的 ) 或正则末尾，返回其中的元素与结束位置"""
+    items: List[_Atom] = []
+    length = len(pattern)
+    while position < length:
+        char = pattern[position]
+        if char == ")":
+            return tuple(items), position
+        if char == "|":
+            # 分支不是重复，含分支的重复体不算作灾难性回溯
+            items.append(_Atom(None, (), False))
+            position += 1
+            continue
+        if char == "(":
+            transparent = True
+            position += 1
+            if pattern.startswith("?", position):
+                matcher = _GROUP_PREFIX.match(pattern, position)
+                prefix = matcher.group(0) if matcher else "?"
+                position += len(prefix)
+                if prefix.endswith(")"):
+                    # (?i) 之类的内联标记不是分组
+                    continue
+                transparent = prefix == "?:" or prefix.startswith("?P<") or (
+                    prefix.startswith("?<") and prefix not in ("?<=", "?<!"))
+            body, position = _scan(pattern, position)
+            position += 1
+            atom = _Atom(None, body, transparent)
+        elif char == "[":
+            position = _class_end(pattern, position)
+            atom = _Atom(None, (), False)
+        elif char == "\\":
+            position += 2
+            atom = _Atom(None, (), False)
+        else:
+            position += 1
+            atom = _Atom(None, (), False)
+        matcher = _QUANTIFIER.match(pattern, position)
+        if matcher is not None:
+            position = matcher.end()
+            unbounded = matcher.group(1) in ("*", "+") or matcher.group(2) is not None
+            atom = _Atom(unbounded, atom.body, atom.transparent)
+        items.append(atom)
+    return tuple(items), position
+
+
+def _class_end(pattern: str, position: int) -> int:
+    """返回字符类 [...] 之后的位置"""
+    position += 1
+    if pattern.startswith("^", position):
+        position += 1
+    if pattern.startswith("]", position):
+        position += 1
+    while pattern[position] != "]":
+        position += 2 if pattern[position] == "\\" else 1
+    return position + 1
+
+
+def _has_nested_repeat(items: Tuple[_Atom, ...]) -> bool:
+    for atom in items:
+        if atom.repeat and atom.transparent:
+            flat = _flatten(atom.body)
+            if flat and all(item.repeat is not None for item in flat) and any(item.repeat for item in flat):
+                return True
+        if _has_nested_repeat(atom.body):
+            return True
+    return False
+
+
+def _flatten(items: Tuple[_Atom, ...]) -> List[_Atom]:
+    """展开普通分组，得到重复体中依次出现的元素"""
+    result = []
+    for atom in items:
+        if atom.repeat is None and atom.transparent and atom.body:
+            result.extend(_flatten(atom.body))
+        else:
+            result.append(atom)
+    return result
+
+
+@dataclass(frozen=True, slots=True)
+class CompiledReplace:
+    """
+    编译后的 ##正则##替换内容 规则
+
+    compiled 为 None 表示正则无效，此时与阅读一致按普通文本替换。
+    risky 为 True 的规则在未安装 regex 模块时放到子进程中限时执行。
+    """
+    pattern: str
+    replacement: str
+    first_only: bool
+    compiled: Any
+    template: str
+    risky: bool
+
+    def apply(self, text: str, timeout: Optional[float] = DEFAULT_TIMEOUT) -> str:
+        """
+        对文本执行替换，超时按没有匹配处理
+
+        参数:
+            text: 待替换的文本
+            timeout: 最长执行时间（秒），None 表示不限制
+
+        返回:
+            替换后的文本；first_only 时为第一个匹配替换后的结果，没有匹配时为空字符串
+        """
+        if self.compiled is None:
+            if self.first_only:
+                return self.replacement if self.pattern in text else ""
+            return text.replace(self.pattern, self.replacement)
+
+        try:
+            if _regex is None and self.risky and timeout is not None:
+                return _run_in_sandbox(self.pattern, self.template, text, self.first_only, timeout)
+            if self.first_only:
+                matcher = _search(self.compiled, text, timeout)
+                return matcher.expand(self.template) if matcher else ""
+            return _sub(self.compiled, self.template, text, timeout)
+        except TimeoutError:
+            _record_timeout(self.pattern, "执行超时")
+            return "" if self.first_only else text
+        except OSError as e:
+            _record_timeout(self.pattern, f"无法在子进程中限时执行（{e}），已跳过")
+            return "" if self.first_only else text
+
+
+@lru_cache(maxsize=4096)
+def compile_replace(pattern: str, replacement: str = "", first_only: bool = False) -> CompiledReplace:
+    """编译替换规则，同一规则只编译一次"""
+    template = translate_replacement(replacement)
+    try:
+        compiled = _engine.compile(translate_pattern(pattern))
+    except _engine.error:
+        return CompiledReplace(pattern, replacement, first_only, None, template, False)
+    return CompiledReplace(pattern, replacement, first_only, compiled, template, is_risky(pattern))
+
+
+@dataclass(frozen=True, slots=True)
+class ReplaceChain:
+    """
+    依次执行的一组替换规则，例如正文净化规则
+
+    每条规则只编译一次。规则按顺序逐条执行，后面的规则作用于前面规则的结果，
+    与阅读一致；不把多条规则合并为一个正则，合并后同一遍扫描的结果与逐条执行不同。
+    """
+    stages: Tuple[CompiledReplace, ...]
+
+    def apply(self, text: str, timeout: Optional[float] = DEFAULT_TIMEOUT) -> str:
+        """依次执行各规则，timeout 作用于每条规则"""
+        for stage in self.stages:
+            text = stage.apply(text, timeout)
+        return text
+
+
+@lru_cache(maxsize=256)
+def compile_chain(rules: Tuple[Tuple[str, str, bool], ...]) -> ReplaceChain:
+    """
+    编译一组替换规则，同一组规则只编译一次
+
+    参数:
+        rules: (正则, 替换内容, 是否只替换第一个) 的元组
+    """
+    return ReplaceChain(tuple(compile_replace(pattern, replacement, first_only)
+                              for pattern, replacement, first_only in rules))
+
+
+def replace_all(text: str, rules: Iterable[Tuple[str, str]], timeout: Optional[float] = DEFAULT_TIMEOUT) -> str:
+    """按顺序执行多组 (正则, 替换内容) 全局替换"""
+    return compile_chain(tuple((pattern, replacement, False) for pattern, replacement in rules)).apply(text, timeout)
+
+
+def timed_out_patterns() -> Dict[str, int]:
+    """
+    返回执行超时或无法限时执行而被跳过的替换正则
+
+    返回:
+        正则到次数的映射，这些替换按没有匹配处理，可据此提示书源作者修改规则
+    """
+    with _timeouts_lock:
+        return dict(_timeouts)
+
+
+def clear_timed_out_patterns() -> None:
+    """清空 timed_out_patterns 的记录"""
+    with _timeouts_lock:
+        _timeouts.clear()
+        _warned.clear()
+
+
+def _search(compiled: Any, text: str, timeout: Optional[float]) -> Any:
+    if _regex is not None:
+        return compiled.search(text, timeout=timeout)
+    return compiled.search(text)
+
+
+def _sub(compiled: Any, replacement: Any, text: str, timeout: Optional[float]) -> str:
+    if _regex is not None:
+        return compiled.sub(replacement, text, timeout=timeout)
+    return compiled.sub(replacement, text)
+
+
+def _record_timeout(pattern: str, reason: str) -> None:
+    with _timeouts_lock:
+        _timeouts[pattern] = _timeouts.get(pattern, 0) + 1
+        if pattern in _warned:
+            return
+        _warned.add(pattern)
+    logger.warning("正则 %s %s", pattern, reason)
+
+
+class _Sandbox:
+    """
+    执行正则替换的子进程
+
+    标准库 re 在匹配期间不释放 GIL，也无法中断，只能在子进程中执行并在超时后结束子进程。
+    """
+
+    def __init__(self) -> None:
+        context = multiprocessing.get_context("spawn")
+        self._connection, child = context.Pipe()
+        self._process = context.Process(target=_sandbox_main, args=(child,), daemon=True,
+                                        name="legado-regex")
+        self._process.start()
+        child.close()
+
+    def run(self, pattern: str, template: str, text: str, first_only: bool, timeout: float) -> Tuple[bool, str]:
+        """返回 (是否成功, 替换结果或错误信息)，超时抛出 TimeoutError，子进程异常时抛出 OSError"""
+        try:
+            self._connection.send((pattern, template, text, first_only))
+            if not self._connection.poll(timeout):
+                raise TimeoutError
+            return self._connection.recv()
+        except EOFError as e:
+            self.close()
+            raise OSError("子进程意外退出") from e
+        except (TimeoutError, OSError):
+            self.close()
+            raise
+
+    def close(self) -> None:
+        self._process.kill()
+        self._process.join()
+        self._connection.close()
+
+
+_idle_sandboxes: List[_Sandbox] = []
+_sandbox_lock = threading.Lock()
+
+
+def _run_in_sandbox(pattern: str, template: str, text: str, first_only: bool, timeout: float) -> str:
+    """在子进程中执行替换，超时抛出 TimeoutError，无法创建子进程时抛出 OSError"""
+    with _sandbox_lock:
+        sandbox = _idle_sandboxes.pop() if _idle_sandboxes else None
+    if sandbox is None:
+        sandbox = _Sandbox()
+    # 超时或出错时子进程已被结束，不再放回
+    ok, value = sandbox.run(pattern, template, text, first_only, timeout)
+    with _sandbox_lock:
+        if len(_idle_sandboxes) < MAX_IDLE_SANDBOXES:
+            _idle_sandboxes.append(sandbox)
+            sandbox = None
+    if sandbox is not None:
+        sandbox.close()
+    if not ok:
+        # 与在当前进程中执行一致，例如替换内容引用了不存在的分组
+        raise re.error(value)
+    return value
+
+
+def _sandbox_main(connection) -> None:
+    while True:
+        try:
+            pattern, template, text, first_only = connection.recv()
+        except EOFError:
+            return
+        try:
+            compiled = re.compile(translate_pattern(pattern))
+            if first_only:
+                matcher = compiled.search(text)
+                result = matcher.expand(template) if matcher else ""
+            else:
+                result = compiled.sub(template, text)
+        except (re.error, IndexError) as e:
+            connection.send((False, str(e)))
+        else:
+            connection.send((True, result))
@@ -0,0 +1,249 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Tuple, Union
+
+from .rule_dom import Element, select
+
+Index = Union[int, Tuple[int, int, int]]
+
+
+@dataclass(frozen=True, slots=True)
+class Step:
+    """
+    默认语法中以 @ 分隔的一段，例如 class.item.0、tag.a[1:3]、div > p!0
+
+    split 为 "." 时按 indexes 选择，为 "!" 时按 indexes 排除，为空时不筛选。
+    indexes 中的区间保存为 (起点, 终点, 步长)，起点或终点为 None 表示省略。
+    """
+    before: str
+    kind: str
+    name: str
+    split: str
+    indexes: Tuple[Index, ...]
+
+
+@lru_cache(maxsize=4096)
+def compile_steps(rule: str) -> Tuple[Step, ...]:
+    """按 @ 拆分默认语法规则并解析每一段"""
+    return tuple(parse_step(part) for part in rule.split("@"))
+
+
+@lru_cache(maxsize=4096)
+def parse_step(rule: str) -> Step:
+    """
+    解析一段默认语法规则
+
+    与阅读 AnalyzeByJSoup.ElementsSingle.findIndexSet 一致，从尾部逆向读取索引：
+    [1:3]、[!0,2]、[-1:0]、[1:10:2] 为新写法，.0、.-1、!0:1、.0:2:-1 为旧写法。
+    """
+    text = rule.strip()
+    if text.endswith("]"):
+        before, split, indexes = _parse_bracket_indexes(text)
+    else:
+        before, split, indexes = _parse_legacy_indexes(text)
+
+    parts = before.split(".")
+    kind, name = parts[0], parts[1] if len(parts) > 1 else ""
+    if kind not in ("children", "class", "tag", "id", "text") or (kind != "children" and not name):
+        kind, name = "css", before
+    return Step(before, kind, name, split, indexes)
+
+
+def _parse_bracket_indexes(text: str) -> Tuple[str, str, Tuple[Index, ...]]:
+    indexes: List[Index] = []
+    current: List = []
+    digits, minus, split = "", False, "."
+    cursor = len(text) - 1
+    while cursor > 0:
+        cursor -= 1
+        char = text[cursor]
+        if char == " ":
+            continue
+        if char.isdigit():
+            digits = char + digits
+            continue
+        if char == "-":
+            minus = True
+            continue
+        value = None if not digits else -int(digits) if minus else int(digits)
+        if char == ":":
+            current.append(value)
+        else:
+            if not current:
+                if value is None:
+                    break
+                indexes.append(value)
+            else:
+                # 逆向读取时最后压入的是起点左边的区间右端，两项时最先压入的是步长
+                indexes.append((value, current[-1], current[0] if len(current) == 2 else 1))
+                current = []
+            if char == "!":
+                split = "!"
+                cursor -= 1
+                while cursor > 0 and text[cursor] == " ":
+                    cursor -= 1
+                char = text[cursor]
+            if char == "[":
+                indexes.reverse()
+                return text[:cursor], split, tuple(indexes)
+            if char != ",":
+                break
+        digits, minus = "", False
+    return text, "", ()
+
+
+def _parse_legacy_indexes(text: str) -> Tuple[str, str, Tuple[Index, ...]]:
+    indexes: List[int] = []
+    digits, minus = "", False
+    cursor = len(text)
+    while cursor > 0:
+        cursor -= 1
+        char = text[cursor]
+        if char == " ":
+            continue
+        if char.isdigit():
+            digits = char + digits
+        elif char == "-":
+            minus = True
+        elif char in "!.:" and digits:
+            indexes.append(-int(digits) if minus else int(digits))
+            if char != ":":
+                indexes.reverse()
+                return text[:cursor], char, tuple(indexes)
+            digits, minus = "", False
+        else:
+            break
+    return text, "", ()
+
+
+def _index_positions(indexes: Tuple[Index, ...], length: int) -> List[int]:
+    """把索引列表换算为不越界、不重复且保持书写顺序的下标"""
+    positions = {}
+    for item in indexes:
+        if isinstance(item, int):
+            if 0 <= item < length:
+                positions[item] = None
+            elif item < 0 and length >= -item:
+                positions[item + length] = None
+            continue
+
+        start, end, step = item
+        step = 1 if step is None else step
+        start = 0 if start is None else start + length if start < 0 else start
+        end = length - 1 if end is None else end + length if end < 0 else end
+        if (start < 0 and end < 0) or (start >= length and end >= length):
+            continue
+        start = min(max(start, 0), length - 1)
+        end = min(max(end, 0), length - 1)
+        if start == end or step >= length:
+            positions[start] = None
+            continue
+        step = step if step > 0 else step + length if -step < length else 1
+        sequence = range(start, end + 1, step) if end > start else range(start, end - 1, -step)
+        positions.update(dict.fromkeys(sequence))
+    return list(positions)
+
+
+def select_step(element: Element, step: Step) -> List[Element]:
+    """在元素上执行一段默认语法规则"""
+    kind, name = step.kind, step.name
+    document = element.document
+    if not step.before or kind == "children":
+        elements = element.elements
+    elif kind == "class":
+        elements = document.by_class(name, element)
+    elif kind == "tag":
+        elements = document.by_tag(name, element)
+    elif kind == "id":
+        elements = document.by_id(name, element)
+    elif kind == "text":
+        lowered = name.lower()
+        elements = [item for item in document.subtree(element) if item.pos and lowered in item.own_text().lower()]
+    else:
+        elements = select(element, step.before)
+
+    if not step.split:
+        return list(elements)
+    positions = _index_positions(step.indexes, len(elements))
+    if step.split == "!":
+        excluded = set(positions)
+        return [item for position, item in enumerate(elements) if position not in excluded]
+    return [elements[position] for position in positions]
+
+
+def select_elements(scope: Union[Element, List[Element]], rule: str, css: bool = False) -> List[Element]:
+    """
+    执行默认语法或 @css: 规则，返回元素列表
+
+    参数:
+        scope: 起始元素或元素列表
+        rule: 去掉 @css: 或 @@ 前缀的规则
+        css: 是否整条规则都是 CSS 选择器
+    """
+    elements = scope if isinstance(scope, list) else [scope]
+    if css:
+        return _dedupe([found for element in elements for found in select(element, rule)])
+    for step in compile_steps(rule):
+        elements = [found for element in elements for found in select_step(element, step)]
+    return elements
+
+
+def select_strings(scope: Union[Element, List[Element]], rule: str, css: bool = False) -> List[str]:
+    """
+    执行默认语法或 @css: 规则，最后一段作为取值规则
+
+    取值规则为 text、textNodes、ownText、html、all 或属性名，
+    只有一段时直接对起始元素取值。
+    """
+    elements = scope if isinstance(scope, list) else [scope]
+    if css:
+        selector, separator, last = rule.rpartition("@")
+        if not separator:
+            return [item.outer_html() for item in select_elements(elements, rule, True)]
+        elements = select_elements(elements, selector, True)
+    else:
+        selector, separator, last = rule.rpartition("@")
+        if separator:
+            elements = select_elements(elements, selector)
+    return extract(elements, last.strip())
+
+
+def extract(elements: List[Element], last: str) -> List[str]:
+    """按取值规则从元素中取出字符串，属性值去重"""
+    values: List[str] = []
+    if not elements:
+        return values
+    if last == "text":
+        values = [text for text in (element.text() for element in elements) if text]
+    elif last == "ownText":
+        values = [text for text in (element.own_text() for element in elements) if text]
+    elif last == "textNodes":
+        for element in elements:
+            lines = [line for line in (node.strip() for node in element.text_nodes()) if line]
+            if lines:
+                values.append("\n".join(lines))
+    elif last == "html":
+        html = "\n".join(element.outer_html(("script", "style")) for element in elements)
+        if html:
+            values.append(html)
+    elif last == "all":
+        values.append("\n".join(element.outer_html() for element in elements))
+    else:
+        seen = set()
+        for element in elements:
+            value = element.attr(last)
+            if value.strip() and value not in seen:
+                seen.add(value)
+                values.append(value)
+    return values
+
+
+def _dedupe(elements: List[Element]) -> List[Element]:
+    seen = set()
+    result = []
+    for element in elements:
+        key = (id(element.document), element.pos)
+        if key not in seen:
+            seen.add(key)
+            result.append(element)
+    return result
@@ -1,38 +1,73 @@
-from typing import List, Optional, Tuple
+import re
+from typing import Callable, List, Optional, Tuple
+
+from .rule_type import RuleType
 
 class TokenizerError(Exception):
     pass
 
-class Check:
-    def __init__(self, text: str, stack: List[str], token_list: List[str]):
+# 各分词器关心的特殊字符，其余字符整段跳过，不再逐字符处理
+_RULE_SPECIAL = re.compile(r"[@{}|&%<\\#$]")
+_URL_SPECIAL = re.compile(r"[@{<\\]")
+_INNER_SPECIAL = re.compile(r"\{")
+_PAGE_SPECIAL = re.compile(r"[{,]")
+_BRACE = re.compile(r"[{}]")
+
+# 规则程序分词器的标记，与阅读 AnalyzeRule 的 splitSourceRule 与 SourceRule 保持一致
+_PROGRAM_JS = re.compile(r"<js>([\w\W]*?)</js>|@js:([\w\W]*)", re.IGNORECASE)
+_PROGRAM_PUT = re.compile(r"@put:(\{[^}]+?\})", re.IGNORECASE)
+_PROGRAM_EVAL = re.compile(r"@get:\{([^}]+?)\}|\{\{([\w\W]*?)\}\}|\$(\d{1,2})", re.IGNORECASE)
+_PROGRAM_JSON_INNER = re.compile(r"\{(\$\.[^}]*)\}")
+_PROGRAM_PREFIXES = (("@css:", RuleType.DefaultOrEnd), ("@@", RuleType.DefaultOrEnd), ("@xpath:", RuleType.Xpath),
+                     ("@json:", RuleType.Json))
+_OPEN_BRACKETS = {"[": "]", "(": ")"}
+
+JOIN_OPERATORS: Tuple[str, ...] = ("&&", "||", "%%")
+
+# 规则程序分词器的语法单元：(类型, 内容)
+ProgramToken = Tuple[RuleType, str]
+
+
+class _TokenWriter:
+    """
+    按偏移量记录语法单元
+
+    当前单元由 prefix + text[start:end] 组成，只在单元结束时切片一次。
+    prefix 用于还原块处理后遗留在单元开头的文本，绝大多数情况下为空。
+    """
+    __slots__ = ("text", "tokens", "start", "prefix")
+
+    def __init__(self, text: str):
         self.text = text
-        self.stack = stack
-        self.token_list = token_list
-        self.length = len(text)
-
-    def ck(self, cursor: int, tmp_str: str, token_text: str = "", push_stack: str = "", stack_index: Optional[int] = None, stack_text: str= ""):
-        if self.length < cursor + len(token_text):
-            return cursor, tmp_str, False
-
-        if token_text and self.text[cursor: cursor + len(token_text)].lower() == token_text:
-            if stack_index is not None:
-                if not self.stack or self.stack[stack_index] != stack_text:
-                    return cursor, tmp_str, False
-                self.stack.pop()
-            elif push_stack:
-                self.stack.append(push_stack)
-
-            self.token_list.append(tmp_str)
-            self.token_list.append(token_text)
-            cursor += len(token_text)
-            tmp_str = ""
-            return cursor, tmp_str, True
-        elif not token_text:
-            if self.stack and self.stack[stack_index] == stack_text:
-                self.stack.pop()
-                return cursor, tmp_str, True
-
-        return cursor, tmp_str, False
+        self.tokens: List[str] = []
+        self.start = 0
+        self.prefix = ""
+
+    def pending(self, end: Optional[int] = None) -> str:
+        piece = self.text[self.start:end]
+        return self.prefix + piece if self.prefix else piece
+
+    def cut(self, end: int, token: str, resume: int) -> None:
+        """在 end 处结束当前单元并写入分隔标记，下一个单元从 resume 开始"""
+        self.tokens.append(self.pending(end))
+        self.tokens.append(token)
+        self.start = resume
+        self.prefix = ""
+
+    def restart(self, resume: int, prefix: str = "") -> None:
+        """丢弃当前单元，从 resume 处重新开始"""
+        self.start = resume
+        self.prefix = prefix
+
+
+def _marker_matcher(text: str) -> Callable[[str, int], bool]:
+    """返回大小写不敏感的标记匹配函数，整段文本只转换一次小写"""
+    lowered = text.lower()
+    if len(lowered) == len(text):
+        return lowered.startswith
+    # 个别字符小写后长度会变化，此时退回到逐段转换
+    return lambda marker, cursor: text[cursor:cursor + len(marker)].lower() == marker
+
 
 def _safe_substring(text: str, start: int, length: Optional[int] = None) -> str:
     if length is None:
@@ -53,222 +88,187 @@ def tokenizer(text: str) -> List[str]:
     if not text:
         return []
 
-    token_list: List[str] = []
+    writer = _TokenWriter(text)
+    tokens = writer.tokens
+    cut = writer.cut
     stack: List[str] = []
+    match = _marker_matcher(text)
+    search = _RULE_SPECIAL.search
     cursor = 0
     length = len(text)
-    tmp_str = ""
 
     try:
-        ck = Check(text, stack, token_list).ck
-
         while cursor < length:
+            if cursor > 1:
+                found = search(text, cursor)
+                if found is None:
+                    break
+                cursor = found.start()
             char = text[cursor]
-            tmp_str += char
 
             if char == "@":
                 # @标记的复杂处理逻辑
-                if (result := ck(cursor, tmp_str[:-1], "@get:{", "@get:{"))[2]:
-                    cursor, tmp_str, __ = _process_block_marker_1(text, cursor, length, "@get:{")
-                elif (result := ck(cursor, tmp_str[:-1], "@put:{", "@put:{"))[2]:
-                    cursor, tmp_str, __ = _process_block_marker_1(text, cursor, length, "@put:{")
-                elif (result := ck(cursor, tmp_str[:-1], "@css:"))[2]:
-                    cursor, tmp_str, __ = result
-                elif (result := ck(cursor, tmp_str[:-1], "@json:", "@json:"))[2]:
-                    cursor, tmp_str, __ = result
-                elif (result := ck(cursor, tmp_str[:-1], "@@"))[2]:
-                    cursor, tmp_str, __ = result
-                elif (result := ck(cursor, tmp_str[:-1], "@js:"))[2]:
-                    cursor, tmp_str, __ = _process_js_block(text, cursor, length)
+                if match("@get:{", cursor) or match("@put:{", cursor):
+                    marker = "@get:{" if match("@get:{", cursor) else "@put:{"
+                    stack.append(marker)
+                    cut(cursor, marker, cursor)
+                    body = cursor + len(marker)
+                    cursor = _skip_block_marker_1(text, body, length)
+                    writer.restart(body, marker)
+                elif match("@css:", cursor):
+                    cut(cursor, "@css:", cursor + 5)
+                    cursor += 5
+                elif match("@json:", cursor):
+                    stack.append("@json:")
+                    cut(cursor, "@json:", cursor + 6)
+                    cursor += 6
+                elif text.startswith("@@", cursor):
+                    cut(cursor, "@@", cursor + 2)
+                    cursor += 2
+                elif match("@js:", cursor):
+                    cut(cursor, "@js:", cursor)
+                    cursor = _skip_js_block(text, cursor, length)
+                    writer.restart(cursor, text[cursor:])
                 elif text[cursor - 1] == "[":
                     cursor += 1
-                elif stack and stack[-1].lower() == "@json:":
+                elif stack and stack[-1] == "@json:":
                     cursor += 1
                 else:
-                    token_list.append(tmp_str[:-1])
-                    token_list.append("@")
+                    cut(cursor, "@", cursor + 1)
                     cursor += 1
-                    tmp_str = ""
 
             elif char == "{":
                 # 处理块标记
-                if (result := ck(cursor, tmp_str[:-1], "{{", "{{"))[2]:
-                    cursor, tmp_str, __ = _process_double_brace_block(text, cursor, length)
-                elif len(text) - 1 > cursor + 3 and text[cursor: cursor + 3] == "{$.":
+                if text.startswith("{{", cursor):
+                    stack.append("{{")
+                    cut(cursor, "{{", cursor)
+                    cursor = _skip_double_brace_block(text, cursor, length)
+                    writer.restart(cursor, text[cursor:] if cursor < length else text)
+                elif length - 1 > cursor + 3 and text.startswith("{$.", cursor):
                     stack.append("{")
-                    token_list.append(tmp_str[:-1])
-                    token_list.append("{")
+                    cut(cursor, "{", cursor + 1)
                     cursor += 1
-                    tmp_str = ""
                 else:
                     cursor += 1
 
             elif char == "}":
                 # 处理结束标记
-                if (result := ck(cursor, tmp_str[:-1], "}", "", -1, "{"))[2]:
-                    cursor, tmp_str, __ = result
-                else:
-                    cursor += 1
+                if stack and stack[-1] == "{":
+                    stack.pop()
+                    cut(cursor, "}", cursor + 1)
+                cursor += 1
 
             elif char == "|":
                 # 处理管道标记
                 if stack and stack[-1] == "{{":
                     cursor += 1
-                elif (result := ck(cursor, tmp_str[:-1], "||"))[2]:
-                    cursor, tmp_str, __ = result
-                else:
-                    cursor += 1
-
-            elif char == "&":
-                # 处理与标记
-                if len(text) - 1 < cursor + 1:
-                    break
-                elif text[cursor + 1] == "&" and not (stack and stack[0] != "@json:"):
-                    token_list.append(tmp_str[:-1])
-                    token_list.append("&&")
+                elif text.startswith("||", cursor):
+                    cut(cursor, "||", cursor + 2)
                     cursor += 2
-                    tmp_str = ""
                 else:
                     cursor += 1
 
-            elif char == "%":
-                # 处理百分号标记
-                if len(text) - 1 < cursor + 1:
+            elif char == "&" or char == "%":
+                # 处理与标记、百分号标记
+                if length - 1 < cursor + 1:
                     break
-                elif text[cursor + 1] == "%" and not (stack and stack[0] != "@json:"):
-                    token_list.append(tmp_str[:-1])
-                    token_list.append(r"%%")
+                elif text[cursor + 1] == char and (not stack or stack[0] == "@json:"):
+                    cut(cursor, char + char, cursor + 2)
                     cursor += 2
-                    tmp_str = ""
                 else:
                     cursor += 1
 
             elif char == "<":
                 # 处理JavaScript和标签标记
-                if (result := ck(cursor, tmp_str[:-1], "<js>", "<js>"))[2]:
-                    cursor, tmp_str, __ = _process_js_tag_block(text, cursor, length)
-                else:
-                    cursor += 1
+                if match("<js>", cursor):
+                    stack.append("<js>")
+                    cut(cursor, "<js>", length)
+                    break
+                cursor += 1
 
             elif char == "\\":
-                # 处理转义字符
-                tmp_str += text[cursor + 1] if cursor + 1 < length else ""
+                # 处理转义字符，转义符与被转义字符都保留在单元中
                 cursor += 2
 
             elif (char in {"+", "-", ":"}) and cursor == 0:
                 # 处理特殊起始字符
-                token_list.append(char)
+                cut(cursor, char, cursor + 1)
                 cursor += 1
-                tmp_str = ""
 
             elif char == ":" and cursor == 1:
-                # 处理特殊冒号
-                token_list.append(char)
+                # 处理特殊冒号，冒号之前的单字符不计入结果
+                tokens.append(char)
                 cursor += 1
-                tmp_str = ""
+                writer.restart(cursor)
 
             elif char == "#":
                 # 处理井号标记
-                if (result := ck(cursor, tmp_str[:-1], "####"))[2]:
-                    cursor, tmp_str, __ = result
-                elif (result := ck(cursor, tmp_str[:-1], "##"))[2]:
-                    cursor, tmp_str, __ = _process_double_hash_block(text, cursor, length)
+                if text.startswith("####", cursor):
+                    cut(cursor, "####", cursor + 4)
+                    cursor += 4
+                elif text.startswith("##", cursor):
+                    cut(cursor, "##", cursor)
+                    cursor = _skip_double_hash_block(text, cursor, length)
+                    writer.restart(cursor, text[cursor:])
                 else:
                     cursor += 1
 
             elif char == "$":
                 # 处理美元符号
-                if len(text) - 1 < cursor + 1:
+                if length - 1 < cursor + 1:
                     break
                 if text[cursor + 1].isnumeric():
-                    token_list.append(tmp_str[:-1])
-                    token_list.append("$" + text[cursor + 1])
+                    cut(cursor, "$" + text[cursor + 1], cursor + 2)
                     cursor += 2
-                    tmp_str = ""
                 else:
                     cursor += 1
 
             else:
                 cursor += 1
 
-        token_list.append(tmp_str)
-        return list(filter(None, token_list))
+        tokens.append(writer.pending())
+        return list(filter(None, tokens))
 
     except Exception as e:
         raise TokenizerError(f"分词器处理出错: {e}") from e
 
 
-def _process_block_marker_1(text: str, cursor: int, length: int, marker: str) -> Tuple[int, str, Optional[str]]:
-    """处理特定的块标记"""
-    cursor += len(marker)
-    tmp_str = marker
-    while cursor < length:
-        char = text[cursor]
-        tmp_str += char
-        if char == "}":
-            break
+def _skip_block_marker_1(text: str, cursor: int, length: int) -> int:
+    """跳过 @get:{ / @put:{ 的块内容，返回右花括号之后的位置"""
+    end = text.find("}", cursor)
+    return length if end < 0 else end + 1
+
+
+def _skip_double_brace_block(text: str, cursor: int, length: int) -> int:
+    """跳过双重大括号块，返回与之配对的右花括号之后的位置"""
+    depth = 1
+    search = _BRACE.search
+    cursor += 1
+    while True:
+        found = search(text, cursor)
+        if found is None:
+            # 与逐字符扫描越界时的行为保持一致
+            raise IndexError("string index out of range")
+        cursor = found.start()
+        if text[cursor] == "{":
+            depth += 1
+        else:
+            depth -= 1
+            if not depth:
+                return cursor + 1
         cursor += 1
-    return cursor + 1, tmp_str, None
 
 
-def _process_double_brace_block(text: str, cursor: int, length: int) -> Tuple[int, str, Optional[str]]:
-    """处理双重大括号块"""
-    stack = ["{"]
-    while cursor < length:
-        cursor += 1
-        char = text[cursor]
-        if char == "{":
-            stack.append("{")
-        elif char == "}":
-            if stack and stack[-1] == "{":
-                stack.pop()
-                if not stack:
-                    break
-    return cursor + 1, text[cursor - len(text) + 1:], None
-
+def _skip_js_block(text: str, cursor: int, length: int) -> int:
+    """跳过JavaScript块，遇到 ### 结束"""
+    end = text.find("###", cursor)
+    return length if end < 0 else end + 3
 
-def _process_js_block(text: str, cursor: int, length: int) -> Tuple[int, str, Optional[str]]:
-    """处理JavaScript块"""
-    while cursor < length:
-        char = text[cursor]
-        if char == "#":
-            if cursor + 2 < length and text[cursor:cursor + 3] == "###":
-                cursor += 3
-                break
-            elif cursor + 1 < length and text[cursor:cursor + 2] == "##":
-                cursor += 2
-        cursor += 1
-    return cursor, text[cursor:], None
-
-
-def _process_js_tag_block(text: str, cursor: int, length: int) -> Tuple[int, str, Optional[str]]:
-    """处理JavaScript标签块"""
-    while cursor < length:
-        char = text[cursor]
-        if char == "<":
-            if cursor + 5 < length and text[cursor:cursor + 6] == "</js>":
-                cursor += 6
-                break
-        cursor += 1
-    return cursor, text[cursor:], None
 
+def _skip_double_hash_block(text: str, cursor: int, length: int) -> int:
+    """跳过双井号块，遇到 ### 结束"""
+    return _skip_js_block(text, cursor, length)
 
-def _process_double_hash_block(text: str, cursor: int, length: int) -> Tuple[int, str, Optional[str]]:
-    """处理双井号块"""
-    while cursor < length:
-        char = text[cursor]
-        if char == "#":
-            if cursor + 2 < length and text[cursor:cursor + 3] == "###":
-                cursor += 3
-                break
-            elif cursor + 1 < length and text[cursor:cursor + 2] == "##":
-                cursor += 2
-        elif char == "@":
-            if cursor + 4 < length and text[cursor:cursor + 5] == "@js:":
-                cursor = length
-                break
-        cursor += 1
-    return cursor, text[cursor:], None
 
 def tokenizer_url(text: str) -> List[str]:
     """
@@ -283,61 +283,58 @@ def tokenizer_url(text: str) -> List[str]:
     if not text:
         return []
 
-    token_list: List[str] = []
+    writer = _TokenWriter(text)
+    cut = writer.cut
     stack: List[str] = []
+    match = _marker_matcher(text)
+    search = _URL_SPECIAL.search
     cursor = 0
     length = len(text)
-    tmp_str = ""
 
     try:
-        ck = Check(text, stack, token_list).ck
-
         while cursor < length:
+            found = search(text, cursor)
+            if found is None:
+                break
+            cursor = found.start()
             char = text[cursor]
-            tmp_str += char
 
             # 处理特殊标记
             if char == "@":
-                # JS标记处理
-                if (result := ck(cursor, tmp_str[:-1], "@js:"))[2]:
-                    cursor, tmp_str, __ = result
-                    # 直接截取剩余文本
-                    tmp_str = text[cursor:]
+                # JS标记处理，直接截取剩余文本
+                if match("@js:", cursor):
+                    cut(cursor, "@js:", cursor + 4)
                     break
-                else:
-                    cursor += 1
+                cursor += 1
 
             # 处理块标记
             elif char == "{":
-                if (result := ck(cursor, tmp_str[:-1], "{{", "{{"))[2]:
-                    cursor, tmp_str, __ = result
-                    cursor = _process_block_marker(text, cursor, length, stack, "{", "}}")
+                if text.startswith("{{", cursor):
+                    stack.append("{{")
+                    cursor = _process_block_marker(text, cursor + 2, length, stack, "{", "}}")
+                    cut(found.start(), "{{", cursor)
                 else:
                     cursor += 1
 
             # 处理JavaScript标记
             elif char == "<":
-                if (result := ck(cursor, tmp_str[:-1], "<js>", "<js>"))[2]:
-                    cursor, tmp_str, __ = result
-                    cursor = _process_js_marker(text, cursor, length)
+                if match("<js>", cursor):
+                    stack.append("<js>")
+                    cut(cursor, "<js>", length)
+                    break
 
                 # 处理通用的尖括号标记
-                elif (result := ck(cursor, tmp_str[:-1], "<", "<"))[2]:
-                    cursor, tmp_str, __ = result
-                    cursor = _process_bracket_marker(text, cursor, length, ">")
-                else:
-                    cursor += 1
+                stack.append("<")
+                end = text.find(">", cursor + 1)
+                cut(cursor, "<", length + 1 if end < 0 else end + 1)
+                cursor = writer.start
 
             # 处理转义字符
-            elif char == "\\":
-                tmp_str += text[cursor + 1] if cursor + 1 < length else ""
-                cursor += 2
-
             else:
-                cursor += 1
+                cursor += 2
 
-        token_list.append(tmp_str)
-        return list(filter(None, token_list))
+        writer.tokens.append(writer.pending())
+        return list(filter(None, writer.tokens))
 
     except Exception as e:
         raise TokenizerError(f"URL分词器处理出错: {e}") from e
@@ -356,33 +353,31 @@ def tokenizer_inner(text: str) -> List[str]:
     if not text:
         return []
 
-    token_list: List[str] = []
+    writer = _TokenWriter(text)
     stack: List[str] = []
+    search = _INNER_SPECIAL.search
     cursor = 0
     length = len(text)
-    tmp_str = ""
 
     try:
-        ck = Check(text, stack, token_list).ck
-
         while cursor < length:
-            char = text[cursor]
-            tmp_str += char
+            found = search(text, cursor)
+            if found is None:
+                break
+            cursor = found.start()
 
             # 处理块标记
-            if char == "{":
-                if (result := ck(cursor, tmp_str[:-1], "{{", "{{"))[2]:
-                    cursor, tmp_str, __ = result
-                    cursor = _process_block_marker(text, cursor, length, stack, "{", "}}")
-                else:
-                    stack.append("{")
-                    cursor += 1
-
+            if text.startswith("{{", cursor):
+                stack.append("{{")
+                end = _process_block_marker(text, cursor + 2, length, stack, "{", "}}")
+                writer.cut(cursor, "{{", end)
+                cursor = end
             else:
+                stack.append("{")
                 cursor += 1
 
-        token_list.append(tmp_str)
-        return list(filter(None, token_list))
+        writer.tokens.append(writer.pending())
+        return list(filter(None, writer.tokens))
 
     except Exception as e:
         raise TokenizerError(f"内部分词器处理出错: {e}") from e
@@ -401,41 +396,39 @@ def split_page(text: str) -> List[str]:
     if not text:
         return []
 
-    token_list: List[str] = []
+    writer = _TokenWriter(text)
     stack: List[str] = []
+    search = _PAGE_SPECIAL.search
     cursor = 0
     length = len(text)
-    tmp_str = ""
 
     try:
-        ck = Check(text, stack, token_list).ck
-
         while cursor < length:
-            char = text[cursor]
-            tmp_str += char
+            found = search(text, cursor)
+            if found is None:
+                break
+            cursor = found.start()
 
             # 处理块标记
-            if char == "{":
-                if len(text) - 1 < cursor + 1:
+            if text[cursor] == "{":
+                if length - 1 < cursor + 1:
                     break
 
-                if text[cursor: cursor + 2] == "{{":
-                    cursor += 1
-                    cursor = _process_block_marker(text, cursor, length, stack, "{", "}}")
-
+                if text.startswith("{{", cursor):
+                    # 块内容不计入结果，仅保留起始的左花括号
+                    kept = writer.pending(cursor + 1)
+                    cursor = _process_block_marker(text, cursor + 1, length, stack, "{", "}}")
+                    writer.restart(cursor, kept)
                 else:
                     cursor += 1
 
             # 处理逗号分隔
-            elif char == ",":
-                if (result := ck(cursor, tmp_str[:-1], ","))[2]:
-                    cursor, tmp_str, __ = result
-
             else:
+                writer.cut(cursor, ",", cursor + 1)
                 cursor += 1
 
-        token_list.append(tmp_str)
-        return list(filter(lambda x: x != ",", token_list))
+        writer.tokens.append(writer.pending())
+        return list(filter(lambda x: x != ",", writer.tokens))
 
     except Exception as e:
         raise TokenizerError(f"页面分割器处理出错: {e}") from e
@@ -457,71 +450,241 @@ def _process_block_marker(text: str, cursor: int, length: int, stack: List[str],
         返回:
             处理后的游标位置
         """
+    search = _BRACE.search
     while cursor < length:
-        char = text[cursor]
+        found = search(text, cursor)
+        if found is None:
+            return length
+        cursor = found.start()
 
-        if char == open_marker:
+        if text[cursor] == open_marker:
             stack.append(open_marker)
             cursor += 1
-        elif char == "}":
-            if stack and stack[-1] == open_marker:
-                stack.pop()
-                cursor += 1
-            elif len(text) - cursor > 1 and text[cursor:cursor + 2] == close_marker:
-                cursor += 2
-                break
-            else:
-                cursor += 1
+        elif stack and stack[-1] == open_marker:
+            stack.pop()
+            cursor += 1
+        elif text.startswith(close_marker, cursor):
+            cursor += 2
+            break
         else:
             cursor += 1
 
     return cursor
 
 
-def _process_js_marker(text: str, cursor: int, length: int) -> int:
+def tokenizer_program(text: str, contentIsJson: bool = False) -> List[ProgramToken]:
     """
-        处理JavaScript标记的特殊逻辑
+        规则程序分词器，rule_program.compile_program 按其结果构建语法树
 
-        参数:
-            text: 源文本
-            cursor: 当前游标位置
-            length: 文本长度
+        tokenizer 只记录语法单元的边界，JS、正则与模板的内容都不保留；这里按阅读 AnalyzeRule 的处理顺序
+        依次拆出排序符号、AllInOne 正则、JS、@put、前缀、##替换 与模板或连接符，每个单元保留完整内容：
 
-        返回:
-            处理后的游标位置
-        """
-    while cursor < length:
-        char = text[cursor]
+            rule     := [Order] (RuleSymbol(:) Regex | (Js | segment)*)
+            segment  := Put* [RuleSymbol] body (RuleSymbol(##) Regex)*
+            body     := (Format | Get | Inner | JsonInner | Regex)*   模板，Regex 为 $1 分组序号
+                      | operand (JoinSymbol operand)*                operand 为 DefaultOrEnd、Json 或 Xpath
 
-        if char == "<":
-            if len(text) - cursor > 5 and text[cursor:cursor + 6] == "</js>":
-                cursor += 6
-                break
-
-        cursor += 1
-
-    return cursor
+        segment 开头的 RuleSymbol 为 @css:、@@、@xpath:、@json: 前缀，operand 的类型已按前缀与 contentIsJson 确定，
+        @css: 之后的 operand 为 CSS 选择器。
 
+        参数:
+            text: 规则文本
+            contentIsJson: 内容是否为 JSON，为 True 时默认语法按 JSONPath 处理
 
-def _process_bracket_marker(text: str, cursor: int, length: int, close_char: str) -> int:
+        返回:
+            (类型, 内容) 的列表
+        """
+    tokens: List[ProgramToken] = []
+    body = text
+    if body[:1] in ("-", "+"):
+        tokens.append((RuleType.Order, body[0]))
+        body = body[1:]
+    if body.startswith(":"):
+        tokens.append((RuleType.RuleSymbol, ":"))
+        tokens.append((RuleType.Regex, body[1:]))
+        return tokens
+    tokens.extend(tokenizer_source(body, contentIsJson))
+    return tokens
+
+
+def tokenizer_source(text: str, contentIsJson: bool = False) -> List[ProgramToken]:
     """
-    处理通用的括号标记
+        与 tokenizer_program 相同，但不处理开头的排序符号与 AllInOne 正则，用于 @put 的值与 {{ }} 中的规则
 
-    参数:
-        text: 源文本
-        cursor: 当前游标位置
-        length: 文本长度
-        close_char: 关闭字符
+        参数:
+            text: 规则文本
+            contentIsJson: 内容是否为 JSON
 
-    返回:
-        处理后的游标位置
+        返回:
+            (类型, 内容) 的列表
+        """
+    tokens: List[ProgramToken] = []
+    start = 0
+    for matcher in _PROGRAM_JS.finditer(text):
+        _tokenize_segment(text[start:matcher.start()], contentIsJson, tokens)
+        code = matcher.group(2) if matcher.group(2) is not None else matcher.group(1)
+        tokens.append((RuleType.Js, code))
+        start = matcher.end()
+    _tokenize_segment(text[start:], contentIsJson, tokens)
+    return tokens
+
+
+def split_rule(rule: str, separators: Tuple[str, ...]) -> Tuple[Optional[str], List[str]]:
     """
-    while cursor < length:
-        char = text[cursor]
+        在括号与引号之外按分隔符拆分规则，只使用最先出现的那一种分隔符
 
-        if char == close_char:
-            break
+        参数:
+            rule: 规则文本
+            separators: 候选分隔符
 
+        返回:
+            (实际使用的分隔符, 拆分结果)，没有分隔符时为 (None, [rule])
+        """
+    separator: Optional[str] = None
+    parts: List[str] = []
+    start = 0
+    for cursor, matched in _iter_separators(rule, separators):
+        if separator is None:
+            separator = matched
+        elif matched != separator:
+            continue
+        parts.append(rule[start:cursor])
+        start = cursor + len(matched)
+
+    if separator is None:
+        return None, [rule]
+    parts.append(rule[start:])
+    return separator, parts
+
+
+def _iter_separators(rule: str, separators: Tuple[str, ...]):
+    """依次返回括号与引号之外的 (位置, 分隔符)，反斜杠转义的字符不参与匹配"""
+    closing: List[str] = []
+    quote = ""
+    cursor = 0
+    length = len(rule)
+    while cursor < length:
+        char = rule[cursor]
+        if char == "\\":
+            cursor += 2
+            continue
+        if quote:
+            if char == quote:
+                quote = ""
+        elif closing:
+            if char in "'\"":
+                quote = char
+            elif char in _OPEN_BRACKETS:
+                closing.append(_OPEN_BRACKETS[char])
+            elif char == closing[-1]:
+                closing.pop()
+        elif char in _OPEN_BRACKETS:
+            closing.append(_OPEN_BRACKETS[char])
+        else:
+            matched = next((item for item in separators if rule.startswith(item, cursor)), None)
+            if matched:
+                yield cursor, matched
+                cursor += len(matched)
+                continue
         cursor += 1
 
-    return cursor + 1
\ No newline at end of file
+
+def _tokenize_segment(segment: str, is_json: bool, tokens: List[ProgramToken]) -> None:
+    """拆分不含 JS 的单段规则，对应阅读的 SourceRule"""
+    segment = segment.strip()
+    if not segment:
+        return
+    # 与阅读一致，@put 整体从规则中移除，其余部分拼接后继续处理
+    puts = _PROGRAM_PUT.findall(segment)
+    if puts:
+        tokens.extend((RuleType.Put, item) for item in puts)
+        segment = _PROGRAM_PUT.sub("", segment)
+
+    rule = segment.strip()
+    head = rule[:7].lower()
+    css = False
+    for prefix, rule_type in _PROGRAM_PREFIXES:
+        if head.startswith(prefix):
+            tokens.append((RuleType.RuleSymbol, rule[:len(prefix)]))
+            rule = rule[len(prefix):]
+            css = prefix == "@css:"
+            break
+    else:
+        if is_json or rule.startswith(("$.", "$[")):
+            rule_type = RuleType.Json
+        elif rule.startswith("/"):
+            rule_type = RuleType.Xpath
+        else:
+            rule_type = RuleType.DefaultOrEnd
+
+    parts = _split_replace(rule)
+    body = parts[0].strip() if len(parts) > 1 else rule
+    if body:
+        _tokenize_body(body, rule_type, css, tokens)
+    for piece in parts[1:]:
+        tokens.append((RuleType.RuleSymbol, "##"))
+        tokens.append((RuleType.Regex, piece))
+
+
+def _tokenize_body(body: str, rule_type: RuleType, css: bool, tokens: List[ProgramToken]) -> None:
+    """拆分 ## 之前的规则：含 {{ }}、@get:{ } 或 $1 时为模板，含 {$. } 时为 JSON 模板，否则按连接符拆分"""
+    if not css:
+        found = _tokenize_template(body, _PROGRAM_EVAL, tokens)
+        if found:
+            return
+        json_template = rule_type is RuleType.DefaultOrEnd or (rule_type is RuleType.Json and not body.startswith("$"))
+        if json_template and "{$." in body:
+            if not _tokenize_template(body, _PROGRAM_JSON_INNER, tokens):
+                tokens.append((RuleType.Format, body))
+            return
+
+    start = 0
+    for cursor, matched in _iter_separators(body, JOIN_OPERATORS):
+        tokens.append((rule_type, body[start:cursor]))
+        tokens.append((RuleType.JoinSymbol, matched))
+        start = cursor + len(matched)
+    tokens.append((rule_type, body[start:]))
+
+
+def _tokenize_template(body: str, pattern: "re.Pattern[str]", tokens: List[ProgramToken]) -> bool:
+    """按 pattern 拆出模板中的表达式，之间的文本为 Format，没有表达式时不写入任何单元并返回 False"""
+    start = 0
+    for matcher in pattern.finditer(body):
+        if matcher.start() > start:
+            tokens.append((RuleType.Format, body[start:matcher.start()]))
+        if pattern is _PROGRAM_JSON_INNER:
+            tokens.append((RuleType.JsonInner, matcher.group(1)))
+        else:
+            key, inner, group = matcher.groups()
+            if key is not None:
+                tokens.append((RuleType.Get, key))
+            elif inner is not None:
+                tokens.append((RuleType.Inner, inner))
+            else:
+                tokens.append((RuleType.Regex, group))
+        start = matcher.end()
+    if not start:
+        return False
+    if len(body) > start:
+        tokens.append((RuleType.Format, body[start:]))
+    return True
+
+
+def _split_replace(rule: str) -> List[str]:
+    """按 ## 拆分 规则##正则##替换内容###，{{ }} 中的 ## 不参与拆分"""
+    parts: List[str] = []
+    start = 0
+    cursor = 0
+    length = len(rule)
+    while cursor < length:
+        if rule.startswith("{{", cursor):
+            end = rule.find("}}", cursor + 2)
+            cursor = length if end < 0 else end + 2
+        elif rule.startswith("##", cursor):
+            parts.append(rule[start:cursor])
+            cursor += 2
+            start = cursor
+        else:
+            cursor += 1
+    parts.append(rule[start:])
+    return parts
@@ -0,0 +1,358 @@
+import ast
+import json
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, MutableMapping, Optional, Tuple, Union
+from urllib.parse import quote, urljoin
+
+from .legado_http import Request
+from .rule_analyzer import AnalyzeRule, to_string
+from .rule_js import JsError, get_js_pool
+
+_JS = re.compile(r"<js>([\w\W]*?)</js>|@js:([\w\W]*)", re.IGNORECASE)
+# 与阅读一致按 ,{ 拆分请求参数，但 ,{{ 是尚未替换的表达式，不是请求参数
+_OPTION_SEPARATOR = re.compile(r"\s*,\s*(?=\{(?!\{))")
+_SPECIAL = re.compile(r"\{\{|<")
+# 请求头的值只能是 ASCII，其中的可见字符保持原样，其余字符按 UTF-8 百分号编码
+_HEADER_SAFE = "".join(chr(code) for code in range(0x20, 0x7f))
+# JavaScript escape 不编码的字符
+_ESCAPE_SAFE = frozenset("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789@*_+-./")
+_ARITHMETIC = (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.USub,
+               ast.UAdd, ast.Constant, ast.Name, ast.Load)
+
+
+class UrlContext:
+    """
+    一次渲染的参数，脚本用到的执行器按需创建
+
+    quoting 决定 {{key}} 如何写入当前部分：url 按 encoding 百分号编码（地址与表单 body），
+    json 按 JSON 字符串转义（JSON body），空字符串保持原样（请求头与请求参数本身）。
+    """
+    __slots__ = ("key", "page", "base_url", "variables", "encoding", "quoting", "_analyzer")
+
+    def __init__(self, key: str, page: int, base_url: str, variables: Optional[MutableMapping[str, str]],
+                 encoding: str) -> None:
+        self.key = key
+        self.page = page
+        self.base_url = base_url
+        self.variables = variables
+        self.encoding = encoding
+        self.quoting = "url"
+        self._analyzer: Optional[AnalyzeRule] = None
+
+    def eval_js(self, code: str, result: Any = None) -> Any:
+        """执行地址中的脚本，可以使用 key、page、baseUrl、result 与 java.*"""
+        if self._analyzer is None:
+            self._analyzer = AnalyzeRule("", self.base_url, self.variables)
+        bindings = {"key": self.key, "page": self.page, "baseUrl": self.base_url, "result": result}
+        return get_js_pool().evaluate(code, bindings, self._analyzer)
+
+
+Part = Union[str, Callable[[UrlContext], str]]
+
+
+@dataclass(frozen=True, slots=True)
+class UrlTemplate:
+    """
+    编译后的 searchUrl / exploreUrl 等地址模板
+
+    地址只在编译时扫描一次，渲染时按编译结果拼接。处理顺序与阅读的 AnalyzeUrl 一致：
+    先执行 <js></js>、@js: 得到新的地址，再替换 {{ }} 表达式与 <1,2,3> 页码，最后拆出请求参数。
+
+    js: 整段地址中的脚本，依次为 (脚本之前的文本, 脚本)，tail 为最后一段脚本之后的文本
+    url: 地址部分
+    options: 已解析的请求参数，其中 method、body 与 headers 的值为编译后的模板
+    raw_options: 编译时无法解析为 JSON 的请求参数，渲染后再解析
+    """
+    text: str
+    js: Tuple[Tuple[str, str], ...]
+    tail: str
+    url: Tuple[Part, ...]
+    options: Tuple[Tuple[str, Any], ...]
+    raw_options: Optional[Tuple[Part, ...]]
+
+    def render(self, key: str = "", page: int = 1, base_url: str = "",
+               variables: Optional[MutableMapping[str, str]] = None) -> Request:
+        """
+        渲染为请求
+
+        参数:
+            key: 搜索关键字，{{key}} 在地址与表单 body 中按请求参数中的 charset 编码（escape 为 JavaScript
+                escape 编码），在 JSON body 中按 JSON 字符串转义，在请求头中保持原样
+            page: 页码，从 1 开始
+            base_url: 书源地址，用于补全相对地址与脚本中的 baseUrl
+            variables: 脚本中 java.get、java.put 使用的变量表
+
+        返回:
+            请求，method 未指定时有 body 为 POST，否则为 GET
+        """
+        if self.js:
+            context = UrlContext(key, page, base_url, variables, "utf-8")
+            result = self.text
+            for before, code in self.js:
+                if before:
+                    result = before.replace("@result", result)
+                result = to_string(context.eval_js(code, result))
+            if self.tail:
+                result = self.tail.replace("@result", result)
+            template = compile_url(result)
+            if template.js:
+                raise JsError(f"脚本返回的地址中仍有脚本: {result}")
+            return template.render(key, page, base_url, variables)
+
+        options = dict(self.options)
+        if self.raw_options is not None:
+            context = UrlContext(key, page, base_url, variables, "utf-8")
+            # 请求参数整体是 JSON，{{key}} 按 JSON 字符串转义，解析后还原为原文
+            context.quoting = "json"
+            try:
+                parsed = json.loads(_join(self.raw_options, context))
+            except ValueError:
+                parsed = None
+            options = _compile_options(parsed) if isinstance(parsed, dict) else {}
+        charset = options.get("charset")
+        charset = charset if isinstance(charset, str) and charset else None
+        context = UrlContext(key, page, base_url, variables, charset or "utf-8")
+
+        url = _join(self.url, context)
+        body = options.get("body")
+        if body is not None:
+            context.quoting = "json" if _is_json_body(body) else "url"
+            body = _join(body, context)
+        context.quoting = ""
+        method = options.get("method")
+        if isinstance(method, tuple):
+            method = _join(method, context)
+        headers = {}
+        if isinstance(options.get("headers"), dict):
+            headers = {name: _header_value(_join(value, context)) for name, value in options["headers"].items()}
+
+        return Request(
+            urljoin(base_url, url) if base_url else url,
+            method=str(method or ("POST" if body is not None else "GET")).upper(),
+            body=body,
+            headers=headers,
+            # escape 只是关键字的编码方式，响应仍按默认规则解码
+            charset=charset if charset is None or charset.lower() != "escape" else None,
+        )
+
+
+@lru_cache(maxsize=4096)
+def compile_url(text: str) -> UrlTemplate:
+    """编译地址模板，同一地址只编译一次"""
+    text = text.strip()
+    steps = []
+    start = 0
+    for matcher in _JS.finditer(text):
+        steps.append((text[start:matcher.start()].strip(), matcher.group(2) or matcher.group(1) or ""))
+        start = matcher.end()
+    if steps:
+        return UrlTemplate(text, tuple(steps), text[start:].strip(), (), (), None)
+
+    url, option_text = _split_options(text)
+    options: Tuple[Tuple[str, Any], ...] = ()
+    raw_options = None
+    if option_text:
+        try:
+            parsed = json.loads(option_text)
+        except ValueError:
+            parsed = None
+            raw_options = compile_parts(option_text)
+        if isinstance(parsed, dict):
+            options = tuple(_compile_options(parsed).items())
+    return UrlTemplate(text, (), "", compile_parts(url), options, raw_options)
+
+
+def render_url(text: str, key: str = "", page: int = 1, base_url: str = "",
+               variables: Optional[MutableMapping[str, str]] = None) -> Request:
+    """编译并渲染地址模板，参数同 UrlTemplate.render"""
+    return compile_url(text).render(key, page, base_url, variables)
+
+
+def compile_parts(text: str) -> Tuple[Part, ...]:
+    """把文本拆分为字面量、{{ }} 表达式与 <1,2,3> 页码选择"""
+    parts: List[Part] = []
+    literal = 0
+    cursor = 0
+    length = len(text)
+    while cursor < length:
+        found = _SPECIAL.search(text, cursor)
+        if found is None:
+            break
+        cursor = found.start()
+        if text.startswith("{{", cursor):
+            end = _block_end(text, cursor)
+            if end < 0:
+                break
+            if cursor > literal:
+                parts.append(text[literal:cursor])
+            parts.append(_compile_expression(text[cursor + 2:end - 2]))
+        else:
+            end = _page_end(text, cursor)
+            if end < 0:
+                cursor += 1
+                continue
+            if cursor > literal:
+                parts.append(text[literal:cursor])
+            pages = tuple(compile_parts(item.strip()) for item in _split_pages(text[cursor + 1:end - 1]))
+            parts.append(_page_selector(pages))
+        cursor = literal = end
+    if literal < length:
+        parts.append(text[literal:])
+    return tuple(parts)
+
+
+def _join(parts: Tuple[Part, ...], context: UrlContext) -> str:
+    return "".join(part if isinstance(part, str) else part(context) for part in parts)
+
+
+def _is_json_body(parts: Tuple[Part, ...]) -> bool:
+    """body 以 { 或 [ 开头时按 JSON 发送，其余按表单发送"""
+    return bool(parts) and isinstance(parts[0], str) and parts[0].lstrip().startswith(("{", "["))
+
+
+def _header_value(value: str) -> str:
+    return value if value.isascii() else quote(value, safe=_HEADER_SAFE)
+
+
+def _quote_key(context: UrlContext) -> str:
+    if context.quoting == "url":
+        if context.encoding.lower() == "escape":
+            return "".join(char if char in _ESCAPE_SAFE else f"%{ord(char):02X}" if ord(char) < 0x100
+                           else f"%u{ord(char):04X}" for char in context.key)
+        return quote(context.key, safe="", encoding=context.encoding)
+    if context.quoting == "json":
+        return json.dumps(context.key, ensure_ascii=False)[1:-1]
+    return context.key
+
+
+def _compile_options(options: Dict[str, Any]) -> Dict[str, Any]:
+    """编译请求参数中的 method、body 与 headers，body 为对象时先转换为 JSON 文本"""
+    compiled = dict(options)
+    body = options.get("body")
+    if body is not None:
+        compiled["body"] = compile_parts(body if isinstance(body, str) else json.dumps(body, ensure_ascii=False))
+    if isinstance(options.get("method"), str):
+        compiled["method"] = compile_parts(options["method"])
+    if isinstance(options.get("headers"), dict):
+        compiled["headers"] = {str(name): compile_parts(str(value)) for name, value in options["headers"].items()}
+    return compiled
+
+
+def _compile_expression(code: str) -> Callable[[UrlContext], str]:
+    """编译 {{ }} 中的表达式，key、page 与页码的四则运算不经过脚本引擎"""
+    code = code.strip()
+    if code == "key":
+        return _quote_key
+    if code == "page":
+        return lambda context: str(context.page)
+    arithmetic = _compile_arithmetic(code)
+    if arithmetic is not None:
+        return arithmetic
+    return lambda context: to_string(context.eval_js(code))
+
+
+def _compile_arithmetic(code: str) -> Optional[Callable[[UrlContext], str]]:
+    try:
+        tree = ast.parse(code, mode="eval")
+    except SyntaxError:
+        return None
+    for node in ast.walk(tree):
+        if not isinstance(node, _ARITHMETIC):
+            return None
+        if isinstance(node, ast.Name) and node.id != "page":
+            return None
+        if isinstance(node, ast.Constant) and (type(node.value) not in (int, float)):
+            return None
+    program = compile(tree, "<url>", "eval")
+
+    def evaluate(context: UrlContext) -> str:
+        try:
+            value = eval(program, {"__builtins__": {}}, {"page": context.page})
+        except ZeroDivisionError:
+            return "NaN"
+        return to_string(float(value))
+
+    return evaluate
+
+
+def _page_selector(pages: Tuple[Tuple[Part, ...], ...]) -> Callable[[UrlContext], str]:
+    """<1,2,3> 按页码选择，超出时使用最后一项"""
+    def select(context: UrlContext) -> str:
+        index = context.page - 1 if 0 < context.page <= len(pages) else len(pages) - 1
+        return _join(pages[index], context)
+
+    return select
+
+
+def _block_end(text: str, cursor: int) -> int:
+    """返回与 cursor 处的 {{ 配对的 }} 之后的位置，没有配对时返回 -1"""
+    depth = 0
+    position = cursor + 2
+    length = len(text)
+    while position < length:
+        char = text[position]
+        if char == "{":
+            depth += 1
+        elif char == "}":
+            if depth == 0 and text.startswith("}}", position):
+                return position + 2
+            depth = max(depth - 1, 0)
+        position += 1
+    return -1
+
+
+def _page_end(text: str, cursor: int) -> int:
+    """返回与 cursor 处的 < 配对的 > 之后的位置，跳过其中的 {{ }}"""
+    position = cursor + 1
+    length = len(text)
+    while position < length:
+        if text.startswith("{{", position):
+            end = _block_end(text, position)
+            if end < 0:
+                return -1
+            position = end
+            continue
+        char = text[position]
+        if char == ">":
+            return position + 1
+        if char == "<":
+            return -1
+        position += 1
+    return -1
+
+
+def _split_pages(text: str) -> List[str]:
+    """按 , 拆分页码选项，{{ }} 中的逗号不参与拆分"""
+    items = []
+    start = 0
+    position = 0
+    length = len(text)
+    while position < length:
+        if text.startswith("{{", position):
+            end = _block_end(text, position)
+            position = length if end < 0 else end
+            continue
+        if text[position] == ",":
+            items.append(text[start:position])
+            start = position + 1
+        position += 1
+    items.append(text[start:])
+    return items
+
+
+def _split_options(text: str) -> Tuple[str, str]:
+    """拆分地址后面的 JSON 请求参数，{{ }} 中的 ,{ 不参与拆分"""
+    position = 0
+    while True:
+        matcher = _OPTION_SEPARATOR.search(text, position)
+        if matcher is None:
+            return text, ""
+        block = text.rfind("{{", 0, matcher.start())
+        if block >= 0:
+            end = _block_end(text, block)
+            if end < 0 or end > matcher.start():
+                position = matcher.end() if end < 0 else end
+                continue
+        return text[:matcher.start()], text[matcher.end():]
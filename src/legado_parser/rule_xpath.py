@@ -0,0 +1,767 @@
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Callable, List, Optional, Tuple, Union
+
+from .rule_dom import Element
+
+
+class XPathError(Exception):
+    pass
+
+
+class Attribute:
+    """属性节点"""
+    __slots__ = ("element", "name", "value")
+
+    def __init__(self, element: Element, name: str, value: str) -> None:
+        self.element = element
+        self.name = name
+        self.value = value
+
+
+class Text:
+    """文本节点，index 为其在父元素 children 中的位置"""
+    __slots__ = ("element", "index", "value")
+
+    def __init__(self, element: Element, index: int, value: str) -> None:
+        self.element = element
+        self.index = index
+        self.value = value
+
+
+class ScopeRoot:
+    """
+    绝对路径的起点
+
+    与阅读使用的 JsoupXpath 一致，以元素为上下文时该元素被视为文档中唯一的顶层节点，
+    因此逐项执行的 //a/@href 只在当前项中查找。上下文为整个文档时直接使用文档根。
+    """
+    __slots__ = ("element",)
+
+    def __init__(self, element: Element) -> None:
+        self.element = element
+
+
+XNode = Union[Element, Attribute, Text]
+# 求值上下文: (当前节点, 位置, 上下文大小, 绝对路径的起点)，位置从 1 开始
+Context = Tuple[XNode, int, int, Union[Element, ScopeRoot]]
+Evaluator = Callable[[Context], Any]
+
+
+@dataclass(frozen=True, slots=True)
+class XPath:
+    """编译后的 XPath 表达式"""
+    text: str
+    evaluate: Evaluator
+
+    def select(self, node: Element) -> List[Any]:
+        """
+        以 node 为上下文执行表达式
+
+        返回:
+            节点集中的元素保持为 Element，属性与文本节点转换为字符串；
+            表达式的结果为字符串、数字或布尔值时返回只有一项的列表
+        """
+        scope = node if node.pos == 0 else ScopeRoot(node)
+        value = self.evaluate((node, 1, 1, scope))
+        if isinstance(value, list):
+            return [item if isinstance(item, Element) else item.element if isinstance(item, ScopeRoot) else item.value
+                    for item in value]
+        if isinstance(value, bool):
+            return ["true" if value else "false"]
+        if isinstance(value, float):
+            return [_number_to_string(value)]
+        return [value]
+
+
+@lru_cache(maxsize=4096)
+def compile_xpath(expression: str) -> XPath:
+    """编译 XPath 表达式，同一表达式只编译一次"""
+    parser = _Parser(expression)
+    evaluate, __ = parser.parse_expr()
+    if parser.peek() is not None:
+        raise XPathError(f"无法解析的 XPath: {expression}")
+    return XPath(expression, evaluate)
+
+
+def select_xpath(node: Element, expression: str) -> List[Any]:
+    """以 node 为上下文执行 XPath 表达式"""
+    return compile_xpath(expression).select(node)
+
+
+# ---------------------------------------------------------------------------
+# 节点与类型转换
+# ---------------------------------------------------------------------------
+
+def _string_value(node: XNode) -> str:
+    if isinstance(node, Element):
+        return node.text()
+    return node.value
+
+
+def _order_key(node: XNode) -> Tuple[int, int, int]:
+    if isinstance(node, ScopeRoot):
+        return node.element.pos, -1, 0
+    if isinstance(node, Element):
+        return node.pos, 0, 0
+    if isinstance(node, Attribute):
+        return node.element.pos, 1, 0
+    return node.element.pos, 2, node.index
+
+
+def _identity(node: XNode) -> Tuple:
+    if isinstance(node, ScopeRoot):
+        return id(node.element.document), node.element.pos, "/"
+    if isinstance(node, Element):
+        return id(node.document), node.pos
+    if isinstance(node, Attribute):
+        return id(node.element.document), node.element.pos, "@", node.name
+    return id(node.element.document), node.element.pos, "#", node.index
+
+
+def _document_order(nodes: List[XNode]) -> List[XNode]:
+    unique = {_identity(node): node for node in nodes}
+    return sorted(unique.values(), key=_order_key)
+
+
+def _to_string(value: Any) -> str:
+    if isinstance(value, list):
+        return _string_value(value[0]) if value else ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float):
+        return _number_to_string(value)
+    return value
+
+
+def _to_number(value: Any) -> float:
+    if isinstance(value, float):
+        return value
+    if isinstance(value, bool):
+        return 1.0 if value else 0.0
+    try:
+        return float(_to_string(value).strip())
+    except ValueError:
+        return math.nan
+
+
+def _to_boolean(value: Any) -> bool:
+    if isinstance(value, list):
+        return bool(value)
+    if isinstance(value, float):
+        return value != 0 and not math.isnan(value)
+    if isinstance(value, str):
+        return bool(value)
+    return value
+
+
+def _number_to_string(value: float) -> str:
+    if math.isnan(value):
+        return "NaN"
+    if value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def _compare(op: str, left: Any, right: Any) -> bool:
+    """XPath 1.0 比较：节点集按存在语义逐项比较"""
+    if isinstance(left, list) and isinstance(right, list):
+        values = [_string_value(node) for node in right]
+        return any(_compare_atoms(op, _string_value(node), value) for node in left for value in values)
+    if isinstance(left, list):
+        return any(_compare_atoms(op, _string_value(node), right) for node in left)
+    if isinstance(right, list):
+        return any(_compare_atoms(op, left, _string_value(node)) for node in right)
+    return _compare_atoms(op, left, right)
+
+
+def _compare_atoms(op: str, left: Any, right: Any) -> bool:
+    if op in ("=", "!="):
+        if isinstance(left, bool) or isinstance(right, bool):
+            equal = _to_boolean(left) == _to_boolean(right)
+        elif isinstance(left, float) or isinstance(right, float):
+            equal = _to_number(left) == _to_number(right)
+        else:
+            equal = _to_string(left) == _to_string(right)
+        return equal if op == "=" else not equal
+    a, b = _to_number(left), _to_number(right)
+    if op == "<":
+        return a < b
+    if op == "<=":
+        return a <= b
+    if op == ">":
+        return a > b
+    return a >= b
+
+
+# ---------------------------------------------------------------------------
+# 轴与节点测试
+# ---------------------------------------------------------------------------
+
+_REVERSE_AXES = frozenset({"ancestor", "ancestor-or-self", "preceding", "preceding-sibling"})
+_AXES = frozenset({
+    "ancestor", "ancestor-or-self", "attribute", "child", "descendant", "descendant-or-self", "following",
+    "following-sibling", "parent", "preceding", "preceding-sibling", "self",
+})
+
+
+@dataclass(frozen=True, slots=True)
+class _NodeTest:
+    """kind 为 name（name 为 * 时匹配任意名称）、text 或 node"""
+    kind: str
+    name: str = "*"
+
+
+def _axis(node: XNode, axis: str, test: _NodeTest) -> List[XNode]:
+    """按轴的方向返回匹配节点测试的节点，逆向轴按离上下文由近到远排列"""
+    if isinstance(node, ScopeRoot):
+        element = node.element
+        if axis == "child":
+            return [element] if _test(element, test) else []
+        if axis == "descendant":
+            return _axis(element, "descendant-or-self", test)
+        if axis == "descendant-or-self":
+            return ([node] if test.kind == "node" else []) + _axis(element, "descendant-or-self", test)
+        if axis == "self" and test.kind == "node":
+            return [node]
+        return []
+    if not isinstance(node, Element):
+        # 属性与文本节点只有指向所在元素的轴
+        element = node.element
+        if axis == "parent":
+            return [element] if _test(element, test) else []
+        if axis == "ancestor":
+            return _axis(element, "ancestor-or-self", test)
+        if axis == "ancestor-or-self":
+            return ([node] if _test(node, test) else []) + _axis(element, "ancestor-or-self", test)
+        if axis in ("self", "descendant-or-self"):
+            return [node] if _test(node, test) else []
+        return []
+
+    if axis == "attribute":
+        if test.kind != "name" and test.kind != "node":
+            return []
+        return [Attribute(node, name, value) for name, value in node.attrs.items()
+                if test.kind == "node" or test.name in ("*", name)]
+
+    if axis == "child":
+        if test.kind == "name":
+            if test.name == "*":
+                return list(node.elements)
+            return [child for child in node.elements if child.tag == test.name]
+        return _children(node, test)
+
+    if axis in ("descendant", "descendant-or-self"):
+        include_self = axis == "descendant-or-self"
+        if test.kind == "name":
+            document = node.document
+            if test.name == "*":
+                items = document.subtree(node)
+            else:
+                items = document.by_tag(test.name, node)
+            if include_self:
+                return [item for item in items if item.pos]
+            return [item for item in items if item.pos != node.pos]
+        result: List[XNode] = [node] if include_self and test.kind == "node" and node.pos else []
+        result.extend(item for item in _walk(node) if test.kind == "node" or isinstance(item, Text))
+        return result
+
+    if axis == "self":
+        return [node] if _test(node, test) else []
+    if axis == "parent":
+        parent = node.parent
+        return [parent] if parent is not None and _test(parent, test) else []
+    if axis in ("ancestor", "ancestor-or-self"):
+        result = [node] if axis == "ancestor-or-self" and _test(node, test) else []
+        parent = node.parent
+        while parent is not None:
+            if _test(parent, test):
+                result.append(parent)
+            parent = parent.parent
+        return result
+    if axis in ("following-sibling", "preceding-sibling"):
+        parent = node.parent
+        if parent is None:
+            return []
+        if axis == "following-sibling":
+            siblings = parent.elements[node.sibling_index + 1:]
+        else:
+            siblings = parent.elements[:node.sibling_index][::-1]
+        return [sibling for sibling in siblings if _test(sibling, test)]
+    if axis == "following":
+        items = node.document.elements[node.end + 1:]
+        return [item for item in items if _test(item, test)]
+    if axis == "preceding":
+        ancestors = set()
+        parent = node.parent
+        while parent is not None:
+            ancestors.add(parent.pos)
+            parent = parent.parent
+        items = node.document.elements[1:node.pos][::-1]
+        return [item for item in items if item.pos not in ancestors and _test(item, test)]
+    raise XPathError(f"不支持的轴: {axis}")
+
+
+def _children(element: Element, test: _NodeTest) -> List[XNode]:
+    result: List[XNode] = []
+    for index, child in enumerate(element.children):
+        if isinstance(child, str):
+            # 与 JsoupXpath 一致，忽略只含空白的文本节点
+            if child.strip():
+                result.append(Text(element, index, child))
+        elif test.kind == "node":
+            result.append(child)
+    return result
+
+
+def _walk(element: Element):
+    """按文档顺序遍历后代元素与非空白文本节点"""
+    for index, child in enumerate(element.children):
+        if isinstance(child, str):
+            if child.strip():
+                yield Text(element, index, child)
+        else:
+            yield child
+            yield from _walk(child)
+
+
+def _test(node: XNode, test: _NodeTest) -> bool:
+    if test.kind == "node":
+        return True
+    if test.kind == "text":
+        return isinstance(node, Text)
+    return isinstance(node, Element) and node.pos != 0 and test.name in ("*", node.tag)
+
+
+# ---------------------------------------------------------------------------
+# 函数
+# ---------------------------------------------------------------------------
+
+def _fn_contains(ctx, a, b):
+    return _to_string(b(ctx)) in _to_string(a(ctx))
+
+
+def _fn_substring(ctx, text, start, length=None):
+    value = _to_string(text(ctx))
+    begin = round(_to_number(start(ctx)))
+    if length is None:
+        return value[max(begin - 1, 0):]
+    end = begin + round(_to_number(length(ctx)))
+    return value[max(begin - 1, 0):max(end - 1, 0)]
+
+
+def _fn_substring_before(ctx, a, b):
+    value, separator = _to_string(a(ctx)), _to_string(b(ctx))
+    index = value.find(separator)
+    return value[:index] if index >= 0 else ""
+
+
+def _fn_substring_after(ctx, a, b):
+    value, separator = _to_string(a(ctx)), _to_string(b(ctx))
+    index = value.find(separator)
+    return value[index + len(separator):] if index >= 0 else ""
+
+
+def _fn_translate(ctx, a, b, c):
+    value, source, target = _to_string(a(ctx)), _to_string(b(ctx)), _to_string(c(ctx))
+    table = {}
+    for index, char in enumerate(source):
+        if ord(char) not in table:
+            table[ord(char)] = target[index] if index < len(target) else None
+    return value.translate(table)
+
+
+def _fn_name(ctx, nodes=None):
+    items = nodes(ctx) if nodes is not None else [ctx[0]]
+    if not items:
+        return ""
+    node = items[0]
+    if isinstance(node, Element):
+        return node.tag if node.pos else ""
+    return node.name if isinstance(node, Attribute) else ""
+
+
+def _fn_round(ctx, a):
+    value = _to_number(a(ctx))
+    return value if math.isnan(value) or math.isinf(value) else float(math.floor(value + 0.5))
+
+
+# 名称 -> (实现, 返回类型)
+_FUNCTIONS = {
+    "last": (lambda ctx: float(ctx[2]), "number"),
+    "position": (lambda ctx: float(ctx[1]), "number"),
+    "count": (lambda ctx, a: float(len(a(ctx))), "number"),
+    "string": (lambda ctx, a=None: _to_string(a(ctx)) if a else _string_value(ctx[0]), "string"),
+    "concat": (lambda ctx, *args: "".join(_to_string(arg(ctx)) for arg in args), "string"),
+    "contains": (_fn_contains, "boolean"),
+    "starts-with": (lambda ctx, a, b: _to_string(a(ctx)).startswith(_to_string(b(ctx))), "boolean"),
+    "ends-with": (lambda ctx, a, b: _to_string(a(ctx)).endswith(_to_string(b(ctx))), "boolean"),
+    "substring": (_fn_substring, "string"),
+    "substring-before": (_fn_substring_before, "string"),
+    "substring-after": (_fn_substring_after, "string"),
+    "string-length": (lambda ctx, a=None: float(len(_to_string(a(ctx)) if a else _string_value(ctx[0]))),
+                      "number"),
+    "normalize-space": (lambda ctx, a=None: " ".join((_to_string(a(ctx)) if a else _string_value(ctx[0])).split()),
+                        "string"),
+    "translate": (_fn_translate, "string"),
+    "not": (lambda ctx, a: not _to_boolean(a(ctx)), "boolean"),
+    "true": (lambda ctx: True, "boolean"),
+    "false": (lambda ctx: False, "boolean"),
+    "boolean": (lambda ctx, a: _to_boolean(a(ctx)), "boolean"),
+    "number": (lambda ctx, a=None: _to_number(a(ctx) if a else _string_value(ctx[0])), "number"),
+    "sum": (lambda ctx, a: float(sum(_to_number(_string_value(node)) for node in a(ctx))), "number"),
+    "floor": (lambda ctx, a: float(math.floor(_to_number(a(ctx)))), "number"),
+    "ceiling": (lambda ctx, a: float(math.ceil(_to_number(a(ctx)))), "number"),
+    "round": (_fn_round, "number"),
+    "name": (_fn_name, "string"),
+    "local-name": (_fn_name, "string"),
+    "matches": (lambda ctx, a, b: re.search(_to_string(b(ctx)), _to_string(a(ctx))) is not None, "boolean"),
+}
+
+# JsoupXpath 的扩展：作为路径最后一步，对每个元素取值
+_STEP_FUNCTIONS = {
+    "allText": lambda element: element.text(),
+    "html": lambda element: element.inner_html(),
+    "outerHtml": lambda element: element.outer_html(),
+    "ownText": lambda element: element.own_text(),
+}
+
+# ---------------------------------------------------------------------------
+# 解析
+# ---------------------------------------------------------------------------
+
+_TOKEN = re.compile(r"""
+    \s*(?:
+        (?P<string>"[^"]*"|'[^']*')
+      | (?P<number>\d+(?:\.\d*)?|\.\d+)
+      | (?P<op>//|::|\.\.|!=|<=|>=|[/()\[\]@,|.=<>+\-*$])
+      | (?P<name>[^\s/()\[\]@,|.=<>+\-*$!:'"][^\s/()\[\]@,|=<>+*$!:'"]*(?<!\.))
+    )""", re.VERBOSE)
+
+Token = Tuple[str, str]
+
+
+class _Parser:
+    def __init__(self, expression: str) -> None:
+        self.expression = expression
+        self.tokens: List[Token] = []
+        cursor = 0
+        text = expression.strip()
+        while cursor < len(text):
+            matcher = _TOKEN.match(text, cursor)
+            if not matcher or matcher.end() == cursor:
+                raise XPathError(f"无法解析的 XPath: {expression}")
+            kind = matcher.lastgroup
+            self.tokens.append((kind, matcher.group(kind)))
+            cursor = matcher.end()
+            while cursor < len(text) and text[cursor].isspace():
+                cursor += 1
+        self.position = 0
+
+    def peek(self, offset: int = 0) -> Optional[Token]:
+        index = self.position + offset
+        return self.tokens[index] if index < len(self.tokens) else None
+
+    def take(self) -> Token:
+        token = self.peek()
+        if token is None:
+            raise XPathError(f"XPath 意外结束: {self.expression}")
+        self.position += 1
+        return token
+
+    def expect(self, value: str) -> None:
+        token = self.take()
+        if token[1] != value:
+            raise XPathError(f"XPath 中缺少 {value}: {self.expression}")
+
+    def at(self, value: str) -> bool:
+        token = self.peek()
+        return token is not None and token[1] == value and token[0] in ("op", "name")
+
+    def at_operator_name(self, *names: str) -> bool:
+        """and、or、div、mod 只有出现在操作数之后时才是运算符"""
+        token = self.peek()
+        return token is not None and token[0] == "name" and token[1] in names
+
+    # 表达式，返回 (求值函数, 结果类型)
+
+    def parse_expr(self) -> Tuple[Evaluator, str]:
+        return self.parse_or()
+
+    def parse_or(self):
+        left, kind = self.parse_and()
+        while self.at_operator_name("or"):
+            self.take()
+            right, __ = self.parse_and()
+            left, kind = (lambda a, b: lambda ctx: _to_boolean(a(ctx)) or _to_boolean(b(ctx)))(left, right), "boolean"
+        return left, kind
+
+    def parse_and(self):
+        left, kind = self.parse_equality()
+        while self.at_operator_name("and"):
+            self.take()
+            right, __ = self.parse_equality()
+            left, kind = (lambda a, b: lambda ctx: _to_boolean(a(ctx)) and _to_boolean(b(ctx)))(left, right), "boolean"
+        return left, kind
+
+    def parse_equality(self):
+        left, kind = self.parse_relational()
+        while self.at("=") or self.at("!="):
+            op = self.take()[1]
+            right, __ = self.parse_relational()
+            left, kind = (lambda a, b, o: lambda ctx: _compare(o, a(ctx), b(ctx)))(left, right, op), "boolean"
+        return left, kind
+
+    def parse_relational(self):
+        left, kind = self.parse_additive()
+        while self.at("<") or self.at("<=") or self.at(">") or self.at(">="):
+            op = self.take()[1]
+            right, __ = self.parse_additive()
+            left, kind = (lambda a, b, o: lambda ctx: _compare(o, a(ctx), b(ctx)))(left, right, op), "boolean"
+        return left, kind
+
+    def parse_additive(self):
+        left, kind = self.parse_multiplicative()
+        while self.at("+") or self.at("-"):
+            op = self.take()[1]
+            right, __ = self.parse_multiplicative()
+            if op == "+":
+                left = (lambda a, b: lambda ctx: _to_number(a(ctx)) + _to_number(b(ctx)))(left, right)
+            else:
+                left = (lambda a, b: lambda ctx: _to_number(a(ctx)) - _to_number(b(ctx)))(left, right)
+            kind = "number"
+        return left, kind
+
+    def parse_multiplicative(self):
+        left, kind = self.parse_unary()
+        while self.at("*") or self.at_operator_name("div", "mod"):
+            op = self.take()[1]
+            right, __ = self.parse_unary()
+            left = (lambda a, b, o: lambda ctx: _arithmetic(o, _to_number(a(ctx)), _to_number(b(ctx))))(left, right, op)
+            kind = "number"
+        return left, kind
+
+    def parse_unary(self):
+        if self.at("-"):
+            self.take()
+            inner, __ = self.parse_unary()
+            return (lambda ctx: -_to_number(inner(ctx))), "number"
+        return self.parse_union()
+
+    def parse_union(self):
+        left, kind = self.parse_path()
+        while self.at("|"):
+            self.take()
+            right, __ = self.parse_path()
+            left = (lambda a, b: lambda ctx: _document_order(list(a(ctx)) + list(b(ctx))))(left, right)
+            kind = "nodeset"
+        return left, kind
+
+    def parse_path(self):
+        token = self.peek()
+        if token is None:
+            raise XPathError(f"XPath 意外结束: {self.expression}")
+        kind, value = token
+        is_primary = kind in ("string", "number") or value in ("(", "$") or (
+            kind == "name" and self.peek(1) is not None and self.peek(1)[1] == "("
+            and value not in ("text", "node", "comment") and value not in _STEP_FUNCTIONS)
+        if not is_primary:
+            return self.parse_location_path(), "nodeset"
+
+        primary, result_kind = self.parse_primary()
+        predicates = self.parse_predicates()
+        if predicates:
+            primary = _filter_expression(primary, predicates)
+            result_kind = "nodeset"
+        if self.at("/") or self.at("//"):
+            steps = self.parse_relative_steps(self.take()[1] == "//")
+            primary = (lambda base, rest: lambda ctx: _run_steps(base(ctx), rest, ctx[3]))(primary, steps)
+            result_kind = "nodeset"
+        return primary, result_kind
+
+    def parse_primary(self):
+        kind, value = self.take()
+        if kind == "string":
+            text = value[1:-1]
+            return (lambda ctx: text), "string"
+        if kind == "number":
+            number = float(value)
+            return (lambda ctx: number), "number"
+        if value == "(":
+            inner, inner_kind = self.parse_expr()
+            self.expect(")")
+            return inner, inner_kind
+        if value == "$":
+            raise XPathError(f"不支持 XPath 变量: {self.expression}")
+        # 函数调用
+        function = _FUNCTIONS.get(value)
+        if function is None:
+            raise XPathError(f"不支持的 XPath 函数: {value}()")
+        implementation, result_kind = function
+        self.expect("(")
+        arguments = []
+        if not self.at(")"):
+            while True:
+                argument, __ = self.parse_expr()
+                arguments.append(argument)
+                if not self.at(","):
+                    break
+                self.take()
+        self.expect(")")
+        return (lambda f, args: lambda ctx: f(ctx, *args))(implementation, tuple(arguments)), result_kind
+
+    def parse_location_path(self) -> Evaluator:
+        if self.at("/") or self.at("//"):
+            descendant = self.take()[1] == "//"
+            token = self.peek()
+            if not descendant and (token is None or token[1] in (")", "]", "|", ",")):
+                return lambda ctx: [ctx[3]]
+            steps = self.parse_relative_steps(descendant)
+            return lambda ctx: _run_steps([ctx[3]], steps, ctx[3])
+        steps = self.parse_relative_steps(False)
+        return lambda ctx: _run_steps([ctx[0]], steps, ctx[3])
+
+    def parse_relative_steps(self, descendant: bool) -> Tuple["_Step", ...]:
+        steps: List[_Step] = []
+        while True:
+            step = self.parse_step()
+            if descendant:
+                steps.extend(_descendant_step(step))
+            else:
+                steps.append(step)
+            if self.at("//"):
+                self.take()
+                descendant = True
+            elif self.at("/"):
+                self.take()
+                descendant = False
+            else:
+                return tuple(steps)
+
+    def parse_step(self) -> "_Step":
+        if self.at("."):
+            self.take()
+            return _Step("self", _NodeTest("node"), ())
+        if self.at(".."):
+            self.take()
+            return _Step("parent", _NodeTest("node"), ())
+
+        axis = "child"
+        if self.at("@"):
+            self.take()
+            axis = "attribute"
+        elif self.peek(1) is not None and self.peek(1)[1] == "::":
+            axis = self.take()[1]
+            if axis not in _AXES:
+                raise XPathError(f"不支持的轴: {axis}")
+            self.take()
+
+        kind, value = self.take()
+        if value == "*":
+            test = _NodeTest("name")
+        elif kind == "name" and self.at("("):
+            self.take()
+            self.expect(")")
+            if value in _STEP_FUNCTIONS:
+                return _Step("function", _NodeTest("node", value), ())
+            if value not in ("text", "node"):
+                raise XPathError(f"不支持的节点测试: {value}()")
+            test = _NodeTest(value)
+        elif kind == "name":
+            test = _NodeTest("name", value if axis == "attribute" else value.lower())
+        else:
+            raise XPathError(f"无法解析的 XPath: {self.expression}")
+        return _Step(axis, test, self.parse_predicates())
+
+    def parse_predicates(self) -> Tuple["_Predicate", ...]:
+        predicates = []
+        while self.at("["):
+            self.take()
+            start = self.position
+            evaluate, kind = self.parse_expr()
+            used = {token[1] for token in self.tokens[start:self.position] if token[0] == "name"}
+            self.expect("]")
+            positional = kind == "number" or bool(used & {"position", "last"})
+            predicates.append(_Predicate(evaluate, kind == "number", positional))
+        return tuple(predicates)
+
+
+def _arithmetic(op: str, a: float, b: float) -> float:
+    if op == "*":
+        return a * b
+    if b == 0:
+        return math.nan if a == 0 or op == "mod" else math.copysign(math.inf, a) * math.copysign(1, b)
+    if op == "div":
+        return a / b
+    return math.fmod(a, b)
+
+
+@dataclass(frozen=True, slots=True)
+class _Predicate:
+    evaluate: Evaluator
+    numeric: bool
+    positional: bool
+
+
+@dataclass(frozen=True, slots=True)
+class _Step:
+    axis: str
+    test: _NodeTest
+    predicates: Tuple[_Predicate, ...]
+
+
+def _descendant_step(step: _Step) -> Tuple[_Step, ...]:
+    """
+    // 展开为 descendant-or-self::node()/step
+
+    child 轴且谓词与位置无关时合并为一次 descendant 查找，借助文档的标签索引；
+    //a[1] 这类按位置筛选的写法保留两步以符合 XPath 语义。
+    """
+    if step.axis == "child" and not any(predicate.positional for predicate in step.predicates):
+        return (_Step("descendant", step.test, step.predicates),)
+    return _Step("descendant-or-self", _NodeTest("node"), ()), step
+
+
+def _apply_predicates(nodes: List[XNode], predicates: Tuple[_Predicate, ...], scope) -> List[XNode]:
+    for predicate in predicates:
+        size = len(nodes)
+        selected = []
+        for position, node in enumerate(nodes, 1):
+            value = predicate.evaluate((node, position, size, scope))
+            if predicate.numeric or isinstance(value, float):
+                if _to_number(value) == position:
+                    selected.append(node)
+            elif _to_boolean(value):
+                selected.append(node)
+        nodes = selected
+    return nodes
+
+
+def _run_steps(nodes: List[XNode], steps: Tuple[_Step, ...], scope) -> Union[List[XNode], List[str]]:
+    for step in steps:
+        if step.axis == "function":
+            convert = _STEP_FUNCTIONS[step.test.name]
+            return [Text(node, -1, convert(node)) for node in nodes if isinstance(node, Element)]
+        result: List[XNode] = []
+        for node in nodes:
+            candidates = _axis(node, step.axis, step.test)
+            if step.predicates:
+                candidates = _apply_predicates(candidates, step.predicates, scope)
+            result.extend(candidates)
+        if len(nodes) > 1 or step.axis in _REVERSE_AXES:
+            result = _document_order(result)
+        nodes = result
+        if not nodes:
+            break
+    return nodes
+
+
+def _filter_expression(primary: Evaluator, predicates: Tuple[_Predicate, ...]) -> Evaluator:
+    def evaluate(ctx: Context) -> List[XNode]:
+        value = primary(ctx)
+        if not isinstance(value, list):
+            raise XPathError("谓词只能用于节点集")
+        return _apply_predicates(value, predicates, ctx[3])
+    return evaluate
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 未安装时直接从源码目录导入
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
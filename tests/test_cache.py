@@ -0,0 +1,190 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from legado_parser.legado_cache import (CacheEntry, CachingTransport, MemoryCache, ResultCache, SqliteCache,
+                                        cache_key, is_private)
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_http import FakeTransport, Request, Response, Transport
+
+
+def make_source(**fields) -> BookSourceEntity:
+    data = {"bookSourceUrl": "http://s", "bookSourceName": "s", "lastUpdateTime": 1,
+            "ruleSearch": {"bookList": "class.b", "name": "tag.a@text", "bookUrl": "tag.a@href"}}
+    data.update(fields)
+    return BookSourceEntity(data)
+
+
+class CacheKeyTest(unittest.TestCase):
+
+    def test_key_includes_source(self):
+        request = Request("http://a/", kind="search")
+        self.assertNotEqual(cache_key(request, make_source()),
+                            cache_key(request, make_source(bookSourceUrl="http://other")))
+
+    def test_key_includes_headers(self):
+        source = make_source()
+        user_a = source.with_overrides(header='{"X-User": "a"}')
+        user_b = source.with_overrides(header='{"X-User": "b"}')
+        request = Request("http://a/", kind="search")
+        self.assertNotEqual(cache_key(request, user_a), cache_key(request, user_b))
+        self.assertNotEqual(cache_key(request), cache_key(Request("http://a/", headers={"X-Token": "1"})))
+
+    def test_key_includes_body_and_charset(self):
+        self.assertNotEqual(cache_key(Request("http://a/", "POST", body="k=1")),
+                            cache_key(Request("http://a/", "POST", body="k=2")))
+        self.assertNotEqual(cache_key(Request("http://a/", charset="gbk")), cache_key(Request("http://a/")))
+
+    def test_private_requests(self):
+        self.assertTrue(is_private(Request("http://a/", headers={"Cookie": "sid=1"})))
+        self.assertTrue(is_private(Request("http://a/", headers={"authorization": "Bearer x"})))
+        self.assertTrue(is_private(Request("http://a/"), make_source(enabledCookieJar=True)))
+        self.assertTrue(is_private(Request("http://a/"), make_source(header='{"Cookie": "sid=1"}')))
+        self.assertFalse(is_private(Request("http://a/"), make_source()))
+
+
+class CachingTransportTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_fresh_hit_and_revalidation(self):
+        seen = []
+
+        def handler(request: Request) -> Response:
+            seen.append(dict(request.headers))
+            if request.headers.get("If-None-Match") == '"v1"':
+                return Response(request.url, 304, {}, b"")
+            return Response(request.url, 200, {"etag": '"v1"'}, b"hello")
+
+        transport = CachingTransport(FakeTransport({"http://a/": handler}), ttls={"search": 0.05})
+        for __ in range(2):
+            response = await transport.send(Request("http://a/", kind="search"))
+            self.assertEqual(response.content, b"hello")
+        self.assertEqual((transport.hits, len(seen)), (1, 1))
+
+        await asyncio.sleep(0.06)
+        response = await transport.send(Request("http://a/", kind="search"))
+        self.assertEqual(response.content, b"hello")
+        self.assertEqual(transport.revalidated, 1)
+        self.assertEqual(seen[-1]["If-None-Match"], '"v1"')
+
+    async def test_unknown_kind_and_private_requests_bypass_cache(self):
+        fake = FakeTransport({"http://a/": "x"})
+        transport = CachingTransport(fake)
+        await transport.send(Request("http://a/"))
+        await transport.send(Request("http://a/"))
+        source = make_source(enabledCookieJar=True)
+        await transport.send(Request("http://a/", kind="search"), source)
+        await transport.send(Request("http://a/", kind="search"), source)
+        self.assertEqual(len(fake.requests), 4)
+
+    async def test_sources_do_not_share_responses(self):
+        fake = FakeTransport({"http://a/": lambda request: request.headers.get("X-User", "")})
+        transport = CachingTransport(fake)
+        first = await transport.send(Request("http://a/", headers={"X-User": "a"}, kind="search"))
+        second = await transport.send(Request("http://a/", headers={"X-User": "b"}, kind="search"))
+        self.assertEqual((first.text, second.text), ("a", "b"))
+
+    async def test_concurrent_requests_are_coalesced(self):
+        class Slow(Transport):
+            calls = 0
+
+            async def send(self, request, source=None):
+                self.calls += 1
+                await asyncio.sleep(0.01)
+                return Response(request.url, 200, {}, b"x")
+
+        slow = Slow()
+        transport = CachingTransport(slow)
+        results = await asyncio.gather(*(transport.send(Request("http://a/", kind="toc")) for __ in range(5)))
+        self.assertEqual(slow.calls, 1)
+        self.assertEqual({response.content for response in results}, {b"x"})
+
+    async def test_no_store_is_not_cached(self):
+        fake = FakeTransport({"http://a/": lambda request: Response(request.url, 200,
+                                                                     {"cache-control": "no-store"}, b"x")})
+        transport = CachingTransport(fake)
+        await transport.send(Request("http://a/", kind="toc"))
+        await transport.send(Request("http://a/", kind="toc"))
+        self.assertEqual(len(fake.requests), 2)
+
+
+class BackendTest(unittest.TestCase):
+
+    def test_memory_cache_evicts_by_size(self):
+        cache = MemoryCache(max_bytes=1000)
+        for index in range(10):
+            cache.put(str(index), CacheEntry("u", 200, {}, b"x" * 300, None, 0, None))
+        self.assertLessEqual(cache.size, 1000)
+        self.assertIsNotNone(cache.get("9"))
+        self.assertIsNone(cache.get("0"))
+
+    def test_sqlite_cache_persists(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.db")
+            cache = SqliteCache(path)
+            cache.put("k", CacheEntry("u", 200, {"etag": "1"}, b"body", "gbk", 1.0, None))
+            cache.close()
+            cache = SqliteCache(path)
+            entry = cache.get("k")
+            cache.close()
+        self.assertEqual((entry.content, entry.headers, entry.charset), (b"body", {"etag": "1"}, "gbk"))
+
+
+class ResultCacheTest(unittest.TestCase):
+
+    def test_key_and_invalidation(self):
+        cache = ResultCache()
+        source = make_source()
+        key = cache.key(source, source.rule_search, "<p>", "http://s/")
+        cache.put(key, ("a",))
+        self.assertEqual(cache.get(cache.key(source, source.rule_search, "<p>", "http://s/")), ("a",))
+        self.assertIsNone(cache.get(cache.key(source, source.rule_search, "<p>!", "http://s/")))
+        self.assertIsNone(cache.get(cache.key(source, source.rule_search, "<p>", "http://s/2")))
+
+        updated = source.with_overrides(last_update_time=2)
+        self.assertIsNone(cache.get(cache.key(updated, updated.rule_search, "<p>", "http://s/")))
+        self.assertEqual(len(cache), 0)
+
+    def test_impure_rules_are_not_cached(self):
+        cache = ResultCache()
+        source = make_source(ruleSearch={"bookList": "class.b", "name": "tag.a@text@put:{a:tag.a@text}"})
+        self.assertIsNone(cache.key(source, source.rule_search, "<p>", "http://s/"))
+        self.assertIsNone(ResultCache(0).key(make_source(), make_source().rule_search, "<p>", ""))
+
+    def test_rules_reading_variables_or_running_js_are_not_cached(self):
+        cache = ResultCache()
+        for name in ("@get:{a}", "{{$.name}}", "tag.a@text@js:result", "<js>result</js>", "{{java.get('a')}}"):
+            source = make_source(ruleSearch={"bookList": "class.b", "name": name})
+            self.assertIsNone(cache.key(source, source.rule_search, "<p>", "http://s/"), name)
+        cache.put(None, ("a",))
+        self.assertEqual((len(cache), cache.get(None), cache.hits, cache.misses), (0, None, 0, 0))
+
+    def test_hits_misses_and_eviction(self):
+        cache = ResultCache(max_entries=2)
+        source = make_source()
+        keys = [cache.key(source, source.rule_search, content, "http://s/") for content in ("1", "2", "3")]
+        self.assertIsNone(cache.get(keys[0]))
+        cache.put(keys[0], ("1",))
+        cache.put(keys[1], ("2",))
+        self.assertEqual(cache.get(keys[0]), ("1",))
+        cache.put(keys[2], ("3",))
+        self.assertIsNone(cache.get(keys[1]))
+        self.assertEqual((cache.get(keys[0]), cache.get(keys[2])), (("1",), ("3",)))
+        self.assertEqual((cache.hits, cache.misses, len(cache)), (3, 2, 2))
+
+    def test_invalidation_keeps_other_sources(self):
+        cache = ResultCache()
+        first, second = make_source(), make_source(bookSourceUrl="http://other")
+        for source in (first, second):
+            cache.put(cache.key(source, source.rule_search, "<p>", "http://s/"), (source.url,))
+        updated = first.with_overrides(last_update_time=5)
+        self.assertIsNone(cache.get(cache.key(updated, updated.rule_search, "<p>", "http://s/")))
+        self.assertEqual(cache.get(cache.key(second, second.rule_search, "<p>", "http://s/")), ("http://other",))
+        self.assertEqual(len(cache), 1)
+
+    def test_rule_checks_are_bounded(self):
+        cache = ResultCache(max_entries=3)
+        for index in range(10):
+            source = make_source(ruleSearch={"bookList": "class.b", "name": f"tag.a.{index}@text"})
+            self.assertIsNotNone(cache.key(source, source.rule_search, "<p>", "http://s/"))
+        self.assertEqual(len(cache._cacheable), 3)
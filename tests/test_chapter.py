@@ -0,0 +1,57 @@
+import unittest
+
+from legado_parser.legado_chapter import fetch_contents, get_chapter_content
+from legado_parser.legado_chapter_list import BookChapter
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_http import FakeTransport, HttpError
+from legado_parser.rule_regex import compile_chain
+
+
+def make_source() -> BookSourceEntity:
+    return BookSourceEntity({
+        "bookSourceUrl": "http://s",
+        "bookSourceName": "content",
+        "ruleContent": {"content": "id.text@text", "nextContentUrl": "class.next@href"},
+    })
+
+
+def page(text: str, next_url: str = "") -> str:
+    link = f'<a class="next" href="{next_url}">next</a>' if next_url else ""
+    return f'<html><body><div id="text">{text}</div>{link}</body></html>'
+
+
+def chapter(index: int, url: str) -> BookChapter:
+    return BookChapter(f"第{index}章", url, index, base_url="http://s/toc")
+
+
+class ContentFlowTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_pages_are_joined_and_purified(self):
+        transport = FakeTransport({
+            "http://s/1": page("一广告", "/1_2"),
+            "http://s/1_2": page("二", "/2"),
+        })
+        content = await get_chapter_content(make_source(), chapter(0, "http://s/1"), "http://s/2",
+                                            transport=transport, purify=compile_chain((("广告", "", False),)))
+        self.assertEqual(content, "一\n二")
+        self.assertEqual([request.url for request in transport.requests], ["http://s/1", "http://s/1_2"])
+
+    async def test_last_chapter_stops_at_toc_and_other_chapters(self):
+        transport = FakeTransport({
+            "http://s/1": page("一", "/2"),
+            "http://s/2": page("二", "/toc"),
+            "http://s/toc": page("目录"),
+        })
+        chapters = [chapter(0, "http://s/1"), chapter(1, "http://s/2")]
+        results = [item async for item in fetch_contents(make_source(), chapters, transport=transport)]
+        self.assertEqual([item.content for item in results], ["一", "二"])
+        self.assertNotIn("http://s/toc", [request.url for request in transport.requests])
+
+    async def test_failed_continuation_keeps_earlier_pages(self):
+        transport = FakeTransport({"http://s/1": page("一", "/1_2")})
+        content = await get_chapter_content(make_source(), chapter(0, "http://s/1"), transport=transport,
+                                            retries=0)
+        self.assertEqual(content, "一")
+        with self.assertRaises(HttpError):
+            await get_chapter_content(make_source(), chapter(0, "http://s/missing"), transport=transport,
+                                      retries=0)
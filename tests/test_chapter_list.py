@@ -0,0 +1,67 @@
+import unittest
+
+from legado_parser.legado_chapter_list import (BookChapter, TocFingerprint, get_chapter_list, remove_latest_chapter,
+                                               update_chapter_list)
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_http import FakeTransport
+
+
+def make_source() -> BookSourceEntity:
+    return BookSourceEntity({
+        "bookSourceUrl": "http://s",
+        "bookSourceName": "toc",
+        "ruleToc": {"chapterList": "tag.li", "chapterName": "tag.a@text", "chapterUrl": "tag.a@href",
+                    "nextTocUrl": "class.next@href"},
+    })
+
+
+def page(*titles: str, next_url: str = "") -> str:
+    items = "".join(f'<li><a href="/c/{title}">{title}</a></li>' for title in titles)
+    link = f'<a class="next" href="{next_url}">next</a>' if next_url else ""
+    return f"<html><body><ul>{items}</ul>{link}</body></html>"
+
+
+class TocFlowTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_pages_are_followed_in_order(self):
+        transport = FakeTransport({
+            "http://s/toc": page("1", "2", next_url="/toc/2"),
+            "http://s/toc/2": page("3", next_url="/toc/3"),
+            "http://s/toc/3": page("4", next_url="/toc"),
+        })
+        chapters = [chapter async for chapter in get_chapter_list(make_source(), "http://s/toc",
+                                                                  transport=transport, retries=0)]
+        self.assertEqual([(c.title, c.url, c.index) for c in chapters],
+                         [("1", "http://s/c/1", 0), ("2", "http://s/c/2", 1), ("3", "http://s/c/3", 2),
+                          ("4", "http://s/c/4", 3)])
+        self.assertEqual(chapters[2].base_url, "http://s/toc/2")
+        self.assertEqual(len(transport.requests), 3)
+
+    async def test_incremental_update_downloads_last_page(self):
+        transport = FakeTransport({
+            "http://s/toc": page("1", next_url="/toc/2"),
+            "http://s/toc/2": page("2"),
+        })
+        source = make_source()
+        chapters = [chapter async for chapter in get_chapter_list(source, "http://s/toc", transport=transport)]
+        transport.route("http://s/toc/2", page("2", "3"))
+        transport.requests.clear()
+
+        update = await update_chapter_list(source, "http://s/toc", TocFingerprint.of(chapters), transport=transport)
+        self.assertFalse(update.full)
+        self.assertEqual([(c.title, c.index) for c in update.chapters], [("3", 2)])
+        self.assertEqual([request.url for request in transport.requests], ["http://s/toc/2"])
+
+
+class RemoveLatestChapterTest(unittest.TestCase):
+
+    def test_latest_block_is_removed(self):
+        chapters = [BookChapter(title, f"/c/{title}", index) for index, title in enumerate(["3", "1", "2", "3"])]
+        result = remove_latest_chapter(chapters)
+        self.assertEqual([(c.title, c.index) for c in result], [("1", 0), ("2", 1), ("3", 2)])
+        self.assertEqual([c.index for c in chapters], [0, 1, 2, 3])
+
+    def test_chapters_without_url_are_kept(self):
+        chapters = [BookChapter(title, "http://s/toc", index) for index, title in enumerate(["1", "2", "3"])]
+        self.assertEqual([c.title for c in remove_latest_chapter(chapters, "http://s/toc")], ["1", "2", "3"])
+        self.assertEqual([c.title for c in remove_latest_chapter(chapters)], ["1", "2", "3"])
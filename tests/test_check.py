@@ -0,0 +1,65 @@
+import asyncio
+import time
+import unittest
+
+from legado_parser.legado_check import SourceCheck, apply_checks, check_source, check_sources, summarize
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_http import FakeTransport, Response, Transport
+
+RESULTS = '<div class="b"><a href="/book/1">一</a></div>'
+
+
+def make_source(url: str = "http://s") -> BookSourceEntity:
+    return BookSourceEntity({"bookSourceUrl": url, "bookSourceName": url, "searchUrl": "/search?q={{key}}",
+                             "ruleSearch": {"bookList": "class.b", "name": "tag.a@text", "bookUrl": "tag.a@href",
+                                            "checkKeyWord": "书"}})
+
+
+class CheckSourceTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_timeout_and_error_after_recovery(self):
+        replies = iter([(503, ""), RESULTS, RESULTS])
+        transport = FakeTransport()
+        transport.route(r"http://s/search\?q=.*", lambda request: next(replies), regex=True)
+        check = await check_source(make_source(), attempts=3, timeout=2.5, transport=transport)
+        self.assertEqual([request.timeout for request in transport.requests], [2.5, 2.5, 2.5])
+        self.assertEqual((check.attempts, check.successes, check.books), (3, 2, 2))
+        self.assertIsNone(check.error)
+        self.assertEqual(check.field_rates["name"], 1.0)
+
+    async def test_failures_are_reported(self):
+        transport = FakeTransport()
+        transport.route(r"http://s/search\?q=.*", (500, ""), regex=True)
+        check = await check_source(make_source(), attempts=2, transport=transport)
+        self.assertEqual((check.ok, check.error, check.response_time >= 0), (False, "HTTP 500", True))
+        self.assertEqual(check.weight(), 0)
+
+    async def test_check_sources_and_apply(self):
+        transport = FakeTransport()
+        transport.route(r"http://a/search\?q=.*", RESULTS, regex=True)
+        sources = [make_source("http://a"), make_source("http://b")]
+        checks = [check async for check in check_sources(sources, attempts=1, transport=transport)]
+        self.assertEqual(summarize(checks).healthy, 1)
+        updated = {source.url: source for source in apply_checks(sources, checks)}
+        self.assertGreater(updated["http://a"].weight, 0)
+        self.assertEqual(updated["http://b"].weight, 0)
+        self.assertEqual(sources[0].weight, 0)
+
+    async def test_relative_search_urls_on_different_hosts_run_concurrently(self):
+        class Slow(Transport):
+            async def send(self, request, source=None):
+                await asyncio.sleep(0.1)
+                return Response(request.url, 200, {}, RESULTS.encode("utf-8"))
+
+        sources = [make_source(f"http://host{index}") for index in range(20)]
+        started = time.perf_counter()
+        checks = [check async for check in check_sources(sources, attempts=1, transport=Slow())]
+        self.assertEqual(sum(check.ok for check in checks), 20)
+        self.assertLess(time.perf_counter() - started, 0.5)
+
+
+class SourceCheckTest(unittest.TestCase):
+
+    def test_weight(self):
+        check = SourceCheck("http://s", "s", "书", attempts=2, successes=1, latencies=(2.0, 2.0))
+        self.assertEqual((check.response_time, check.weight(1000)), (2000, 25))
@@ -0,0 +1,58 @@
+import unittest
+
+from legado_parser.legado_entities import BookSourceEntity
+
+
+def source_dict() -> dict:
+    return {
+        "bookSourceUrl": "http://s",
+        "bookSourceName": "s",
+        "header": '{"User-Agent": "x"}',
+        "ruleSearch": {"bookList": "class.b", "name": "tag.a@text", "checkKeyWord": "我的"},
+        "ruleToc": {"chapterList": "tag.li", "chapterName": "tag.a@text"},
+        "customKey": [1, 2],
+    }
+
+
+class EntityTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        data = source_dict()
+        self.assertEqual(BookSourceEntity(data).to_dict(), data)
+
+    def test_lazy_rules_do_not_follow_input_mutation(self):
+        data = source_dict()
+        source = BookSourceEntity(data)
+        data["ruleSearch"]["name"] = "tag.b@text"
+        self.assertEqual(source.rule_search.name, "tag.a@text")
+
+    def test_assigning_a_rule_field_drops_the_fingerprint(self):
+        source = BookSourceEntity(source_dict())
+        rule = source.rule_search
+        fingerprint = rule.fingerprint()
+        self.assertEqual(BookSourceEntity(source_dict()).rule_search.fingerprint(), fingerprint)
+        rule.name = "tag.b@text"
+        self.assertNotEqual(rule.fingerprint(), fingerprint)
+        rule.name = "tag.a@text"
+        self.assertEqual(rule.fingerprint(), fingerprint)
+
+    def test_copy_does_not_share_rule_entities(self):
+        source = BookSourceEntity(source_dict())
+        fingerprint = source.rule_search.fingerprint()
+        clone = source.copy()
+        clone.rule_search.name = "tag.b@text"
+        clone.rule_toc.name = "tag.b@text"
+        self.assertEqual(source.rule_search.name, "tag.a@text")
+        self.assertEqual(source.rule_toc.name, "tag.a@text")
+        self.assertEqual(source.rule_search.fingerprint(), fingerprint)
+        self.assertNotEqual(clone.rule_search.fingerprint(), fingerprint)
+
+    def test_with_overrides(self):
+        source = BookSourceEntity(source_dict())
+        clone = source.with_overrides(header="{}", weight=5)
+        self.assertEqual((source.header, source.weight), ('{"User-Agent": "x"}', 0))
+        self.assertEqual((clone.header, clone.weight), ("{}", 5))
+        with self.assertRaises(TypeError):
+            source.with_overrides(rule_search=None)
+        with self.assertRaises(TypeError):
+            source.with_overrides(unknown=1)
@@ -0,0 +1,76 @@
+import unittest
+
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_explore import ExplorePager, get_explore_index, parse_explore_kinds
+from legado_parser.legado_http import FakeTransport
+from legado_parser.rule_js import quickjs
+
+RESULTS = ('<div class="b"><a href="/book/1">一</a></div>'
+           '<div class="b"><a href="/book/2">二</a></div>')
+
+
+def make_source(explore_url: str = "") -> BookSourceEntity:
+    return BookSourceEntity({"bookSourceUrl": "http://s", "bookSourceName": "s", "exploreUrl": explore_url,
+                             "ruleExplore": {"bookList": "class.b", "name": "tag.a@text", "bookUrl": "tag.a@href"}})
+
+
+class ExploreKindsTest(unittest.TestCase):
+
+    def test_plain_kinds(self):
+        index = parse_explore_kinds("分组::\n玄幻::/x/{{page}}&&都市::/y/<1,2>&&玄幻::/z")
+        self.assertEqual([(kind.title, kind.url) for kind in index],
+                         [("分组", ""), ("玄幻", "/x/{{page}}"), ("都市", "/y/<1,2>"), ("玄幻", "/z")])
+        self.assertEqual(list(index.by_title), ["玄幻", "都市"])
+        self.assertEqual(index.by_title["玄幻"].url, "/x/{{page}}")
+
+    def test_json_kinds(self):
+        index = parse_explore_kinds('[{"title": "榜单", "url": "/top", "style": {"layout_flexBasisPercent": 0.25}},'
+                                    ' {"title": "标题"}, {"url": "/none"}]')
+        self.assertEqual([(kind.title, kind.url) for kind in index], [("榜单", "/top"), ("标题", "")])
+        self.assertEqual(index.kinds[0].style, (("layout_flexBasisPercent", "0.25"),))
+
+    def test_cached_index_is_read_only(self):
+        index = parse_explore_kinds("玄幻::/x")
+        with self.assertRaises(TypeError):
+            index.by_title["都市"] = index.kinds[0]
+        self.assertIs(parse_explore_kinds("玄幻::/x"), index)
+
+    @unittest.skipUnless(quickjs, "未安装 quickjs")
+    def test_script_kinds(self):
+        index = get_explore_index(make_source('@js:[{"title": "玄幻", "url": baseUrl + "/x"}]'))
+        self.assertEqual([(kind.title, kind.url) for kind in index], [("玄幻", "http://s/x")])
+
+
+class ExplorePagerTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_pages_until_empty(self):
+        transport = FakeTransport()
+        transport.route("http://s/x/1", RESULTS)
+        transport.route("http://s/x/2", RESULTS)
+        transport.route("http://s/x/3", "<div></div>")
+        kind = parse_explore_kinds("玄幻::/x/{{page}}").by_title["玄幻"]
+        async with ExplorePager(make_source(), kind, transport=transport) as pager:
+            pages = [[book.name for book in books] async for books in pager.pages()]
+        self.assertEqual(pages, [["一", "二"], ["一", "二"]])
+        self.assertEqual([request.url for request in transport.requests[:3]],
+                         ["http://s/x/1", "http://s/x/2", "http://s/x/3"])
+        self.assertEqual(transport.requests[0].kind, "explore")
+
+    async def test_single_page_kind_is_not_prefetched(self):
+        transport = FakeTransport()
+        transport.route("http://s/top", RESULTS)
+        kind = parse_explore_kinds("榜单::/top").by_title["榜单"]
+        async with ExplorePager(make_source(), kind, transport=transport) as pager:
+            pages = [books async for books in pager.pages()]
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(len(transport.requests), 1)
+
+    async def test_page_list_ends_after_last_option(self):
+        transport = FakeTransport()
+        transport.route("http://s/y/a", RESULTS)
+        transport.route("http://s/y/b", RESULTS)
+        kind = parse_explore_kinds("都市::/y/<a,b>").by_title["都市"]
+        async with ExplorePager(make_source(), kind, transport=transport) as pager:
+            pages = [books async for books in pager.pages()]
+        self.assertEqual(len(pages), 2)
+        self.assertEqual([request.url for request in transport.requests], ["http://s/y/a", "http://s/y/b"])
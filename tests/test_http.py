@@ -0,0 +1,92 @@
+import gzip
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from legado_parser.legado_http import HttpError, PooledTransport, Request
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        if self.path == "/close":
+            # 不发送 Connection: close 直接断开，客户端会把连接当作空闲连接保留
+            self._reply(b"closed")
+            self.close_connection = True
+        elif self.path == "/gzip":
+            self._reply(gzip.compress("正文".encode("utf-8")), "gzip")
+        elif self.path == "/broken":
+            self._reply(b"not gzip", "gzip")
+        else:
+            self._reply(self.path.encode("ascii"))
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.do_GET()
+
+    def _reply(self, content: bytes, encoding: str = "") -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class PooledTransportTest(unittest.IsolatedAsyncioTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    async def asyncSetUp(self):
+        self.transport = PooledTransport(workers=2)
+
+    async def asyncTearDown(self):
+        await self.transport.close()
+
+    async def test_gzip_and_connection_reuse(self):
+        for __ in range(2):
+            response = await self.transport.send(Request(self.base + "/gzip"))
+            self.assertEqual(response.text, "正文")
+        self.assertEqual(self.transport.connections_opened, 1)
+
+    async def test_unicode_path_is_percent_encoded(self):
+        response = await self.transport.send(Request(self.base + "/搜索?q=书"))
+        self.assertEqual(response.text, "/%E6%90%9C%E7%B4%A2?q=%E4%B9%A6")
+
+    async def test_errors_are_http_errors(self):
+        with self.assertRaises(HttpError):
+            await self.transport.send(Request(self.base + "/broken"))
+        with self.assertRaises(HttpError):
+            await self.transport.send(Request(self.base + "/", headers={"X-Name": "书源"}))
+        with self.assertRaises(HttpError):
+            await self.transport.send(Request(self.base + "/", "POST", body="书", charset="ascii"))
+
+    async def test_stale_connection_is_retried_only_for_idempotent_methods(self):
+        await self.transport.send(Request(self.base + "/close"))
+        response = await self.transport.send(Request(self.base + "/get"))
+        self.assertEqual((response.text, self.transport.connections_opened), ("/get", 2))
+
+        await self.transport.send(Request(self.base + "/close"))
+        with self.assertRaises(HttpError):
+            await self.transport.send(Request(self.base + "/post", "POST", body="k=1"))
+        # 第二次 /close 复用了第二条连接，POST 失败后不再打开新连接
+        self.assertEqual(self.transport.connections_opened, 2)
+
+    async def test_malformed_addresses_are_http_errors(self):
+        for url in ("http://127.0.0.1:port/", "http://127.0.0.1:99999/", "http://[::1/", "ftp://s/"):
+            with self.assertRaises(HttpError, msg=url):
+                await self.transport.send(Request(url))
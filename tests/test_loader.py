@@ -0,0 +1,92 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_loader import SourceLoadError, dump_sources, iter_source_dicts, load_sources
+
+SOURCES = [
+    {"bookSourceUrl": "http://a", "bookSourceName": "甲", "bookSourceGroup": "小说，精选", "enabled": True},
+    {"bookSourceUrl": "http://b", "bookSourceName": "乙", "bookSourceGroup": "漫画", "enabled": False,
+     "bookSourceType": 2},
+    {"bookSourceUrl": "http://c", "bookSourceName": "丙 \"引号\" ]}", "bookSourceGroup": "精选;音频",
+     "bookSourceType": 1, "ruleSearch": {"bookList": "class.b", "name": "tag.a@text"}},
+]
+TEXT = json.dumps(SOURCES, ensure_ascii=False, indent=1)
+
+
+class Trickle(io.StringIO):
+    """每次最多返回 size 个字符，模拟按块到达的输入"""
+
+    def __init__(self, text: str, size: int) -> None:
+        super().__init__(text)
+        self.size = size
+
+    def read(self, size: int = -1) -> str:
+        return super().read(self.size)
+
+
+def urls(sources):
+    return [source.url for source in sources]
+
+
+class LoadSourcesTest(unittest.TestCase):
+
+    def test_chunk_boundaries(self):
+        for size in (1, 2, 3, 7, 64):
+            self.assertEqual(list(iter_source_dicts(Trickle(TEXT, size))), SOURCES, size)
+        self.assertEqual(list(iter_source_dicts(Trickle(json.dumps(SOURCES[2]), 5))), [SOURCES[2]])
+        self.assertEqual(list(iter_source_dicts(Trickle(" [ ] ", 1))), [])
+
+    def test_bom(self):
+        data = b"\xef\xbb\xbf" + TEXT.encode("utf-8")
+        self.assertEqual(urls(load_sources(io.BytesIO(data))), ["http://a", "http://b", "http://c"])
+        self.assertEqual(urls(load_sources(Trickle("\ufeff" + TEXT, 3))), ["http://a", "http://b", "http://c"])
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sources.json")
+            with open(path, "wb") as stream:
+                stream.write(data)
+            self.assertEqual(len(list(load_sources(path))), 3)
+
+    def test_binary_stream_stays_open(self):
+        stream = io.BytesIO(TEXT.encode("utf-8"))
+        self.assertEqual(len(list(load_sources(stream))), 3)
+        self.assertFalse(stream.closed)
+
+    def test_filters(self):
+        self.assertEqual(urls(load_sources(io.StringIO(TEXT), enabled=True)), ["http://a", "http://c"])
+        self.assertEqual(urls(load_sources(io.StringIO(TEXT), group="精选")), ["http://a", "http://c"])
+        self.assertEqual(urls(load_sources(io.StringIO(TEXT), source_type=2)), ["http://b"])
+        self.assertEqual(urls(load_sources(io.StringIO(TEXT), source_type={0, 1})), ["http://a", "http://c"])
+        self.assertEqual(urls(load_sources(io.StringIO(TEXT), predicate=lambda source: "ruleSearch" in source)),
+                         ["http://c"])
+
+    def test_malformed_input(self):
+        for text in ("", "1", "[1]", "[{}, 2]", '[{"a": 1} {"b": 2}]', '[{"a": 1}', '[{"a": }]', '{"a": 1} x',
+                     "[{}] ]"):
+            with self.assertRaises(SourceLoadError, msg=text):
+                list(iter_source_dicts(Trickle(text, 2)))
+        with self.assertRaises(SourceLoadError):
+            list(load_sources(io.StringIO('[{"bookSourceUrl": "http://a", "ruleSearch": "class.b"}]')))
+        with self.assertRaises(SourceLoadError):
+            list(load_sources(io.BytesIO(b'[{"bookSourceName": "\xff"}]')))
+
+    def test_sources_before_an_error_are_yielded(self):
+        loaded = []
+        with self.assertRaises(SourceLoadError):
+            for source in iter_source_dicts(io.StringIO('[{"a": 1}, {"b": 2}, oops]')):
+                loaded.append(source)
+        self.assertEqual(loaded, [{"a": 1}, {"b": 2}])
+
+
+class DumpSourcesTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        stream = io.StringIO()
+        self.assertEqual(dump_sources((BookSourceEntity(source) for source in SOURCES), stream, indent=2), 3)
+        self.assertEqual(json.loads(stream.getvalue()), SOURCES)
+        empty = io.StringIO()
+        self.assertEqual(dump_sources([], empty), 0)
+        self.assertEqual(list(iter_source_dicts(io.StringIO(empty.getvalue()))), [])
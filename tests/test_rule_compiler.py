@@ -0,0 +1,78 @@
+import unittest
+
+from legado_parser.rule_compiler import RuleCache, build_rule, compile_rule, get_rule_cache
+
+
+class RuleCacheTest(unittest.TestCase):
+
+    def test_hits_and_misses(self):
+        cache = RuleCache(maxsize=4)
+        first = cache.get("tag.a@text")
+        self.assertIs(cache.get("tag.a@text"), first)
+        self.assertIsNot(cache.get("tag.a@text", contentIsJson=True), first)
+        self.assertIsNot(cache.get("tag.a@text", hasEndRule=True), first)
+        self.assertEqual(cache.info(), {"hits": 1, "misses": 3, "loaded": 0, "size": 3, "maxsize": 4})
+        self.assertEqual(first, build_rule("tag.a@text"))
+
+    def test_least_recently_used_is_evicted(self):
+        cache = RuleCache(maxsize=2)
+        a, __ = cache.get("a"), cache.get("b")
+        self.assertIs(cache.get("a"), a)
+        cache.get("c")
+        self.assertEqual(len(cache), 2)
+        self.assertIs(cache.get("a"), a)
+        misses = cache.misses
+        cache.get("b")
+        self.assertEqual(cache.misses, misses + 1)
+
+    def test_resize_and_clear(self):
+        cache = RuleCache(maxsize=3)
+        rules = [cache.get(text) for text in ("a", "b", "c")]
+        cache.get("a")
+        cache.resize(1)
+        self.assertEqual((len(cache), cache.maxsize), (1, 1))
+        self.assertIs(cache.get("a"), rules[0])
+        cache.clear()
+        self.assertEqual(cache.info(), {"hits": 0, "misses": 0, "loaded": 0, "size": 0, "maxsize": 1})
+        with self.assertRaises(ValueError):
+            cache.resize(-1)
+        with self.assertRaises(ValueError):
+            RuleCache(-1)
+
+    def test_zero_size_disables_caching(self):
+        cache = RuleCache(maxsize=0)
+        self.assertIsNot(cache.get("a"), cache.get("a"))
+        self.assertEqual((len(cache), cache.misses), (0, 2))
+
+    def test_loaders(self):
+        stored = {("a", False, False): build_rule("a")}
+        calls = []
+
+        def loader(text, hasEndRule, contentIsJson):
+            calls.append(text)
+            return stored.get((text, hasEndRule, contentIsJson))
+
+        cache = RuleCache()
+        cache.add_loader(loader)
+        self.assertIs(cache.get("a"), stored["a", False, False])
+        self.assertIs(cache.get("a"), stored["a", False, False])
+        self.assertEqual(cache.get("b"), build_rule("b"))
+        self.assertEqual(calls, ["a", "b"])
+        self.assertEqual((cache.hits, cache.misses, cache.loaded), (1, 2, 1))
+
+        cache.remove_loader(loader)
+        cache.remove_loader(loader)
+        cache.clear()
+        cache.get("a")
+        self.assertEqual((calls, cache.loaded), (["a", "b"], 0))
+
+    def test_first_loader_with_the_rule_wins(self):
+        cache = RuleCache()
+        found = build_rule("a")
+        cache.add_loader(lambda *key: None)
+        cache.add_loader(lambda *key: found)
+        cache.add_loader(lambda *key: self.fail("不应查询后续来源"))
+        self.assertIs(cache.get("a"), found)
+
+    def test_process_cache(self):
+        self.assertIs(compile_rule("tag.li@tag.a@text"), get_rule_cache().get("tag.li@tag.a@text"))
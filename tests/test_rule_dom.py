@@ -0,0 +1,63 @@
+import unittest
+
+from legado_parser.rule_analyzer import AnalyzeRule
+from legado_parser.rule_dom import matches, parse_html, select
+
+HTML = '''<html><body><div id="list" class="box main"><ul>
+<li class="odd"><a href="/b/1" title="t1">一</a><span>甲</span></li>
+<li class="even"><a href="/b/2">二</a><span>乙</span></li>
+<li class="odd"><a href="/b/3">三</a></li>
+</ul><p>段落<b>粗</b>尾</p><p>第二段</p></div><script>var x=1;</script></body></html>'''
+
+
+class DefaultRuleTest(unittest.TestCase):
+
+    def setUp(self):
+        self.analyzer = AnalyzeRule(HTML, "http://s/page/")
+
+    def assertStrings(self, rule, expected):
+        self.assertEqual(self.analyzer.get_string_list(rule), expected, rule)
+
+    def test_selectors(self):
+        self.assertStrings("class.odd@tag.a@text", ["一", "三"])
+        self.assertStrings("@@tag.a@text", ["一", "二", "三"])
+        self.assertStrings("text.二@href", ["/b/2"])
+        self.assertStrings("id.list@tag.p@text", ["段落粗尾", "第二段"])
+
+    def test_indexes(self):
+        self.assertStrings("tag.li.1@tag.a@text", ["二"])
+        self.assertStrings("tag.li.-1@tag.a@href", ["/b/3"])
+        self.assertStrings("tag.li!0@tag.a@text", ["二", "三"])
+        self.assertStrings("tag.li[0:1]@tag.a@text", ["一", "二"])
+        self.assertStrings("tag.li[-1,0]@tag.a@text", ["三", "一"])
+
+    def test_text_functions(self):
+        self.assertStrings("id.list@tag.p.0@ownText", ["段落尾"])
+        self.assertStrings("id.list@tag.p.0@textNodes", ["段落\n尾"])
+        self.assertStrings("class.even@html", ['<li class="even"><a href="/b/2">二</a><span>乙</span></li>'])
+        self.assertEqual(self.analyzer.get_string("tag.a.0@href", is_url=True), "http://s/b/1")
+
+    def test_combinators(self):
+        self.assertStrings("tag.li@tag.a@text&&tag.li@tag.span@text", ["一", "二", "三", "甲", "乙"])
+        self.assertStrings("tag.x@text||tag.span@text", ["甲", "乙"])
+        self.assertStrings("tag.li@tag.a@text%%tag.li@tag.span@text", ["一", "甲", "二", "乙", "三"])
+
+    def test_replacement(self):
+        self.assertStrings("tag.a@text##一|二##X", ["X", "X", "三"])
+        self.assertStrings("tag.a.0@text##(.)##[$1]###", ["[一]"])
+
+    def test_css(self):
+        self.assertStrings("@css:li.odd > a@text", ["一", "三"])
+        self.assertStrings("@css:#list li:nth-child(2) a@href", ["/b/2"])
+        self.assertStrings("@css:a[title]@title", ["t1"])
+
+
+class DomTest(unittest.TestCase):
+
+    def test_select_and_matches(self):
+        document = parse_html(HTML)
+        found = select(document.root, "div.box.main > ul > li:first-child, p + p")
+        self.assertEqual([element.tag for element in found], ["li", "p"])
+        self.assertTrue(matches(found[0], "li.odd"))
+        self.assertFalse(matches(found[0], "li.even"))
+        self.assertEqual([element.text() for element in document.by_class("odd")], ["一甲", "三"])
@@ -0,0 +1,88 @@
+import threading
+import unittest
+
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_http import FakeTransport
+from legado_parser.rule_analyzer import AnalyzeRule
+from legado_parser.rule_js import JsContext, JsError, JsPool, call_rules, may_run_js, quickjs
+
+
+class AjaxTest(unittest.IsolatedAsyncioTestCase):
+
+    def test_may_run_js(self):
+        self.assertTrue(may_run_js("tag.a@text", "@js:java.ajax(baseUrl)"))
+        self.assertTrue(may_run_js("<js>result</js>", None))
+        self.assertTrue(may_run_js("{{java.md5Encode(key)}}"))
+        self.assertFalse(may_run_js("tag.a@text", None, True, ""))
+        self.assertFalse(may_run_js("/search?q={{key}}&page={{page-1}}", "{{$.name}}", "{{@@tag.a@text}}"))
+
+    async def test_ajax_is_refused_on_the_loop_thread(self):
+        with self.assertRaises(JsError):
+            JsContext._java_ajax("http://s/")
+
+    async def test_call_rules_moves_js_rules_off_the_loop_thread(self):
+        loop_thread = threading.get_ident()
+        self.assertNotEqual(await call_rules(True, threading.get_ident), loop_thread)
+        self.assertEqual(await call_rules(False, threading.get_ident), loop_thread)
+
+    async def test_ajax_uses_the_flow_transport_and_source(self):
+        transport = FakeTransport()
+        transport.route("http://s/api", "data")
+        sources = []
+        send = transport.send
+
+        async def record(request, source=None):
+            sources.append(source)
+            return await send(request, source)
+
+        transport.send = record
+        source = BookSourceEntity({"bookSourceUrl": "http://s", "bookSourceName": "s"})
+        text = await call_rules(True, JsContext._java_ajax, "http://s/api", transport=transport, source=source)
+        self.assertEqual(text, "data")
+        self.assertEqual([request.url for request in transport.requests], ["http://s/api"])
+        self.assertEqual(sources, [source])
+
+
+@unittest.skipUnless(quickjs, "未安装 quickjs")
+class JsContextTest(unittest.TestCase):
+
+    def test_expressions_statements_and_bindings(self):
+        context = JsContext()
+        self.assertEqual(context.run("result + 1", {"result": 1}), 2)
+        self.assertEqual(context.run("var a = [result, 'b']; a.join('-')", {"result": "a"}), "a-b")
+        self.assertIsNone(context.run("undefined", {}))
+        # 上一次执行的绑定与 var 声明不会留到下一次
+        self.assertEqual(context.run("typeof a + typeof result", {}), "undefinedundefined")
+
+    def test_java_put_and_get(self):
+        analyzer = AnalyzeRule("<a>一</a>", "http://s/", {})
+        context = JsContext()
+        self.assertEqual(context.run("java.put('k', 'v'); java.get('k')", {}, analyzer), "v")
+        self.assertEqual(analyzer.variables["k"], "v")
+        self.assertEqual(context.run("java.getString('tag.a@text')", {}, analyzer, analyzer.content), "一")
+
+    def test_time_limit(self):
+        context = JsContext(time_limit=0.1)
+        with self.assertRaises(JsError):
+            context.run("while (true) {}", {})
+        self.assertTrue(context.broken)
+
+    def test_memory_limit(self):
+        context = JsContext(memory_limit=4 * 1024 * 1024)
+        with self.assertRaises(JsError):
+            context.run("var a = []; while (true) { a.push(new Array(1000).fill('x')); }", {})
+        self.assertTrue(context.broken)
+
+    def test_pool_reuses_contexts(self):
+        pool = JsPool(size=2)
+        self.assertEqual(pool.evaluate("1 + 1"), 2)
+        self.assertEqual(pool.evaluate("key", {"key": "k"}), "k")
+        self.assertEqual((pool.created, pool.idle()), (1, 1))
+
+    def test_pool_replaces_broken_contexts(self):
+        pool = JsPool(size=1, time_limit=0.1)
+        with self.assertRaises(JsError):
+            pool.evaluate("while (true) {}")
+        self.assertEqual(pool.created, 0)
+        self.assertEqual(pool.evaluate("2"), 2)
+        self.assertEqual(pool.created, 1)
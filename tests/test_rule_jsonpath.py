@@ -0,0 +1,53 @@
+import json
+import unittest
+
+from legado_parser.rule_analyzer import AnalyzeRule
+from legado_parser.rule_jsonpath import JsonPathError, compile_path, read_json
+
+DATA = {"data": {"list": [{"name": "一", "author": "甲", "n": 3, "tags": ["a", "b"]},
+                          {"name": "二", "author": "乙", "n": 10},
+                          {"name": "三", "n": 7, "info": {"author": "丙"}}]},
+        "total": 3}
+
+
+class JsonPathTest(unittest.TestCase):
+
+    def assertPath(self, path, expected):
+        self.assertEqual(read_json(DATA, path), expected, path)
+
+    def test_paths(self):
+        self.assertPath("$.data.list[*].name", ["一", "二", "三"])
+        self.assertPath("$..author", ["甲", "乙", "丙"])
+        self.assertPath("$['total']", [3])
+        self.assertPath("$.data.list.length()", [3])
+        self.assertPath("$.missing", [])
+
+    def test_indexes_and_slices(self):
+        self.assertPath("$.data.list[-1].name", ["三"])
+        self.assertPath("$.data.list[0:2].name", ["一", "二"])
+        self.assertPath("$.data.list[0,2].name", ["一", "三"])
+
+    def test_filters(self):
+        self.assertPath("$.data.list[?(@.n > 5)].name", ["二", "三"])
+        self.assertPath("$.data.list[?(@.author == '乙')].name", ["二"])
+        self.assertPath("$.data.list[?(@.tags)].name", ["一"])
+        self.assertPath("$.data.list[?(@.name =~ /[一二]/)].n", [3, 10])
+
+    def test_compiled_once_and_errors(self):
+        self.assertIs(compile_path("$.data.list[*].name"), compile_path("$.data.list[*].name"))
+        for path in ("$.a[", "$.a[?(@.b >)]"):
+            with self.assertRaises(JsonPathError):
+                compile_path(path)
+
+
+class JsonRuleTest(unittest.TestCase):
+
+    def test_rules_on_json_content(self):
+        analyzer = AnalyzeRule(json.dumps(DATA, ensure_ascii=False), "http://s/")
+        self.assertEqual(analyzer.get_string_list("$.data.list[*].name&&$..author"),
+                         ["一", "二", "三", "甲", "乙", "丙"])
+        self.assertEqual(analyzer.get_string("@json:$.total"), "3")
+        self.assertEqual(analyzer.get_string("{{$.total}}本"), "3本")
+        self.assertEqual(analyzer.get_string("$.data.list[0].name##一##壹"), "壹")
+        items = analyzer.get_elements("$.data.list[*]")
+        self.assertEqual([analyzer.get_string("$.name", item) for item in items], ["一", "二", "三"])
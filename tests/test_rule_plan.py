@@ -0,0 +1,73 @@
+import json
+import unittest
+
+from legado_parser.rule_analyzer import AnalyzeRule
+from legado_parser.rule_js import quickjs
+from legado_parser.rule_plan import compile_plan
+
+HTML = '''<ul>
+<li class="b"><a href="/b/1">一</a><p class="info"><span>甲</span><span>x1</span></p></li>
+<li class="b"><a href="/b/2">二</a><p class="info"><span>乙</span></p></li>
+<li class="b"><a href="/b/3">三</a></li>
+</ul>'''
+DATA = json.dumps({"list": [{"name": "一", "id": 1, "author": "甲", "tags": ["a", "b"]},
+                            {"name": "二", "id": 2, "tags": []},
+                            {"name": "三", "id": 3, "author": "丙"}]}, ensure_ascii=False)
+
+# (内容, 列表规则, 字段规则)，字段规则以 * 开头时为地址
+CASES = [
+    (HTML, "class.b", ["tag.a@text", "*tag.a@href", "class.info@tag.span.0@text", "class.info@tag.span@text",
+                       "tag.a@text##一|二##X", "tag.a@text##(.)##[$1]###", "tag.a@text&&tag.span@text",
+                       "tag.x@text||class.info@tag.span.-1@text", "tag.a@text%%tag.span@text", "@css:a@href",
+                       "*@css:p.info > span@text", "tag.span.1@text##\\d", "$1"]),
+    (HTML, "class.b", ["tag.a@text@put:{n:tag.span.0@text}", "@get:{n}", "第@get:{n}章", "tag.a@text"]),
+    (HTML, "@css:li.b", ["@css:a@text", "a@text", "//a/@href"]),
+    (DATA, "$.list[*]", ["$.name", "$.author", "*/b/{$.id}", "$.tags[*]", "$.name##一##壹", "$.author&&$.name",
+                         "$.none||$.id", "{{$.id}}号", "@json:$.tags[0]%%$.tags[1]"]),
+    (DATA, "$.list[*]", ["$.name@put:{a:$.author}", "@get:{a}", "{{$.name}}-@get:{a}"]),
+]
+
+JS_CASES = [
+    (HTML, "class.b", ["tag.a@text@js:result + '!'", "{{java.getString('tag.a@href')}}", "<js>result</js>##/b/",
+                       "*tag.a@href<js>result + '?p=1'</js>"]),
+    (DATA, "$.list[*]", ["{{'#' + result}}", "$.id@js:result * 2", "$.name@put:{a:$.id}", "{{java.get('a')}}"]),
+]
+
+
+def fields(rules):
+    return tuple((rule.lstrip("*"), rule.startswith("*")) for rule in rules)
+
+
+def expected_records(content, list_rule, field_rules):
+    """逐条目逐字段调用 AnalyzeRule 的结果，变量表在条目之间共享"""
+    analyzer = AnalyzeRule(content, "http://s/list/")
+    return [tuple(analyzer.get_string(rule, item, is_url) for rule, is_url in field_rules)
+            for item in analyzer.get_elements(list_rule)]
+
+
+class PlanEquivalenceTest(unittest.TestCase):
+
+    def assertSameAsAnalyzer(self, cases):
+        for content, list_rule, rules in cases:
+            plan = compile_plan(list_rule, fields(rules))
+            actual = plan.extract(AnalyzeRule(content, "http://s/list/"))
+            self.assertEqual(actual, expected_records(content, list_rule, fields(rules)), (list_rule, rules))
+
+    def test_html_and_json(self):
+        self.assertSameAsAnalyzer(CASES)
+
+    @unittest.skipUnless(quickjs, "未安装 quickjs")
+    def test_js(self):
+        self.assertSameAsAnalyzer(JS_CASES)
+
+    def test_required_fields_skip_items(self):
+        plan = compile_plan("class.b", fields(["tag.a@text", "class.info@tag.span.0@text"]), (1,))
+        self.assertEqual(plan.extract(AnalyzeRule(HTML, "http://s/")), [("一", "甲"), ("二", "乙")])
+
+    def test_forked_variables_stay_per_item(self):
+        plan = compile_plan("class.b", fields(["tag.a@text@put:{n:tag.span.0@text}", "@get:{n}"]))
+        variables = {"n": "外"}
+        records = plan.extract_with_variables(AnalyzeRule(HTML, "http://s/", variables))
+        self.assertEqual([values for values, __ in records], [("一", "甲"), ("二", "乙"), ("三", "")])
+        self.assertEqual([item for __, item in records], [{"n": "甲"}, {"n": "乙"}, {"n": ""}])
+        self.assertEqual(variables, {"n": "外"})
@@ -0,0 +1,92 @@
+import json
+import unittest
+
+from legado_parser.rule_analyzer import AnalyzeRule
+from legado_parser.rule_compiler import build_rule, clear_rule_cache, get_rule_cache
+from legado_parser.rule_program import (Format, Get, GroupRef, Join, Js, JsonPath, Literal, Pipeline, Program,
+                                        ProgramError, Put, Regex, Replace, Selector, XPath, compile_program,
+                                        node_from_data)
+
+PROGRAMS = [
+    ('class.a@text', Selector('class.a@text')),
+    ('@css:li > a@href', Selector('li > a@href', True)),
+    ('@@tag.a@text', Selector('tag.a@text')),
+    ('$.data[*].name', JsonPath('$.data[*].name')),
+    ('@json:name', JsonPath('name')),
+    ('//li/a/text()', XPath('//li/a/text()')),
+    ('@XPath://a/@href', XPath('//a/@href')),
+    (':(\\d+)', Regex('(\\d+)')),
+    ('tag.a@text&&tag.b@text||tag.c', Join('&&', (Selector('tag.a@text'), Join('||', (Selector('tag.b@text'),
+                                                                                     Selector('tag.c')))))),
+    ('tag.a@text##\\s+##-###', Pipeline((Selector('tag.a@text'), Replace('\\s+', '-', True)))),
+    ('##广告', Replace('广告')),
+    ('tag.a@text@put:{k:tag.b@text}', Pipeline((Put((('k', Selector('tag.b@text')),)), Selector('tag.a@text')))),
+    ('第@get:{k}章$1', Format((Literal('第'), Get('k'), Literal('章'), GroupRef(1)))),
+    ('{{$.a}}-{{@@tag.b@text}}-{{page + 1}}', Format((JsonPath('$.a'), Literal('-'), Selector('tag.b@text'),
+                                                      Literal('-'), Js('page + 1')))),
+    ('book/{$.id}.html', Format((Literal('book/'), JsonPath('$.id'), Literal('.html')))),
+    ('tag.a@text<js>result.trim()</js>##a', Pipeline((Selector('tag.a@text'), Js('result.trim()'), Replace('a')))),
+    ('@js:result', Js('result')),
+    # 无法解析出变量的 @put 与阅读一样整体移除
+    ('@put:{x}tag.a', Selector('tag.a')),
+]
+
+HTML = '<div><a href="/b/1">一</a><b>甲</b></div><div><a href="/b/2">二</a></div>'
+DATA = json.dumps({"list": [{"name": "一", "id": 1}, {"name": "二", "id": 2}], "total": 2}, ensure_ascii=False)
+RULES = [
+    (HTML, 'tag.a@text'), (HTML, '-tag.a@href'), (HTML, 'tag.a@text&&tag.b@text'), (HTML, 'tag.a@text%%tag.b@text'),
+    (HTML, 'tag.x@text||tag.b@text'), (HTML, 'tag.a@text##一##壹'), (HTML, 'tag.a.0@text@put:{k:tag.b@text}'),
+    (HTML, '@css:div > a@href'), (HTML, '//a/text()'), (DATA, '$.list[*].name'), (DATA, '{{$.total}}本'),
+    (DATA, '/book/{$.list[0].id}'), (DATA, '$.list[*].id&&$.total'), (HTML, 'tag.a.0@text##(.)##[$1]'),
+]
+
+
+class CompileProgramTest(unittest.TestCase):
+
+    def test_nodes(self):
+        for text, root in PROGRAMS:
+            self.assertEqual(compile_program(text).root, root, text)
+
+    def test_reverse_and_content_is_json(self):
+        program = compile_program('-name')
+        self.assertEqual((program.reverse, program.root), (True, Selector('name')))
+        self.assertEqual(compile_program('name', True).root, JsonPath('name'))
+        self.assertEqual(compile_program('{{@@tag.a}}', True).root, Format((Selector('tag.a'),)))
+
+    def test_walk(self):
+        program = compile_program('tag.a@text@put:{k:tag.b@text}##x')
+        self.assertEqual([type(node).__name__ for node in program.walk()],
+                         ['Pipeline', 'Put', 'Selector', 'Selector', 'Replace'])
+
+    def test_data_round_trip(self):
+        for text, __ in PROGRAMS:
+            for content_is_json in (False, True):
+                program = compile_program(text, content_is_json)
+                data = json.loads(json.dumps(program.to_data(), ensure_ascii=False))
+                self.assertEqual(Program.from_data(data), program, text)
+
+    def test_unknown_node(self):
+        with self.assertRaises(ProgramError):
+            node_from_data({"node": "Nope"})
+
+
+class RestoredProgramTest(unittest.TestCase):
+
+    def tearDown(self):
+        clear_rule_cache()
+
+    def test_restored_programs_evaluate_like_compiled_ones(self):
+        expected = [AnalyzeRule(content, "http://s/").get_string_list(rule) for content, rule in RULES]
+        clear_rule_cache()
+        for content, rule in RULES:
+            for content_is_json in (False, True):
+                compiled = build_rule(rule, False, content_is_json)
+                program = Program.from_data(json.loads(json.dumps(compiled.program.to_data())))
+                get_rule_cache().put(compiled.__class__(compiled.text, compiled.tokens, compiled.types,
+                                                        compiled.group_types, False, content_is_json, program))
+        actual = [AnalyzeRule(content, "http://s/").get_string_list(rule) for content, rule in RULES]
+        self.assertEqual(actual, expected)
+        self.assertEqual(get_rule_cache().misses, 0)
+        self.assertEqual(expected[0], ["一", "二"])
+        self.assertEqual(expected[1], ["/b/2", "/b/1"])
+        self.assertEqual(expected[11], ["/book/1"])
@@ -0,0 +1,93 @@
+import re
+import time
+import unittest
+from unittest import mock
+
+from legado_parser import rule_regex
+from legado_parser.rule_regex import (clear_timed_out_patterns, compile_chain, compile_replace, is_risky,
+                                      replace_all, timed_out_patterns, translate_pattern, translate_replacement)
+
+# 在 40 个 a 之后遇到 b 时需要回溯 2^40 次
+CATASTROPHIC = r"(a+)+$"
+SLOW_TEXT = "a" * 40 + "b"
+
+
+class TranslateTest(unittest.TestCase):
+
+    def test_java_named_groups(self):
+        self.assertEqual(translate_pattern(r"(?<n>\d+)\k<n>"), r"(?P<n>\d+)(?P=n)")
+        self.assertEqual(translate_pattern(r"(?<=a)(?<!b)"), r"(?<=a)(?<!b)")
+
+    def test_java_replacement(self):
+        self.assertEqual(translate_replacement("$1-$2"), r"\g<1>-\g<2>")
+        self.assertEqual(compile_replace(r"(\d)(\d)", "$2$1").apply("12"), "21")
+
+
+class ReplaceTest(unittest.TestCase):
+
+    def test_global_and_first_only(self):
+        self.assertEqual(compile_replace(r"\s+", " ").apply("a  b\n c"), "a b c")
+        self.assertEqual(compile_replace(r"(\d+)", "[$1]", True).apply("a1b22"), "[1]")
+        self.assertEqual(compile_replace(r"\d", "x", True).apply("ab"), "")
+
+    def test_invalid_regex_is_literal(self):
+        self.assertEqual(compile_replace("(", "[").apply("a(b("), "a[b[")
+
+    def test_chain_applies_rules_in_sequence(self):
+        self.assertEqual(replace_all("abd", [("ab", "c"), ("cd", "X")]), "X")
+        self.assertEqual(replace_all("abc", [("b", ""), ("abc", "Z")]), "ac")
+        chain = compile_chain(((r"广告", "", False), (r"\n{2,}", "\n", False), (r"^\s+", "", False)))
+        self.assertEqual(chain.apply("  正文广告\n\n\n下一段"), "正文\n下一段")
+
+
+class RiskyTest(unittest.TestCase):
+
+    def test_nested_unbounded_repeats(self):
+        for pattern in (r"(a+)+", r"(\w+\s?)*", r"(.*)*", r"(?:\d+)*x", r"((a+))+", r"(x{1,})+", r"(?<n>a+)+"):
+            self.assertTrue(is_risky(pattern), pattern)
+
+    def test_safe_patterns(self):
+        for pattern in (r"(\s*\n)+", r"(?:a|b)+", r"a{2,}", r"(a{1,3})+", r"[(]+", r"\((a+)\)", r"(?=a+)+",
+                        r"(?>a+)+", r"x("):
+            self.assertFalse(is_risky(pattern), pattern)
+
+
+class TimeoutTest(unittest.TestCase):
+
+    def setUp(self):
+        clear_timed_out_patterns()
+
+    def assertTimesOut(self, rule):
+        started = time.perf_counter()
+        self.assertEqual(rule.apply(SLOW_TEXT, 0.3), "" if rule.first_only else SLOW_TEXT)
+        self.assertLess(time.perf_counter() - started, 2.5)
+
+    @unittest.skipUnless(rule_regex._regex, "未安装 regex")
+    def test_regex_module_timeout(self):
+        with self.assertLogs("legado_parser.rule_regex", "WARNING"):
+            self.assertTimesOut(compile_replace(CATASTROPHIC, "x"))
+        self.assertEqual(timed_out_patterns(), {CATASTROPHIC: 1})
+
+    def test_sandbox_without_regex_module(self):
+        with mock.patch.object(rule_regex, "_regex", None), self.assertLogs("legado_parser.rule_regex", "WARNING"):
+            rule = compile_replace(CATASTROPHIC, "[$1]")
+            self.assertTrue(rule.risky)
+            self.assertEqual(rule.apply("xaaa"), "x[aaa]")
+            self.assertEqual(compile_replace(CATASTROPHIC, "$1", True).apply("aab"), "")
+            self.assertTimesOut(rule)
+            self.assertTimesOut(compile_replace(CATASTROPHIC, "$1", True))
+            # 子进程被结束后重新创建
+            self.assertEqual(rule.apply("aa"), "[aa]")
+            with self.assertRaises(re.error):
+                compile_replace(CATASTROPHIC, "$2").apply("aa")
+        self.assertEqual(timed_out_patterns(), {CATASTROPHIC: 2})
+
+    def test_skipped_when_no_sandbox_can_start(self):
+        with mock.patch.object(rule_regex, "_regex", None), \
+                mock.patch.object(rule_regex, "_idle_sandboxes", []), \
+                mock.patch.object(rule_regex, "_Sandbox", side_effect=OSError("不允许创建子进程")), \
+                self.assertLogs("legado_parser.rule_regex", "WARNING") as logs:
+            self.assertEqual(compile_replace(CATASTROPHIC, "x").apply("aa"), "aa")
+            self.assertEqual(compile_replace(r"a+", "x").apply("aa"), "x")
+        self.assertIn("已跳过", logs.output[0])
+        self.assertEqual(timed_out_patterns(), {CATASTROPHIC: 1})
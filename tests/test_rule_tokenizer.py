@@ -0,0 +1,95 @@
+import unittest
+
+from legado_parser.rule_compiler import compile_rule
+from legado_parser.rule_tokenizer import (TokenizerError, split_page, split_rule, tokenizer, tokenizer_inner,
+                                          tokenizer_program, tokenizer_url)
+from legado_parser.rule_type import RuleType
+
+
+# 与改写前的实现逐项比对得到的分词结果
+RULES = [
+    ('class.odd.0@tag.a.0@text', ['class.odd.0', '@', 'tag.a.0', '@', 'text']),
+    ('@css:div.info > a@href', ['@css:', 'div.info > a', '@', 'href']),
+    ('$.data.list[*].name', ['$.data.list[*].name']),
+    ("//div[@class='x']/a/@href", ["//div[@class='x']/a/", '@', 'href']),
+    ('tag.a@text##\\s+## ', ['tag.a', '@', 'text', '##']),
+    ('class.c@html##{{abc', ['class.c', '@', 'html', '##']),
+    ('{{$.a}}-{{@@class.b@text}}', ['{{', '-{{@@class.b@text}}-', '{{', '{{$.a}}-{{@@class.b@text}}']),
+    ('<js>result + 1</js>', ['<js>']),
+    ('@js:java.ajax(baseUrl)', ['@js:']),
+    ('tag.a@text&&tag.b@text', ['tag.a', '@', 'text', '&&', 'tag.b', '@', 'text']),
+    ('tag.a@text||tag.b@text', ['tag.a', '@', 'text', '||', 'tag.b', '@', 'text']),
+    ('tag.li%%tag.dd', ['tag.li', '%%', 'tag.dd']),
+    ('text.下一页@href', ['text.下一页', '@', 'href']),
+    ('@put:{a:tag.a@text}', ['@put:{', '@put:{a:tag.a@text}']),
+    ('@get:{a}', ['@get:{', '@get:{a}']),
+    ('tag.a[-1]@href', ['tag.a[-1]', '@', 'href']),
+    ('class.item!0:2@text', ['class.item!0:2', '@', 'text']),
+    ('$..author', ['$..author']),
+    ('@XPath://a/text()', ['@', 'XPath://a/text()']),
+    ('@json:$.a', ['@json:', '$.a']),
+    ('id.text@textNodes', ['id.text', '@', 'textNodes']),
+    ('', []),
+]
+
+URLS = [
+    ('http://a/s?q={{key}}&p={{page}},{"method":"POST"}', ['http://a/s?q=', '{{', '&p=', '{{', ',{"method":"POST"}']),
+    ('/list/<1,2,3>/{{page}}', ['/list/', '<', '/', '{{']),
+    ('<js>x</js>', ['<js>']),
+]
+
+INNER = [
+    ('{{a}}b{{c}}', ['{{', 'b', '{{']),
+    ('x<1,2,3>y', ['x<1,2,3>y']),
+]
+
+PAGES = [
+    ('1,2,{{page}}', ['1', '2', '{']),
+]
+
+T = RuleType
+PROGRAMS = [
+    ('-class.a@text', [(T.Order, '-'), (T.DefaultOrEnd, 'class.a@text')]),
+    (':(\\d+)章', [(T.RuleSymbol, ':'), (T.Regex, '(\\d+)章')]),
+    ('@css:li > a@text&&$.b', [(T.RuleSymbol, '@css:'), (T.DefaultOrEnd, 'li > a@text'), (T.JoinSymbol, '&&'),
+                               (T.DefaultOrEnd, '$.b')]),
+    ('$.a||$.b', [(T.Json, '$.a'), (T.JoinSymbol, '||'), (T.Json, '$.b')]),
+    ('//a/@href', [(T.Xpath, '//a/@href')]),
+    ('tag.a@text##(.)##[$1]###', [(T.DefaultOrEnd, 'tag.a@text'), (T.RuleSymbol, '##'), (T.Regex, '(.)'),
+                                  (T.RuleSymbol, '##'), (T.Regex, '[$1]'), (T.RuleSymbol, '##'), (T.Regex, '#')]),
+    ('tag.a@put:{k:tag.b@text}@text', [(T.Put, '{k:tag.b@text}'), (T.DefaultOrEnd, 'tag.a@text')]),
+    ('{{$.a}}-@get:{k}$1', [(T.Inner, '$.a'), (T.Format, '-'), (T.Get, 'k'), (T.Regex, '1')]),
+    ('a{$.b}c', [(T.Format, 'a'), (T.JsonInner, '$.b'), (T.Format, 'c')]),
+    ('tag.a@text<js>result.trim()</js>##a', [(T.DefaultOrEnd, 'tag.a@text'), (T.Js, 'result.trim()'),
+                                             (T.RuleSymbol, '##'), (T.Regex, 'a')]),
+    ('x(a&&b)&&y', [(T.DefaultOrEnd, 'x(a&&b)'), (T.JoinSymbol, '&&'), (T.DefaultOrEnd, 'y')]),
+]
+
+
+class TokenizerTest(unittest.TestCase):
+
+    def test_matches_previous_output(self):
+        for cases, function in ((RULES, tokenizer), (URLS, tokenizer_url), (INNER, tokenizer_inner),
+                                (PAGES, split_page)):
+            for text, expected in cases:
+                self.assertEqual(function(text), expected, text)
+
+    def test_unterminated_expression(self):
+        with self.assertRaises(TokenizerError):
+            tokenizer("{{abc")
+
+    def test_compiled_rule_is_shared(self):
+        rule = compile_rule("class.odd.0@tag.a.0@text")
+        self.assertIs(compile_rule("class.odd.0@tag.a.0@text"), rule)
+        self.assertEqual(rule.tokens, tuple(tokenizer("class.odd.0@tag.a.0@text")))
+        self.assertEqual(len(rule.types), len(rule.tokens))
+        self.assertIsInstance(rule.types[0], RuleType)
+
+    def test_program_tokens(self):
+        for text, expected in PROGRAMS:
+            self.assertEqual(tokenizer_program(text), expected, text)
+        self.assertEqual(tokenizer_program("name", True), [(T.Json, "name")])
+
+    def test_split_rule(self):
+        self.assertEqual(split_rule("a&&b||c&&(d&&e)", ("&&", "||")), ("&&", ["a", "b||c", "(d&&e)"]))
+        self.assertEqual(split_rule("a\\&&b", ("&&",)), (None, ["a\\&&b"]))
@@ -0,0 +1,43 @@
+import json
+import unittest
+
+from legado_parser.rule_url import render_url
+
+
+class RenderUrlTest(unittest.TestCase):
+
+    def test_key_and_page_in_url(self):
+        request = render_url("/search?q={{key}}&p={{page}}&n=<1,2,3>", "我的", 2, "http://s/")
+        self.assertEqual((request.url, request.method), ("http://s/search?q=%E6%88%91%E7%9A%84&p=2&n=2", "GET"))
+        self.assertEqual(render_url("/list/{{(page-1)*20}}", page=3, base_url="http://s").url, "http://s/list/40")
+
+    def test_charset_option(self):
+        request = render_url('/s?q={{key}},{"charset": "gbk"}', "我", base_url="http://s")
+        self.assertEqual((request.url, request.charset), ("http://s/s?q=%CE%D2", "gbk"))
+        request = render_url('/s?q={{key}},{"charset": "escape"}', "我 a", base_url="http://s")
+        self.assertEqual((request.url, request.charset), ("http://s/s?q=%u6211%20a", None))
+
+    def test_reserved_characters_in_key_are_encoded(self):
+        request = render_url("/search/{{key}}?q={{key}}", "AC/DC&a=1?#", base_url="http://s")
+        self.assertEqual(request.url, "http://s/search/AC%2FDC%26a%3D1%3F%23?q=AC%2FDC%26a%3D1%3F%23")
+        request = render_url('/s?q={{key}},{"charset": "gbk"}', "我/你", base_url="http://s")
+        self.assertEqual(request.url, "http://s/s?q=%CE%D2%2F%C4%E3")
+        request = render_url('/s,{"method": "post", "body": "q={{key}}"}', "a/b+c", base_url="http://s")
+        self.assertEqual(request.body, "q=a%2Fb%2Bc")
+
+    def test_form_body_is_encoded(self):
+        request = render_url('/s,{"method": "post", "body": "q={{key}}&p={{page}}"}', "我", 1, "http://s")
+        self.assertEqual((request.method, request.body), ("POST", "q=%E6%88%91&p=1"))
+
+    def test_json_body_is_not_encoded(self):
+        request = render_url('/s,{"body": {"q": "{{key}}", "p": "{{page}}"}}', '我"', 1, "http://s")
+        self.assertEqual(json.loads(request.body), {"q": '我"', "p": "1"})
+        request = render_url('/s,{"body": "{\\"q\\": \\"{{key}}\\"}"}', "我", base_url="http://s")
+        self.assertEqual(json.loads(request.body), {"q": "我"})
+
+    def test_header_values_are_ascii(self):
+        request = render_url('/s,{"headers": {"Referer": "http://s/{{key}}", "X-Name": "书源"}}', "我",
+                             base_url="http://s")
+        self.assertEqual(request.headers, {"Referer": "http://s/%E6%88%91", "X-Name": "%E4%B9%A6%E6%BA%90"})
+        for value in request.headers.values():
+            value.encode("latin-1")
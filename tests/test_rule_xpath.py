@@ -0,0 +1,57 @@
+import unittest
+
+from legado_parser.rule_analyzer import AnalyzeRule
+from legado_parser.rule_dom import parse_html
+from legado_parser.rule_xpath import XPathError, compile_xpath, select_xpath
+
+HTML = '''<html><body><div id="list" class="box main"><ul>
+<li class="odd"><a href="/b/1" title="t1">一</a><span>甲</span></li>
+<li class="even"><a href="/b/2">二</a><span>乙</span></li>
+<li class="odd"><a href="/b/3">三</a></li>
+</ul><p>段落<b>粗</b>尾</p></div></body></html>'''
+
+
+class XPathTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.root = parse_html(HTML).root
+
+    def assertXPath(self, expression, expected):
+        self.assertEqual(select_xpath(self.root, expression), expected, expression)
+
+    def test_paths_and_predicates(self):
+        self.assertXPath("//li/a/text()", ["一", "二", "三"])
+        self.assertXPath("//li[@class='odd']/a/@href", ["/b/1", "/b/3"])
+        self.assertXPath("//li[2]/span/text()", ["乙"])
+        self.assertXPath("//li[last()]/a/text()", ["三"])
+        self.assertXPath("//li[span]/a/text()", ["一", "二"])
+        self.assertXPath("//li[not(span)]/a/text()", ["三"])
+        self.assertXPath("//ul/li[position()<3]/a/@href", ["/b/1", "/b/2"])
+        self.assertXPath("//div[@id='list']//b/text()", ["粗"])
+        self.assertXPath("//*[@title]/@title", ["t1"])
+
+    def test_axes_unions_and_functions(self):
+        self.assertXPath("//li/following-sibling::li[1]/a/text()", ["二", "三"])
+        self.assertXPath("//a/text() | //span/text()", ["一", "甲", "二", "乙", "三"])
+        self.assertXPath("//a[contains(@href,'2')]/text()", ["二"])
+        self.assertXPath("//p/text()", ["段落", "尾"])
+        self.assertXPath("string(//p)", ["段落粗尾"])
+        self.assertXPath("count(//li)", ["3"])
+
+    def test_compiled_once_and_errors(self):
+        self.assertIs(compile_xpath("//li/a/text()"), compile_xpath("//li/a/text()"))
+        for expression in ("//li[", "//li/@"):
+            with self.assertRaises(XPathError):
+                compile_xpath(expression)
+
+
+class XPathRuleTest(unittest.TestCase):
+
+    def test_rules(self):
+        analyzer = AnalyzeRule(HTML, "http://s/")
+        self.assertEqual(analyzer.get_string_list("@XPath://li/a/text()"), ["一", "二", "三"])
+        self.assertEqual(analyzer.get_string_list("//li/a/text()##一##壹"), ["壹", "二", "三"])
+        self.assertEqual(analyzer.get_string("//li[2]/a/@href", is_url=True), "http://s/b/2")
+        items = analyzer.get_elements("//li")
+        self.assertEqual([analyzer.get_string("@XPath:./span/text()", item) for item in items], ["甲", "乙", ""])
@@ -0,0 +1,126 @@
+import asyncio
+import unittest
+
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_http import FakeTransport, HttpError, Response, Transport
+from legado_parser.legado_search import get_search_result, parse_search_result, parse_search_url, search
+from legado_parser.legado_variables import VariableRegistry
+
+
+def make_source(url: str = "http://s", **rules) -> BookSourceEntity:
+    rule_search = {"bookList": "class.b", "name": "tag.a@text", "bookUrl": "tag.a@href"}
+    rule_search.update(rules)
+    return BookSourceEntity({"bookSourceUrl": url, "bookSourceName": url,
+                             "searchUrl": "/search?q={{key}}", "ruleSearch": rule_search})
+
+
+RESULTS = ('<div class="b"><a href="/book/1">一</a><span>甲</span></div>'
+           '<div class="b"><a href="/book/2">二</a></div>')
+
+
+class ParseSearchTest(unittest.TestCase):
+
+    def test_book_list(self):
+        books = parse_search_result(make_source(), RESULTS, "http://s/search")
+        self.assertEqual([(book.name, book.book_url, book.origin) for book in books],
+                         [("一", "http://s/book/1", "http://s"), ("二", "http://s/book/2", "http://s")])
+
+    def test_put_is_scoped_to_each_book(self):
+        source = make_source(name="tag.a@text@put:{a:tag.span@text}", author="@get:{a}")
+        scope = VariableRegistry().source(source)
+        books = parse_search_result(source, RESULTS, "http://s/search", scope)
+        self.assertEqual([book.author for book in books], ["甲", ""])
+        self.assertNotIn("a", scope)
+        self.assertEqual(books[0].variables, {"a": "甲"})
+        book = VariableRegistry().book(source, books[0].book_url, books[0].variables)
+        self.assertEqual(book["a"], "甲")
+
+
+class SearchFlowTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_results_from_all_sources(self):
+        transport = FakeTransport()
+        transport.route(r"http://(a|b)/search\?q=.*", RESULTS, regex=True)
+        books = [book async for book in search("书", [make_source("http://a"), make_source("http://b")],
+                                               transport=transport)]
+        self.assertEqual(sorted((book.origin, book.name) for book in books),
+                         [("http://a", "一"), ("http://a", "二"), ("http://b", "一"), ("http://b", "二")])
+        self.assertEqual(transport.requests[0].kind, "search")
+
+    async def test_error_pages_are_not_parsed(self):
+        transport = FakeTransport()
+        transport.route(r"http://a/search\?q=.*", (404, RESULTS), regex=True)
+        transport.route(r"http://b/search\?q=.*", RESULTS, regex=True)
+        source = make_source("http://a")
+        with self.assertRaises(HttpError):
+            await get_search_result(source, parse_search_url(source, "书"), transport, retries=0)
+        books = [book async for book in search("书", [source, make_source("http://b")], transport=transport,
+                                               retries=0)]
+        self.assertEqual({book.origin for book in books}, {"http://b"})
+
+    async def test_temporary_failures_are_retried(self):
+        replies = iter([(503, ""), RESULTS])
+        transport = FakeTransport()
+        transport.route(r"http://a/search\?q=.*", lambda request: next(replies), regex=True)
+        source = make_source("http://a")
+        books = await get_search_result(source, parse_search_url(source, "书"), transport, backoff=0)
+        self.assertEqual(len(books), 2)
+        self.assertEqual(len(transport.requests), 2)
+
+
+class Counting(Transport):
+    """记录同时进行的请求数，每个请求耗时 delay 秒"""
+
+    def __init__(self, delay: float = 0.01) -> None:
+        self.delay = delay
+        self.active = {}
+        self.peak = {}
+        self.total_peak = 0
+
+    async def send(self, request, source=None):
+        host = request.url.split("/")[2]
+        self.active[host] = self.active.get(host, 0) + 1
+        self.peak[host] = max(self.peak.get(host, 0), self.active[host])
+        self.total_peak = max(self.total_peak, sum(self.active.values()))
+        await asyncio.sleep(self.delay)
+        self.active[host] -= 1
+        return Response(request.url, 200, {}, RESULTS.encode("utf-8"))
+
+
+class SearchPoolTest(unittest.IsolatedAsyncioTestCase):
+
+    async def test_sources_are_read_as_workers_free_up(self):
+        pulled = []
+
+        def sources():
+            for index in range(20):
+                pulled.append(index)
+                yield make_source(f"http://h{index}")
+
+        transport = Counting()
+        books = search("书", sources(), concurrency=3, transport=transport)
+        await anext(books)
+        self.assertLessEqual(len(pulled), 6)
+        rest = [book async for book in books]
+        self.assertEqual((len(rest), len(pulled), transport.total_peak), (39, 20, 3))
+
+    async def test_busy_host_does_not_hold_workers(self):
+        # 第二个工作协程暂存三个同域名的书源后原地等待，第三个工作协程处理其他域名
+        sources = [make_source(f"http://s/{index}") for index in range(5)] + [make_source("http://t")]
+        transport = Counting(0.05)
+        books = search("书", sources, concurrency=3, per_host=1, transport=transport)
+        first = [await anext(books) for __ in range(4)]
+        self.assertIn("http://t", {book.origin for book in first})
+        rest = [book async for book in books]
+        self.assertEqual((len(first) + len(rest), transport.peak["s"]), (12, 1))
+
+    async def test_limit_and_errors_while_reading_sources(self):
+        def sources():
+            yield make_source("http://a")
+            raise ValueError("书源文件格式错误")
+
+        with self.assertRaises(ValueError):
+            [book async for book in search("书", sources(), transport=Counting())]
+        books = [book async for book in search("书", [make_source(f"http://h{index}") for index in range(10)],
+                                               limit=3, transport=Counting())]
+        self.assertEqual(len(books), 3)
@@ -0,0 +1,87 @@
+import os
+import struct
+import tempfile
+import unittest
+
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_snapshot import SnapshotError, load_snapshot, save_snapshot
+from legado_parser.rule_analyzer import AnalyzeRule
+from legado_parser.rule_compiler import clear_rule_cache, rule_cache_info
+
+
+def make_source(url: str, name_rule: str) -> BookSourceEntity:
+    return BookSourceEntity({"bookSourceUrl": url, "bookSourceName": url,
+                             "ruleSearch": {"bookList": "class.b", "name": name_rule}})
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "sources.snap")
+
+    def test_round_trip_shares_rules(self):
+        sources = [make_source("http://a", "tag.a@text"), make_source("http://b", "tag.a@text")]
+        self.assertEqual(save_snapshot(sources, self.path), 2)
+        with load_snapshot(self.path) as snapshot:
+            self.assertEqual(len(snapshot), 2)
+            self.assertEqual(snapshot.rule_count, 2)
+            self.assertEqual([source.to_dict() for source in snapshot], [source.to_dict() for source in sources])
+            self.assertEqual(snapshot.rule(1).text, "tag.a@text")
+
+    def test_malformed_rule_is_stored_uncompiled(self):
+        sources = [make_source("http://a", "{{abc"), make_source("http://b", "tag.a@text")]
+        self.assertEqual(save_snapshot(sources, self.path), 2)
+        with load_snapshot(self.path) as snapshot:
+            self.assertEqual(snapshot[0].rule_search.name, "{{abc")
+            self.assertIsNone(snapshot.rule(1))
+            self.assertEqual(snapshot[1].rule_search.name, "tag.a@text")
+
+    def test_not_a_snapshot(self):
+        with open(self.path, "wb") as stream:
+            stream.write(b"x" * 64)
+        with self.assertRaises(SnapshotError):
+            load_snapshot(self.path)
+
+    def test_rules_are_loaded_lazily_for_html_and_json_content(self):
+        sources = [make_source("http://a", "$.name"), make_source("http://b", "tag.a@text")]
+        save_snapshot(sources, self.path)
+        clear_rule_cache()
+        self.addCleanup(clear_rule_cache)
+        with load_snapshot(self.path) as snapshot:
+            first = snapshot[0]
+            self.assertEqual(rule_cache_info()["size"], 0)
+            analyzer = AnalyzeRule('{"name": "一"}', "http://a/")
+            self.assertEqual(analyzer.get_string(first.rule_search.name), "一")
+            analyzer = AnalyzeRule('<a>二</a>', "http://a/")
+            self.assertEqual(analyzer.get_string(first.rule_search.name), "")
+            info = rule_cache_info()
+            self.assertEqual((info["loaded"], info["misses"], info["size"]), (2, 2, 2))
+            # 未访问过的书源的规则不会从快照中加载
+            AnalyzeRule('<a>二</a>', "http://b/").get_string("tag.a@text")
+            self.assertEqual(rule_cache_info()["loaded"], 2)
+        clear_rule_cache()
+        AnalyzeRule('{"name": "一"}', "http://a/").get_string("$.name")
+        self.assertEqual(rule_cache_info()["loaded"], 0)
+
+    def test_truncated_snapshot(self):
+        save_snapshot([make_source("http://a", "tag.a@text")], self.path)
+        with open(self.path, "rb") as stream:
+            data = stream.read()
+        for size in (10, len(data) - 4):
+            with open(self.path, "wb") as stream:
+                stream.write(data[:size])
+            with self.assertRaises(SnapshotError):
+                load_snapshot(self.path)
+
+    def test_corrupt_index(self):
+        save_snapshot([make_source("http://a", "tag.a@text")], self.path)
+        with load_snapshot(self.path) as snapshot:
+            source_index = snapshot._source_index
+        with open(self.path, "r+b") as stream:
+            stream.seek(source_index + 8)
+            stream.write(struct.pack("<Q", 2 ** 40))
+        with load_snapshot(self.path) as snapshot:
+            with self.assertRaises(SnapshotError):
+                snapshot[0]
@@ -0,0 +1,40 @@
+import os
+import tempfile
+import unittest
+
+from legado_parser.legado_entities import BookSourceEntity
+from legado_parser.legado_variables import VariableRegistry
+
+SOURCE = BookSourceEntity({"bookSourceUrl": "http://s", "bookSourceName": "s"})
+
+
+class VariableRegistryTest(unittest.TestCase):
+
+    def test_book_scope_reads_source_variables(self):
+        registry = VariableRegistry()
+        registry.source(SOURCE)["token"] = "t"
+        book = registry.book(SOURCE, "http://s/1")
+        book["page"] = "2"
+        self.assertEqual((book["token"], book.get("page")), ("t", "2"))
+        self.assertNotIn("page", registry.source(SOURCE))
+
+    def test_initial_values_only_fill_empty_books(self):
+        registry = VariableRegistry()
+        self.assertEqual(dict(registry.book(SOURCE, "http://s/1", {"a": "1"})), {"a": "1"})
+        self.assertEqual(dict(registry.book(SOURCE, "http://s/1", {"a": "2"})), {"a": "1"})
+
+    def test_no_eviction_without_database(self):
+        registry = VariableRegistry(max_books=1)
+        registry.book(SOURCE, "http://s/1")["a"] = "1"
+        registry.book(SOURCE, "http://s/2")
+        self.assertEqual(registry.book(SOURCE, "http://s/1")["a"], "1")
+
+    def test_evicted_books_are_reloaded_from_database(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        registry = VariableRegistry(os.path.join(directory.name, "variables.db"), max_books=1)
+        self.addCleanup(registry.close)
+        registry.book(SOURCE, "http://s/1")["a"] = "1"
+        registry.book(SOURCE, "http://s/2")
+        self.assertEqual(len(registry._books), 1)
+        self.assertEqual(registry.book(SOURCE, "http://s/1")["a"], "1")